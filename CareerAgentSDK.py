@@ -0,0 +1,323 @@
+import os
+import json
+import time
+import random
+import asyncio
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ====================================================================================================
+# Clients for the career agent API (APIServer / AsyncAPIServer). CareerAgentSDK keeps its connections
+# alive in a pooled requests.Session, and AsyncCareerAgentSDK does the same with an httpx.AsyncClient for
+# asyncio callers. Both time out requests and retry failures with exponential backoff (honouring
+# Retry-After), and can send many questions in a single /chat/batch request. A request that may already have
+# been acted on (the connection failed or timed out once it was sent, or a proxy answered 502/504) is only
+# retried when it is idempotent: GET and the other idempotent methods, and the POSTs that only ask questions.
+# A request that never reached the server, or that it rejected with 429/503, is retried whatever its method,
+# so generating a document or setting a job description is never done twice.
+#
+#   with CareerAgentSDK("http://localhost:8080") as sdk:
+#     answers = sdk.ask_questions("AlexWorden", ["Why this role?", "Biggest accomplishment?"])
+
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+# Responses that mean the server did not act on the request
+REJECTED_STATUS_CODES = (429, 503)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+class CareerAgentError(Exception):
+  def __init__(self, message: str, status_code: int = None):
+    super().__init__(message)
+    self.status_code = status_code
+
+# Seconds to wait before retry number attempt (starting at 1), preferring the server's Retry-After
+def retry_delay(attempt: int, backoff_seconds: float, max_backoff_seconds: float, retry_after: str = None) -> float:
+  if retry_after:
+    try:
+      return min(max_backoff_seconds, float(retry_after))
+    except ValueError:
+      pass
+  delay = min(max_backoff_seconds, backoff_seconds * (2 ** (attempt - 1)))
+  # Jitter spreads out the retries of clients that failed at the same time
+  return delay * (0.5 + random.random() / 2)
+
+def is_idempotent(method: str, idempotent: bool = None) -> bool:
+  return idempotent if idempotent != None else method.upper() in IDEMPOTENT_METHODS
+
+def should_retry_status(status_code: int, idempotent: bool) -> bool:
+  return status_code in (RETRY_STATUS_CODES if idempotent else REJECTED_STATUS_CODES)
+
+# Whether a requests exception was raised before the request was sent (the connection could not be made)
+def is_connect_failure(error) -> bool:
+  from urllib3.exceptions import NewConnectionError
+  if isinstance(error, requests.ConnectTimeout):
+    return True
+  reason = getattr(error.args[0], "reason", None) if error.args else None
+  return isinstance(reason, NewConnectionError)
+
+# Parse Server-Sent Events lines into (event, data) pairs
+def parse_events(lines):
+  event = "message"
+  data_lines = []
+  for line in lines:
+    if line == None:
+      continue
+    if line == "":
+      if data_lines:
+        yield event, json.loads("\n".join(data_lines))
+      event = "message"
+      data_lines = []
+    elif line.startswith("event:"):
+      event = line[len("event:"):].strip()
+    elif line.startswith("data:"):
+      data_lines.append(line[len("data:"):].strip())
+
+def token_from_event(event: str, data):
+  if event == "error":
+    raise CareerAgentError("Server error while answering: " + data.get("error", ""))
+  return data.get("token", "")
+
+# The body of a /chat request. With a session_id the server answers with, and adds the question to, that
+# visitor session's chat history; without one the question is answered on its own.
+def chat_body(subject_id: str, message_text: str, session_id: str = None, stream: bool = False):
+  body = {'subject_id': subject_id, 'message_text': message_text}
+  if stream:
+    body['stream'] = True
+  if session_id != None:
+    body['session_id'] = session_id
+  return body
+
+# ====================================================================================================
+
+class CareerAgentSDK:
+
+  def __init__(self, career_agent_url = "http://localhost:8080", connect_timeout_seconds: float = 5, read_timeout_seconds: float = 120,
+               max_retries: int = 3, backoff_seconds: float = 0.5, max_backoff_seconds: float = 10, pool_size: int = 16):
+    self.career_agent_url = career_agent_url.rstrip("/")
+    self.timeout = (connect_timeout_seconds, read_timeout_seconds)
+    self.max_retries = max_retries
+    self.backoff_seconds = backoff_seconds
+    self.max_backoff_seconds = max_backoff_seconds
+    # One keep-alive connection pool for every call (and thread) of this client
+    self.session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    self.session.mount("http://", adapter)
+    self.session.mount("https://", adapter)
+
+  def close(self):
+    self.session.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  # ====================================================================================================
+
+  # idempotent tells whether the request may be sent again after it reached the server (by default, whether
+  # the method is idempotent)
+  def request(self, method: str, path: str, expected_status = (200,), idempotent: bool = None, **kwargs) -> requests.Response:
+    idempotent = is_idempotent(method, idempotent)
+    for attempt in range(self.max_retries + 1):
+      try:
+        response = self.session.request(method, self.career_agent_url + path, timeout=self.timeout, **kwargs)
+      except (requests.ConnectionError, requests.Timeout) as e:
+        if (attempt == self.max_retries or not (idempotent or is_connect_failure(e))):
+          raise CareerAgentError("Unable to reach the career agent: " + str(e))
+        time.sleep(retry_delay(attempt + 1, self.backoff_seconds, self.max_backoff_seconds))
+        continue
+      if response.status_code in expected_status:
+        return response
+      if (should_retry_status(response.status_code, idempotent) and attempt < self.max_retries):
+        response.close()
+        time.sleep(retry_delay(attempt + 1, self.backoff_seconds, self.max_backoff_seconds, response.headers.get("Retry-After")))
+        continue
+      raise CareerAgentError(method + " " + path + " failed with status " + str(response.status_code) + ": " + response.text[:200], response.status_code)
+
+  # ====================================================================================================
+
+  def ask_question(self, subject_id: str, question: str) -> str:
+    return self.request("POST", "/chat", idempotent = True, json = {'subject_id': subject_id, 'message_text': question}).text
+
+  # Asks the question with a streaming response. on_token is called with each token as it arrives and the
+  # full answer is returned once the stream has finished. With a session_id the question is part of that
+  # visitor session's conversation (see chat_body).
+  def ask_conversational_question(self, subject_id: str, userInput: str, on_token = None, session_id: str = None) -> str:
+    response = self.request("POST", "/chat", idempotent = session_id == None, json = chat_body(subject_id, userInput, session_id, stream=True),
+      headers = {'Accept': 'text/event-stream'}, stream = True)
+    tokens = []
+    with response:
+      for event, data in parse_events(response.iter_lines(decode_unicode=True)):
+        if event == "done":
+          break
+        token = token_from_event(event, data)
+        tokens.append(token)
+        if on_token != None:
+          on_token(token)
+    return "".join(tokens)
+
+  # Asks many questions in one request; the server answers them concurrently. Returns a result per question,
+  # in order, each with either an "answer" or an "error".
+  def ask_questions(self, subject_id: str, questions):
+    return self.request("POST", "/chat/batch", idempotent = True, json = {'subject_id': subject_id, 'questions': list(questions)}).json()["results"]
+
+  # Sets the job the subject is applying for. The server starts preparing the cover letter right away.
+  def set_job_description(self, subject_id: str, job_desc: str, job_title: str, company_name: str):
+    return self.request("POST", "/job_description", expected_status = (202,),
+      json = {'subject_id': subject_id, 'job_desc': job_desc, 'job_title': job_title, 'company_name': company_name}).json()
+
+  # Asks the server to generate a "coverletter" or "resume" for the subject's current job and render it to the
+  # given formats. Returns the job handle, which get_document_job polls.
+  def create_document(self, subject_id: str, document_type: str, formats = ["pdf"]):
+    return self.request("POST", "/documents", expected_status = (202,),
+      json = {'subject_id': subject_id, 'document_type': document_type, 'formats': formats}).json()
+
+  def get_document_job(self, job_id: str):
+    return self.request("GET", "/documents/" + job_id).json()
+
+  def wait_for_document(self, job_id: str, poll_seconds: float = 1.0, timeout_seconds: float = 600):
+    deadline = time.monotonic() + timeout_seconds
+    while True:
+      job = self.get_document_job(job_id)
+      if job["status"] in ("done", "failed"):
+        return job
+      if time.monotonic() > deadline:
+        raise CareerAgentError("Timed out waiting for document job " + job_id)
+      time.sleep(poll_seconds)
+
+  # Saves a rendered document into output_folder and returns its path
+  def download_document(self, job_id: str, format: str, output_folder: str) -> str:
+    job = self.get_document_job(job_id)
+    response = self.request("GET", "/documents/" + job_id + "/" + format, stream = True)
+    output_folder = os.path.expanduser(output_folder)
+    os.makedirs(output_folder, exist_ok = True)
+    output_filename = os.path.join(output_folder, os.path.basename(job["outputs"][format]))
+    with response, open(output_filename, "wb") as f:
+      for chunk in response.iter_content(chunk_size = 65536):
+        f.write(chunk)
+    return output_filename
+
+  # The (question, answer) turns the server sends with the next question of the visitor session
+  def get_chat_history(self, subject_id: str, session_id: str = None):
+    params = {'session_id': session_id} if session_id != None else {}
+    return [tuple(turn) for turn in self.request("GET", "/chat_history/" + subject_id, params = params).json()["chat_history"]]
+
+# ====================================================================================================
+# The asyncio client. Requires httpx.
+
+class AsyncCareerAgentSDK:
+
+  def __init__(self, career_agent_url = "http://localhost:8080", connect_timeout_seconds: float = 5, read_timeout_seconds: float = 120,
+               max_retries: int = 3, backoff_seconds: float = 0.5, max_backoff_seconds: float = 10, pool_size: int = 16):
+    import httpx
+    self.career_agent_url = career_agent_url.rstrip("/")
+    self.max_retries = max_retries
+    self.backoff_seconds = backoff_seconds
+    self.max_backoff_seconds = max_backoff_seconds
+    self.client = httpx.AsyncClient(base_url=self.career_agent_url,
+      timeout=httpx.Timeout(read_timeout_seconds, connect=connect_timeout_seconds),
+      limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+
+  async def close(self):
+    await self.client.aclose()
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *exc_info):
+    await self.close()
+
+  # ====================================================================================================
+
+  # Sends the request (streamed if stream is True, in which case the caller must close the response)
+  async def request(self, method: str, path: str, expected_status = (200,), stream: bool = False, idempotent: bool = None, **kwargs):
+    import httpx
+    idempotent = is_idempotent(method, idempotent)
+    for attempt in range(self.max_retries + 1):
+      try:
+        response = await self.client.send(self.client.build_request(method, path, **kwargs), stream=stream)
+      except httpx.TransportError as e:
+        if (attempt == self.max_retries or not (idempotent or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)))):
+          raise CareerAgentError("Unable to reach the career agent: " + str(e))
+        await asyncio.sleep(retry_delay(attempt + 1, self.backoff_seconds, self.max_backoff_seconds))
+        continue
+      if response.status_code in expected_status:
+        return response
+      if stream:
+        await response.aread()
+        await response.aclose()
+      if (should_retry_status(response.status_code, idempotent) and attempt < self.max_retries):
+        await asyncio.sleep(retry_delay(attempt + 1, self.backoff_seconds, self.max_backoff_seconds, response.headers.get("Retry-After")))
+        continue
+      raise CareerAgentError(method + " " + path + " failed with status " + str(response.status_code) + ": " + response.text[:200], response.status_code)
+
+  # ====================================================================================================
+
+  async def ask_question(self, subject_id: str, question: str) -> str:
+    return (await self.request("POST", "/chat", idempotent = True, json = {'subject_id': subject_id, 'message_text': question})).text
+
+  async def ask_conversational_question(self, subject_id: str, userInput: str, on_token = None, session_id: str = None) -> str:
+    response = await self.request("POST", "/chat", stream = True, idempotent = session_id == None, json = chat_body(subject_id, userInput, session_id, stream=True),
+      headers = {'Accept': 'text/event-stream'})
+    tokens = []
+    try:
+      lines = []
+      async for line in response.aiter_lines():
+        lines.append(line)
+        if line != "":
+          continue
+        for event, data in parse_events(lines):
+          if event == "done":
+            return "".join(tokens)
+          token = token_from_event(event, data)
+          tokens.append(token)
+          if on_token != None:
+            on_token(token)
+        lines = []
+    finally:
+      await response.aclose()
+    return "".join(tokens)
+
+  async def ask_questions(self, subject_id: str, questions):
+    return (await self.request("POST", "/chat/batch", idempotent = True, json = {'subject_id': subject_id, 'questions': list(questions)})).json()["results"]
+
+  async def set_job_description(self, subject_id: str, job_desc: str, job_title: str, company_name: str):
+    return (await self.request("POST", "/job_description", expected_status = (202,),
+      json = {'subject_id': subject_id, 'job_desc': job_desc, 'job_title': job_title, 'company_name': company_name})).json()
+
+  async def create_document(self, subject_id: str, document_type: str, formats = ["pdf"]):
+    return (await self.request("POST", "/documents", expected_status = (202,),
+      json = {'subject_id': subject_id, 'document_type': document_type, 'formats': formats})).json()
+
+  async def get_document_job(self, job_id: str):
+    return (await self.request("GET", "/documents/" + job_id)).json()
+
+  async def wait_for_document(self, job_id: str, poll_seconds: float = 1.0, timeout_seconds: float = 600):
+    deadline = time.monotonic() + timeout_seconds
+    while True:
+      job = await self.get_document_job(job_id)
+      if job["status"] in ("done", "failed"):
+        return job
+      if time.monotonic() > deadline:
+        raise CareerAgentError("Timed out waiting for document job " + job_id)
+      await asyncio.sleep(poll_seconds)
+
+  # Each chunk is written on a worker thread so that disk writes do not block the event loop
+  async def download_document(self, job_id: str, format: str, output_folder: str) -> str:
+    job = await self.get_document_job(job_id)
+    response = await self.request("GET", "/documents/" + job_id + "/" + format, stream = True)
+    output_folder = os.path.expanduser(output_folder)
+    os.makedirs(output_folder, exist_ok = True)
+    output_filename = os.path.join(output_folder, os.path.basename(job["outputs"][format]))
+    try:
+      with open(output_filename, "wb") as f:
+        async for chunk in response.aiter_bytes(chunk_size = 65536):
+          await asyncio.to_thread(f.write, chunk)
+    finally:
+      await response.aclose()
+    return output_filename
+
+  async def get_chat_history(self, subject_id: str, session_id: str = None):
+    params = {'session_id': session_id} if session_id != None else {}
+    return [tuple(turn) for turn in (await self.request("GET", "/chat_history/" + subject_id, params = params)).json()["chat_history"]]
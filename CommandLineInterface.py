@@ -1,6 +1,7 @@
 import os
 import app.SubjectContext as SubjectContext
 import app.CareerAgentService as CareerAgentService
+import app.DocumentRenderer as DocumentRenderer
 
 import cli_constants
 
@@ -8,7 +9,10 @@ class CommandLineInterface:
 
   def __init__(self):
     self.GENERATED_DOCS_FOLDER = getattr(cli_constants, "GENERATED_DOCS_FOLDER", "~/Documents/GeneratedCoverLetters")
+    self.DOCUMENT_FORMATS = getattr(cli_constants, "DOCUMENT_FORMATS", ["pdf"])
     self.svc = CareerAgentService.CareerAgentService()
+    # Documents are rendered in the background, so the prompt comes back while the files are written
+    self.renderer = DocumentRenderer.DocumentRenderer(self.GENERATED_DOCS_FOLDER)
 
   # ====================================================================================================
 
@@ -19,21 +23,16 @@ class CommandLineInterface:
 
   # ====================================================================================================
 
-  def create_pdf(self, text: str, subject_ctx: SubjectContext, document_type):
-    output_folder = self.GENERATED_DOCS_FOLDER
-    #Generate a PDF of the cover letter and save to a file named with the company name and job title
-    from fpdf import FPDF
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.multi_cell(0, 5, text)
-    # write the pdf to the output folder
-    output_folder = os.path.expanduser(output_folder)
-    if not os.path.exists(output_folder):
-      os.makedirs(output_folder)
-    output_filename = output_folder + "/" + subject_ctx.company_name + "_" + subject_ctx.job_title + "_" + document_type + ".pdf"
-    pdf.output(output_filename)
-    print("Saved cover letter to " + output_filename + "\n")
+  # Save the document, named with the company name and job title, in each of the DOCUMENT_FORMATS
+  def save_document(self, text: str, subject_ctx: SubjectContext, document_type):
+    name = subject_ctx.company_name + "_" + subject_ctx.job_title + "_" + document_type
+    self.renderer.submit(text, name, self.DOCUMENT_FORMATS, on_done=self.print_saved_document)
+
+  def print_saved_document(self, job: DocumentRenderer.RenderJob):
+    for format, path in job.outputs.items():
+      print("Saved " + format + " to " + path)
+    for format, error in job.errors.items():
+      print("Unable to save " + format + ": " + error)
 
   # ====================================================================================================
 
@@ -51,11 +50,9 @@ class CommandLineInterface:
     job_title = input("Enter the job title: ")
     company_name = input("Enter the company name: ")
 
-    subject_context = self.svc.get_subject_context(subject_id)
-    subject_context.job_desc = job_desc
-    subject_context.job_title = job_title
-    subject_context.company_name = company_name
-    self.svc.save_subject_context(subject_context)
+    # Starts preparing the cover letter in the background, so 'CL' only has to wait for what is left of it
+    self.svc.set_job_description(subject_id, job_desc, job_title, company_name)
+    print("Preparing the cover letter for " + job_title + " at " + company_name + " in the background...")
 
   def start(self):
     
@@ -79,7 +76,7 @@ class CommandLineInterface:
         print("Generating resume for " + subject_context.applicant_name + " for the position of " + subject_context.job_title + " at " + subject_context.company_name + "...\n")
         resume = self.svc.generate_resume(subject_context.id)
         print(resume + "\n")
-        self.create_pdf(resume, subject_context, "resume")
+        self.save_document(resume, subject_context, "resume")
       elif userInput in ['CL']:
         # If company_name and job_title are not set, ask the user to set them
         if (subject_context.company_name == None or subject_context.job_title == None):
@@ -88,7 +85,7 @@ class CommandLineInterface:
         print("Generating cover letter for " + subject_context.applicant_name + " for the position of " + subject_context.job_title + " at " + subject_context.company_name + "...\n")
         cover_letter = self.svc.generate_cover_letter(subject_context.id)
         print(cover_letter + "\n")
-        self.create_pdf(cover_letter, subject_context, "coverletter")
+        self.save_document(cover_letter, subject_context, "coverletter")
       elif userInput in ['Refresh'] :
         self.svc.initialize_subject(subject_context.id, True)
       elif userInput in ['Help']:
@@ -111,4 +108,6 @@ class CommandLineInterface:
 
   # END OF CLASS ResumeBuilder ====================================================================================================
 
-CommandLineInterface().start()
+# Guarded so that the worker processes spawned to parse documents (see DocumentIngestion) do not start the CLI
+if __name__ == "__main__":
+  CommandLineInterface().start()
@@ -1,30 +1,14 @@
 import os
-import requests
 import app.SubjectContext as SubjectContext
+from CareerAgentSDK import CareerAgentSDK
 
 import cli_constants
 
-class CareerAgentSDK:
-
-  def __init__(self, career_agent_url = "http://localhost:8080"):
-    self.career_agent_url = career_agent_url
-
-  def ask_conversational_question(self, subject_id: str, userInput: str) -> str:
-    response = requests.post(self.career_agent_url + "/chat", data = {'subject_id': subject_id, 'message_text': userInput})
-    if response.status_code != 200:
-      raise Exception("Failed to get response from server")
-    return response.text
-  
-  def get_chat_history(self, subject_id: str):
-    # TODO: Implement this
-    return []
-
-# END OF CLASS CareerAgentSDK ====================================================================================================
-
 class WebCLI:
 
   def __init__(self):
     self.GENERATED_DOCS_FOLDER = getattr(cli_constants, "GENERATED_DOCS_FOLDER", "~/Documents/GeneratedCoverLetters")
+    self.DOCUMENT_FORMATS = getattr(cli_constants, "DOCUMENT_FORMATS", ["pdf"])
     # self.svc = CareerAgentService.CareerAgentService()
     self.sdk = CareerAgentSDK()
 
@@ -37,21 +21,14 @@ class WebCLI:
 
   # ====================================================================================================
 
-  def create_pdf(self, text: str, subject_ctx: SubjectContext, document_type):
-    output_folder = self.GENERATED_DOCS_FOLDER
-    #Generate a PDF of the cover letter and save to a file named with the company name and job title
-    from fpdf import FPDF
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.multi_cell(0, 5, text)
-    # write the pdf to the output folder
-    output_folder = os.path.expanduser(output_folder)
-    if not os.path.exists(output_folder):
-      os.makedirs(output_folder)
-    output_filename = output_folder + "/" + subject_ctx.company_name + "_" + subject_ctx.job_title + "_" + document_type + ".pdf"
-    pdf.output(output_filename)
-    print("Saved cover letter to " + output_filename + "\n")
+  # The server generates and renders the document; it is then downloaded in each of the DOCUMENT_FORMATS
+  def save_document(self, subject_id: str, document_type: str):
+    job = self.sdk.create_document(subject_id, document_type, self.DOCUMENT_FORMATS)
+    job = self.sdk.wait_for_document(job["id"])
+    for format, error in job["errors"].items():
+      print("Unable to create " + format + ": " + error)
+    for format in job["outputs"]:
+      print("Saved " + document_type + " to " + self.sdk.download_document(job["id"], format, self.GENERATED_DOCS_FOLDER))
 
   # ====================================================================================================
 
@@ -69,11 +46,8 @@ class WebCLI:
     job_title = input("Enter the job title: ")
     company_name = input("Enter the company name: ")
 
-    subject_context = self.svc.get_subject_context(subject_id)
-    subject_context.job_desc = job_desc
-    subject_context.job_title = job_title
-    subject_context.company_name = company_name
-    self.svc.save_subject_context(subject_context)
+    self.sdk.set_job_description(subject_id, job_desc, job_title, company_name)
+    print("Preparing the cover letter for " + job_title + " at " + company_name + " in the background...")
 
   def start(self):
     
@@ -97,10 +71,19 @@ class WebCLI:
                 "=====================================================\n")
         elif userInput in ['']:
           continue
+        elif userInput in ['JD']:
+          self.set_job_description(subject_context.id)
+        elif userInput in ['R']:
+          print("Generating resume...\n")
+          self.save_document(subject_context.id, "resume")
+        elif userInput in ['CL']:
+          print("Generating cover letter...\n")
+          self.save_document(subject_context.id, "coverletter")
         else:
           print("\n... Generating answer ...\n")
-          answer = self.sdk.ask_conversational_question(subject_context.id, userInput)
-          print(answer + "\n")
+          # Print the answer as it is generated rather than waiting for all of it
+          self.sdk.ask_conversational_question(subject_context.id, userInput, on_token = lambda token: print(token, end = "", flush = True))
+          print("\n")
       except Exception as e:
         print(e)
         continue
@@ -108,4 +91,6 @@ class WebCLI:
     # END OF WHILE LOOP
   # END OF CLASS ResumeBuilder ====================================================================================================
 
-WebCLI().start()
+# Guarded so that the worker processes spawned to parse documents (see DocumentIngestion) do not start the CLI
+if __name__ == "__main__":
+  WebCLI().start()
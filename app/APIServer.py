@@ -1,16 +1,81 @@
-from flask import Flask, request
+from flask import Flask, Response, request, g, send_file, stream_with_context
 from flask_cors import CORS, cross_origin
+import os
+import json
+import time
+import socket
 import logging
+import threading
 import CareerAgentService as CareerAgentService
+import Metrics as Metrics
+import DocumentRenderer as DocumentRenderer
+import ConcurrentCalls as ConcurrentCalls
 
 app = Flask(__name__)
 CORS(app)
 app.logger.setLevel(logging.DEBUG)
 
-# TODO: Figure out how to access pre-initialized CareerAgentService instances for performance or determine if they can be initialized on demand for each subject_id request
-career_agent = CareerAgentService.CareerAgentService()
+# Subjects are initialized on demand when first requested and kept in a bounded LRU registry (see SubjectRegistry)
+# A document parse worker is spawned and re-imports the __main__ module of its parent as __mp_main__ (see
+# DocumentIngestion), so when this server is run directly the workers must not build a service of their own
+career_agent = CareerAgentService.CareerAgentService() if __name__ != "__mp_main__" else None
 
-# API for accepting a chat message related to a subject_id and providing a chat question in the body of the request
+# The questions of a /chat/batch request are answered concurrently, up to CHAT_BATCH_CONCURRENCY at a time
+MAX_CHAT_BATCH_SIZE = int(os.environ.get("MAX_CHAT_BATCH_SIZE", "100"))
+CHAT_BATCH_CONCURRENCY = int(os.environ.get("CHAT_BATCH_CONCURRENCY", "8"))
+CHAT_BATCH_TIMEOUT_SECONDS = float(os.environ.get("CHAT_BATCH_TIMEOUT_SECONDS", "120"))
+
+# ====================================================================================================
+
+# Format the tokens of an answer as Server-Sent Events. Each token is a JSON encoded "data" event and the
+# stream ends with a "done" event, or an "error" event if the answer could not be completed. The time until
+# the stream ended, counted from started, is recorded on /metrics once it has.
+def sse_events(tokens, started: float = None, endpoint: str = "chat"):
+  outcome = "disconnected"
+  try:
+    for token in tokens:
+      yield "data: " + json.dumps({"token": token}) + "\n\n"
+    outcome = "done"
+    yield "event: done\ndata: {}\n\n"
+  except Exception as e:
+    outcome = "error"
+    app.logger.exception("Error while streaming chat response")
+    yield "event: error\ndata: " + json.dumps({"error": str(e)}) + "\n\n"
+  finally:
+    if started != None:
+      Metrics.HTTP_STREAMS.observe(time.perf_counter() - started, endpoint=endpoint, outcome=outcome)
+
+def wants_stream(request_data) -> bool:
+  return bool(request_data.get('stream')) or "text/event-stream" in request.headers.get("Accept", "")
+
+# Send "X-Trace: 1" (or ?trace=1) to receive the time spent in each stage of the request, and the LLM tokens
+# used, in a Server-Timing response header
+def wants_trace() -> bool:
+  return request.headers.get("X-Trace", "") not in ("", "0") or request.args.get("trace", "") not in ("", "0")
+
+# Every request records its latency on /metrics. Streamed responses are measured up to their first byte, and
+# until their stream ended by sse_events.
+@app.before_request
+def start_request_metrics():
+  g.request_start = time.perf_counter()
+  Metrics.current_trace.set(Metrics.Trace() if wants_trace() else None)
+
+@app.after_request
+def record_request_metrics(response):
+  if request.endpoint != "metrics":
+    Metrics.HTTP_REQUESTS.observe(time.perf_counter() - g.request_start, endpoint=request.endpoint or "unknown", status=response.status_code)
+  trace = Metrics.current_trace.get()
+  # The stages of a streamed answer run after its headers have been sent, so it gets no Server-Timing header
+  if (trace != None and response.mimetype != "text/event-stream"):
+    response.headers["Server-Timing"] = trace.server_timing()
+  return response
+
+# ====================================================================================================
+
+# API for accepting a chat message related to a subject_id and providing a chat question in the body of the request.
+# Set "stream": true in the body (or send "Accept: text/event-stream") to receive the answer as Server-Sent Events.
+# Send a "session_id" to hold a conversation: the answer then uses, and is added to, that visitor session's chat
+# history. Without one the question is answered on its own and the answer may come from the answer cache.
 @app.route("/chat", methods=['POST'])
 @cross_origin()
 def chat():
@@ -18,10 +83,118 @@ def chat():
   app.logger.debug('Received request: "%s"', request_data)
   subject_id = request_data['subject_id']
   message_text = request_data['message_text']
+  session_id = request_data.get('session_id')
   logging.debug("Received chat request for subject_id: " + subject_id + " with message_text: " + message_text)
 
-  msg_response = career_agent.ask_simple_with_context(subject_id, message_text)
+  if wants_stream(request_data):
+    tokens = career_agent.stream_simple_with_context(subject_id, message_text, use_chat_history=session_id != None, session_id=session_id)
+    return Response(stream_with_context(sse_events(tokens, g.request_start, request.endpoint)), mimetype="text/event-stream",
+      headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+  msg_response = career_agent.ask_simple_with_context(subject_id, message_text, use_chat_history=session_id != None, session_id=session_id)
   return msg_response
 
+# The chat history of a visitor session, ?session_id=<id>, as the [question, answer] pairs sent with its next
+# question. The oldest turns may have been compacted into a summary turn.
+@app.route("/chat_history/<subject_id>", methods=['GET'])
+@cross_origin()
+def chat_history(subject_id):
+  session_id = request.args.get('session_id')
+  return {"subject_id": subject_id, "session_id": session_id, "chat_history": career_agent.get_chat_history(subject_id, session_id)}
+
+# Answer many stateless questions in one request: {"subject_id", "questions": [...]}. Returns {"results": [...]}
+# with an {"question", "answer"} or {"question", "error"} per question, in the order they were asked.
+@app.route("/chat/batch", methods=['POST'])
+@cross_origin()
+def chat_batch():
+  request_data = request.get_json()
+  subject_id = request_data['subject_id']
+  questions = request_data['questions']
+  if len(questions) > MAX_CHAT_BATCH_SIZE:
+    return {"error": "At most " + str(MAX_CHAT_BATCH_SIZE) + " questions can be sent in one batch"}, 413
+
+  results = ConcurrentCalls.map_ordered(
+    lambda question: career_agent.ask_simple_with_context(subject_id, question),
+    questions,
+    max_workers = CHAT_BATCH_CONCURRENCY,
+    timeout_seconds = CHAT_BATCH_TIMEOUT_SECONDS)
+  return {"results": [{"question": result.item, "answer": result.value} if result.ok else {"question": result.item, "error": str(result.error)} for result in results]}
+
+# Set the job a subject is applying for: {"subject_id", "job_desc", "job_title", "company_name"}. The cover letter
+# starts being prepared in the background; GET /job_description/<subject_id> reports its progress.
+@app.route("/job_description", methods=['POST'])
+@cross_origin()
+def job_description():
+  request_data = request.get_json()
+  subject_id = request_data['subject_id']
+  career_agent.set_job_description(subject_id, request_data['job_desc'], request_data.get('job_title', ""), request_data.get('company_name', ""))
+  return {"subject_id": subject_id, "precompute": career_agent.get_precompute_status(subject_id)}, 202
+
+@app.route("/job_description/<subject_id>", methods=['GET'])
+@cross_origin()
+def job_description_status(subject_id):
+  return {"subject_id": subject_id, "precompute": career_agent.get_precompute_status(subject_id)}
+
+# Generate a document for the subject's current job and render it in the background:
+# {"subject_id", "document_type": "coverletter" | "resume", "formats": ["pdf", "md", "docx", "txt"]}. Send "text"
+# instead to render text that was generated elsewhere. Returns a job handle to poll at GET /documents/<job_id>
+# and, once done, download from GET /documents/<job_id>/<format>.
+@app.route("/documents", methods=['POST'])
+@cross_origin()
+def create_document():
+  request_data = request.get_json()
+  job = career_agent.submit_document(request_data['subject_id'], request_data.get('document_type', "coverletter"),
+    formats = request_data.get('formats', ["pdf"]), text = request_data.get('text'))
+  return job.as_dict(), 202
+
+@app.route("/documents/<job_id>", methods=['GET'])
+@cross_origin()
+def document_status(job_id):
+  job = career_agent.get_document_job(job_id)
+  if job == None:
+    return {"error": "Unknown document job: " + job_id}, 404
+  return job.as_dict()
+
+@app.route("/documents/<job_id>/<format>", methods=['GET'])
+@cross_origin()
+def download_document(job_id, format):
+  job = career_agent.get_document_job(job_id)
+  if job == None:
+    return {"error": "Unknown document job: " + job_id}, 404
+  if format not in job.outputs:
+    return {"error": "The " + format + " document is not available", "job": job.as_dict()}, (404 if job.done() else 409)
+  return send_file(job.outputs[format], mimetype=DocumentRenderer.MEDIA_TYPES[format], as_attachment=True)
+
+# ====================================================================================================
+
+# Latency histograms, token counts, retrieval sizes, cache and fallback counters in the Prometheus text format
+@app.route("/metrics", methods=['GET'])
+def metrics():
+  return Response(Metrics.REGISTRY.render(), mimetype=Metrics.CONTENT_TYPE)
+
+# Liveness: the process is up and serving requests
+@app.route("/healthz", methods=['GET'])
+def healthz():
+  return {"status": "ok"}
+
+# Readiness: the heavy modules have been imported and the subjects have been warmed up
+@app.route("/readyz", methods=['GET'])
+def readyz():
+  return career_agent.get_warm_up_status(), (200 if career_agent.is_ready() else 503)
+
+# Warm up the service in the background once the server accepts connections, so the port opens (and the
+# liveness probe passes) without waiting for the indexes and chains to be built
+def warm_up_when_listening(port: int):
+  while True:
+    try:
+      with socket.create_connection(("127.0.0.1", port), timeout=1):
+        break
+    except OSError:
+      time.sleep(0.05)
+  career_agent.startup_report.mark("listening")
+  career_agent.warm_up()
+
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=8080)
+    port = int(os.environ.get("PORT", "8080"))
+    threading.Thread(target=warm_up_when_listening, args=(port,), name="warm-up", daemon=True).start()
+    app.run(host='0.0.0.0', port=port)
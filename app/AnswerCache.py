@@ -0,0 +1,157 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import LexicalIndex as LexicalIndex
+
+# ====================================================================================================
+
+def normalize_question(question: str) -> str:
+  question = re.sub(r"[^\w\s]", " ", question.lower())
+  return " ".join(question.split())
+
+def content_terms(question: str):
+  return frozenset(LexicalIndex.tokenize(question))
+
+# Jaccard overlap of the content terms of two questions
+def term_overlap(terms, other_terms) -> float:
+  if not (terms or other_terms):
+    return 1.0
+  return len(terms & other_terms) / len(terms | other_terms)
+
+class CachedAnswer:
+  def __init__(self, question: str, answer: str, latency_seconds: float, terms = frozenset()):
+    self.question = question
+    self.answer = answer
+    self.terms = terms
+    # The unit embedding of the question, computed the first time it is a semantic candidate
+    self.vector = None
+    self.latency_seconds = latency_seconds
+    self.created = time.monotonic()
+
+# ====================================================================================================
+# Caches the answers to stateless questions, i.e. questions whose answer depends only on the subject, the
+# question and the subject's index version. A question is first looked up by its normalized text and
+# then by the cosine similarity of its embedding to the cached questions. Entries are kept per subject,
+# dropped when the subject's index version changes, and bounded by count (LRU) and age (TTL).
+#
+# Embeddings score questions that differ in a single entity as near duplicates ("experience with Java?" and
+# "experience with Python?" are above 0.95 with ada-002), so a semantic match must also share at least
+# min_term_overlap of its content terms with the question. That check is made first, and embeddings are
+# only computed for the question and the cached questions that pass it, so a question without a lexical
+# neighbour in the cache (and every put) costs no embedding call. The question and the candidates that have
+# not been embedded yet are embedded together in a single embed_documents(texts) call.
+
+class AnswerCache:
+
+  def __init__(self, embed_documents, similarity_threshold: float = 0.98, max_entries_per_subject: int = 256, ttl_seconds: float = 86400, min_term_overlap: float = 0.5):
+    self.embed_documents = embed_documents
+    self.similarity_threshold = similarity_threshold
+    self.min_term_overlap = min_term_overlap
+    self.max_entries_per_subject = max_entries_per_subject
+    self.ttl_seconds = ttl_seconds
+
+    self._lock = threading.Lock()
+    # subject_id -> (index_version, OrderedDict of normalized question -> CachedAnswer)
+    self._subjects = {}
+
+    self.exact_hits = 0
+    self.semantic_hits = 0
+    self.misses = 0
+    self.seconds_saved = 0.0
+
+  # ====================================================================================================
+
+  def get(self, subject_id: str, index_version: str, question: str):
+    key = normalize_question(question)
+    with self._lock:
+      entries = self._entries(subject_id, index_version)
+      self._expire(entries)
+      entry = entries.get(key)
+      if entry != None:
+        entries.move_to_end(key)
+        self.exact_hits += 1
+        self.seconds_saved += entry.latency_seconds
+        return entry.answer
+      terms = content_terms(question)
+      candidates = [(k, entry) for k, entry in entries.items() if term_overlap(terms, entry.terms) >= self.min_term_overlap]
+      if not candidates:
+        self.misses += 1
+        return None
+
+    # Embedding may be a remote call, so it is done outside of the lock. A failure to embed only means the
+    # semantic lookup is skipped.
+    try:
+      unembedded = [entry for k, entry in candidates if entry.vector is None]
+      vectors = self.embed_documents([question] + [entry.question for entry in unembedded])
+      vector = self._unit_vector(vectors[0])
+      for entry, entry_vector in zip(unembedded, vectors[1:]):
+        entry.vector = self._unit_vector(entry_vector)
+    except Exception as e:
+      print("Unable to embed question for the answer cache: " + str(e))
+      with self._lock:
+        self.misses += 1
+      return None
+    similarities = np.stack([entry.vector for k, entry in candidates]) @ vector
+    best = int(np.argmax(similarities))
+
+    with self._lock:
+      entry = self._entries(subject_id, index_version).get(candidates[best][0])
+      if (entry == None or similarities[best] < self.similarity_threshold):
+        self.misses += 1
+        return None
+      self._entries(subject_id, index_version).move_to_end(candidates[best][0])
+      self.semantic_hits += 1
+      self.seconds_saved += entry.latency_seconds
+      return entry.answer
+
+  def put(self, subject_id: str, index_version: str, question: str, answer: str, latency_seconds: float = 0.0):
+    with self._lock:
+      entries = self._entries(subject_id, index_version)
+      entries[normalize_question(question)] = CachedAnswer(question, answer, latency_seconds, content_terms(question))
+      entries.move_to_end(normalize_question(question))
+      while len(entries) > self.max_entries_per_subject:
+        entries.popitem(last=False)
+
+  def invalidate(self, subject_id: str):
+    with self._lock:
+      self._subjects.pop(subject_id, None)
+
+  # ====================================================================================================
+
+  def stats(self):
+    with self._lock:
+      lookups = self.exact_hits + self.semantic_hits + self.misses
+      return {
+        "entries": sum(len(entries) for version, entries in self._subjects.values()),
+        "exact_hits": self.exact_hits,
+        "semantic_hits": self.semantic_hits,
+        "misses": self.misses,
+        "hit_rate": ((self.exact_hits + self.semantic_hits) / lookups) if lookups else 0.0,
+        "seconds_saved": self.seconds_saved,
+      }
+
+  # ====================================================================================================
+  # Must be called with self._lock held
+
+  def _entries(self, subject_id: str, index_version: str) -> OrderedDict:
+    version, entries = self._subjects.get(subject_id, (None, None))
+    if (entries == None or version != index_version):
+      entries = OrderedDict()
+      self._subjects[subject_id] = (index_version, entries)
+    return entries
+
+  def _expire(self, entries: OrderedDict):
+    if self.ttl_seconds == None:
+      return
+    now = time.monotonic()
+    for key in [key for key, entry in entries.items() if now - entry.created > self.ttl_seconds]:
+      del entries[key]
+
+  def _unit_vector(self, vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
@@ -0,0 +1,238 @@
+from quart import Quart, Response, request, g, send_file
+from quart_cors import cors
+import os
+import json
+import time
+import asyncio
+import logging
+import contextlib
+import CareerAgentService as CareerAgentService
+import Metrics as Metrics
+import DocumentRenderer as DocumentRenderer
+
+# ====================================================================================================
+# An asyncio version of APIServer. Requests wait on LLM and retrieval calls without holding a thread, so a
+# single process can have hundreds of chats in flight. Run it with an ASGI server, e.g.:
+#
+#   hypercorn --bind 0.0.0.0:8000 AsyncAPIServer:app
+
+app = Quart(__name__)
+app = cors(app)
+app.logger.setLevel(logging.DEBUG)
+
+# At most MAX_UPSTREAM_CALLS chats call the LLM at once. Up to MAX_WAITING_REQUESTS more wait for a slot and
+# any requests beyond that are rejected with a 503 so that clients back off instead of piling up.
+MAX_UPSTREAM_CALLS = int(os.environ.get("MAX_UPSTREAM_CALLS", "64"))
+MAX_WAITING_REQUESTS = int(os.environ.get("MAX_WAITING_REQUESTS", "512"))
+# Each question of a /chat/batch request takes its own upstream slot
+MAX_CHAT_BATCH_SIZE = int(os.environ.get("MAX_CHAT_BATCH_SIZE", "100"))
+
+# A document parse worker is spawned and re-imports the __main__ module of its parent as __mp_main__ (see
+# DocumentIngestion), so when this server is run directly the workers must not build a service of their own
+career_agent = CareerAgentService.CareerAgentService() if __name__ != "__mp_main__" else None
+
+# ====================================================================================================
+
+class Overloaded(Exception):
+  pass
+
+class AdmissionControl:
+  def __init__(self, max_in_flight: int, max_waiting: int):
+    self.max_in_flight = max_in_flight
+    self.max_waiting = max_waiting
+    self.in_flight = 0
+    self.waiting = 0
+    self.rejected = 0
+    self._semaphore = asyncio.Semaphore(max_in_flight)
+
+  # Raise Overloaded if a request arriving now would be rejected
+  def check(self):
+    if (self._semaphore.locked() and self.waiting >= self.max_waiting):
+      self.rejected += 1
+      raise Overloaded("Too many requests in flight, try again shortly")
+
+  async def acquire(self):
+    self.check()
+    self.waiting += 1
+    try:
+      await self._semaphore.acquire()
+    finally:
+      self.waiting -= 1
+    self.in_flight += 1
+
+  def release(self):
+    self.in_flight -= 1
+    self._semaphore.release()
+
+  @contextlib.asynccontextmanager
+  async def slot(self):
+    await self.acquire()
+    try:
+      yield
+    finally:
+      self.release()
+
+admission = AdmissionControl(MAX_UPSTREAM_CALLS, MAX_WAITING_REQUESTS)
+
+@app.errorhandler(Overloaded)
+async def overloaded(e):
+  return Response(str(e), status=503, headers={"Retry-After": "1"})
+
+# ====================================================================================================
+
+# The upstream slot is acquired when the body starts streaming and held until the last token has been sent,
+# so a response whose body is never sent (e.g. the client went away) never holds a slot. As in APIServer,
+# the time until the stream ended is recorded on /metrics once it has.
+async def sse_events(tokens, started: float = None, endpoint: str = "chat"):
+  outcome = "disconnected"
+  try:
+    async with admission.slot():
+      async for token in tokens:
+        yield "data: " + json.dumps({"token": token}) + "\n\n"
+    outcome = "done"
+    yield "event: done\ndata: {}\n\n"
+  except Exception as e:
+    outcome = "error"
+    app.logger.exception("Error while streaming chat response")
+    yield "event: error\ndata: " + json.dumps({"error": str(e)}) + "\n\n"
+  finally:
+    if started != None:
+      Metrics.HTTP_STREAMS.observe(time.perf_counter() - started, endpoint=endpoint, outcome=outcome)
+
+def wants_stream(request_data) -> bool:
+  return bool(request_data.get('stream')) or "text/event-stream" in request.headers.get("Accept", "")
+
+# Same as APIServer: "X-Trace: 1" (or ?trace=1) returns the stages of the request in a Server-Timing header
+def wants_trace() -> bool:
+  return request.headers.get("X-Trace", "") not in ("", "0") or request.args.get("trace", "") not in ("", "0")
+
+@app.before_request
+async def start_request_metrics():
+  g.request_start = time.perf_counter()
+  Metrics.current_trace.set(Metrics.Trace() if wants_trace() else None)
+
+@app.after_request
+async def record_request_metrics(response):
+  if request.endpoint != "metrics":
+    Metrics.HTTP_REQUESTS.observe(time.perf_counter() - g.request_start, endpoint=request.endpoint or "unknown", status=response.status_code)
+  trace = Metrics.current_trace.get()
+  # Same as APIServer: a streamed answer gets no Server-Timing header
+  if (trace != None and response.mimetype != "text/event-stream"):
+    response.headers["Server-Timing"] = trace.server_timing()
+  return response
+
+# ====================================================================================================
+
+# Same contract as APIServer /chat, including the "stream" option for Server-Sent Events and "session_id"
+@app.route("/chat", methods=['POST'])
+async def chat():
+  request_data = await request.get_json()
+  app.logger.debug('Received request: "%s"', request_data)
+  subject_id = request_data['subject_id']
+  message_text = request_data['message_text']
+  session_id = request_data.get('session_id')
+
+  if wants_stream(request_data):
+    # Reject up front when overloaded; the slot itself is taken by sse_events
+    admission.check()
+    tokens = career_agent.astream_simple_with_context(subject_id, message_text, use_chat_history=session_id != None, session_id=session_id)
+    return Response(sse_events(tokens, g.request_start, request.endpoint), mimetype="text/event-stream",
+      headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+  async with admission.slot():
+    msg_response = await career_agent.aask_simple_with_context(subject_id, message_text, use_chat_history=session_id != None, session_id=session_id)
+  return msg_response
+
+# Same contract as APIServer /chat_history. A shared chat memory reads the session store, so it runs on a worker thread.
+@app.route("/chat_history/<subject_id>", methods=['GET'])
+async def chat_history(subject_id):
+  session_id = request.args.get('session_id')
+  history = await asyncio.to_thread(career_agent.get_chat_history, subject_id, session_id)
+  return {"subject_id": subject_id, "session_id": session_id, "chat_history": history}
+
+# Same contract as APIServer /chat/batch. A question that cannot get an upstream slot gets an error result.
+@app.route("/chat/batch", methods=['POST'])
+async def chat_batch():
+  request_data = await request.get_json()
+  subject_id = request_data['subject_id']
+  questions = request_data['questions']
+  if len(questions) > MAX_CHAT_BATCH_SIZE:
+    return {"error": "At most " + str(MAX_CHAT_BATCH_SIZE) + " questions can be sent in one batch"}, 413
+
+  async def answer(question: str):
+    async with admission.slot():
+      return await career_agent.aask_simple_with_context(subject_id, question)
+
+  answers = await asyncio.gather(*[answer(question) for question in questions], return_exceptions=True)
+  return {"results": [{"question": question, "error": str(value)} if isinstance(value, Exception) else {"question": question, "answer": value} for question, value in zip(questions, answers)]}
+
+# Same contract as APIServer /job_description. Setting the job may build the subject and writes its context to
+# the session store, so it runs on a worker thread rather than on the event loop.
+@app.route("/job_description", methods=['POST'])
+async def job_description():
+  request_data = await request.get_json()
+  subject_id = request_data['subject_id']
+  await asyncio.to_thread(career_agent.set_job_description, subject_id, request_data['job_desc'], request_data.get('job_title', ""), request_data.get('company_name', ""))
+  return {"subject_id": subject_id, "precompute": career_agent.get_precompute_status(subject_id)}, 202
+
+@app.route("/job_description/<subject_id>", methods=['GET'])
+async def job_description_status(subject_id):
+  return {"subject_id": subject_id, "precompute": career_agent.get_precompute_status(subject_id)}
+
+# Same contract as APIServer /documents. Generation and rendering run on the service's worker pools; submitting
+# and looking up a job run on a worker thread as they may build the subject or read the session store.
+@app.route("/documents", methods=['POST'])
+async def create_document():
+  request_data = await request.get_json()
+  job = await asyncio.to_thread(career_agent.submit_document, request_data['subject_id'], request_data.get('document_type', "coverletter"),
+    formats = request_data.get('formats', ["pdf"]), text = request_data.get('text'))
+  return job.as_dict(), 202
+
+@app.route("/documents/<job_id>", methods=['GET'])
+async def document_status(job_id):
+  job = await asyncio.to_thread(career_agent.get_document_job, job_id)
+  if job == None:
+    return {"error": "Unknown document job: " + job_id}, 404
+  return job.as_dict()
+
+@app.route("/documents/<job_id>/<format>", methods=['GET'])
+async def download_document(job_id, format):
+  job = await asyncio.to_thread(career_agent.get_document_job, job_id)
+  if job == None:
+    return {"error": "Unknown document job: " + job_id}, 404
+  if format not in job.outputs:
+    return {"error": "The " + format + " document is not available", "job": job.as_dict()}, (404 if job.done() else 409)
+  return await send_file(job.outputs[format], mimetype=DocumentRenderer.MEDIA_TYPES[format], as_attachment=True)
+
+# ====================================================================================================
+
+@app.before_serving
+async def start_warm_up():
+  career_agent.startup_report.mark("listening")
+  # Not awaited: the warm-up runs on a worker thread while the server starts accepting requests
+  asyncio.get_running_loop().run_in_executor(None, career_agent.warm_up)
+
+@app.route("/metrics", methods=['GET'])
+async def metrics():
+  return Response(Metrics.REGISTRY.render(), mimetype=Metrics.CONTENT_TYPE)
+
+@app.route("/healthz", methods=['GET'])
+async def healthz():
+  return {"status": "ok"}
+
+@app.route("/readyz", methods=['GET'])
+async def readyz():
+  return career_agent.get_warm_up_status(), (200 if career_agent.is_ready() else 503)
+
+@app.route("/admission", methods=['GET'])
+async def admission_stats():
+  return {
+    "max_upstream_calls": admission.max_in_flight,
+    "max_waiting_requests": admission.max_waiting,
+    "in_flight": admission.in_flight,
+    "waiting": admission.waiting,
+    "rejected": admission.rejected,
+  }
+
+if __name__ == "__main__":
+    app.run(host='0.0.0.0', port=int(os.environ.get("PORT", "8080")))
@@ -0,0 +1,301 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+
+import SubjectContext as SubjectContext
+import IndexManifest as IndexManifest
+import GenerationMemo as GenerationMemo
+import DocumentRenderer as DocumentRenderer
+
+# ====================================================================================================
+# Generates cover letters and resumes for many job descriptions of one subject. Jobs run concurrently (the
+# LLM calls of all jobs share the service's rate limiter), each document is written as soon as it is
+# finished, and a completion log in the output folder lets a rerun skip the documents already generated
+# for an unchanged job description. Documents are rendered by a DocumentRenderer, so writing PDFs does not
+# hold up generation. Run from the app folder:
+#
+#   python BatchGeneration.py jobs.jsonl --output ~/Documents/GeneratedCoverLetters --requests-per-minute 60
+#   python BatchGeneration.py job_descriptions/ --documents coverletter --formats pdf md
+
+DOCUMENT_TYPES = ("coverletter", "resume")
+COMPLETION_LOG_FILE_NAME = "completed.jsonl"
+JOB_FILE_EXTENSIONS = (".txt", ".md", ".json")
+
+class BatchJob:
+  def __init__(self, job_id: str, job_desc: str, job_title: str = "", company_name: str = "", source: str = None):
+    self.id = job_id
+    self.job_desc = job_desc
+    self.job_title = job_title
+    self.company_name = company_name
+    self.source = source
+
+  # Identifies the content of the job, so an edited job description is generated again
+  def content_hash(self) -> str:
+    return IndexManifest.hash_text(json.dumps([self.job_desc, self.job_title, self.company_name]))
+
+  def subject_context(self, subject: SubjectContext) -> SubjectContext:
+    subject_context = SubjectContext.SubjectContext(subject.applicant_name, subject.id)
+    subject_context.job_desc = self.job_desc
+    subject_context.job_title = self.job_title
+    subject_context.company_name = self.company_name
+    return subject_context
+
+# ====================================================================================================
+# Loading jobs. A JSONL file has one job per line with "job_desc", "job_title", "company_name" and an
+# optional "id". A directory has one job per file: .json files hold a single job in the same format and
+# .txt/.md files hold the job description, optionally starting with "Company:" and "Job Title:" lines.
+
+def slug(text: str) -> str:
+  return re.sub(r"[^A-Za-z0-9]+", "_", text).strip("_") or "job"
+
+def job_from_record(record, default_id: str, source: str) -> BatchJob:
+  job_desc = record.get("job_desc") or record.get("job_description")
+  if not job_desc:
+    raise ValueError("No job description in " + source)
+  job_title = record.get("job_title", "")
+  company_name = record.get("company_name", "")
+  job_id = record.get("id") or (slug(company_name + "_" + job_title) if (company_name or job_title) else default_id)
+  return BatchJob(str(job_id), job_desc, job_title, company_name, source)
+
+def job_from_text(text: str, default_id: str, source: str) -> BatchJob:
+  headers = {}
+  lines = text.splitlines()
+  while lines:
+    match = re.match(r"^(Company|Job Title|Title):\s*(.*)$", lines[0], re.IGNORECASE)
+    if match == None:
+      break
+    headers[match.group(1).lower()] = match.group(2).strip()
+    lines.pop(0)
+  record = {
+    "job_desc": "\n".join(lines).strip(),
+    "job_title": headers.get("job title", headers.get("title", "")),
+    "company_name": headers.get("company", ""),
+  }
+  return job_from_record(record, default_id, source)
+
+def load_jobs(path: str):
+  jobs = []
+  if os.path.isdir(path):
+    for file_name in sorted(os.listdir(path)):
+      stem, extension = os.path.splitext(file_name)
+      if extension.lower() not in JOB_FILE_EXTENSIONS:
+        continue
+      file_path = os.path.join(path, file_name)
+      with open(file_path, encoding="utf-8") as f:
+        if extension.lower() == ".json":
+          job = job_from_record(json.load(f), slug(stem), file_path)
+        else:
+          job = job_from_text(f.read(), slug(stem), file_path)
+      jobs.append(job)
+  else:
+    with open(path, encoding="utf-8") as f:
+      for line_number, line in enumerate(f, 1):
+        if line.strip():
+          jobs.append(job_from_record(json.loads(line), "job_" + str(line_number), path + ":" + str(line_number)))
+
+  # Two jobs for the same company and title would overwrite each other's documents
+  seen = {}
+  for job in jobs:
+    if job.id in seen:
+      seen[job.id] += 1
+      job.id = job.id + "_" + str(seen[job.id])
+    else:
+      seen[job.id] = 1
+  return jobs
+
+# ====================================================================================================
+
+# The documents completed so far, as (job id, document type) -> content hash of the job when it was generated
+class CompletionLog:
+  def __init__(self, path: str):
+    self.path = path
+    self._lock = threading.Lock()
+    self.completed = {}
+    if os.path.exists(path):
+      with open(path, encoding="utf-8") as f:
+        for line in f:
+          try:
+            entry = json.loads(line)
+          except ValueError:
+            # A line cut short by an interrupted run
+            continue
+          self.completed[(entry["job_id"], entry["document_type"])] = entry["content_hash"]
+
+  def is_complete(self, job: BatchJob, document_type: str, output_paths) -> bool:
+    with self._lock:
+      return self.completed.get((job.id, document_type)) == job.content_hash() and all(os.path.exists(path) for path in output_paths)
+
+  def record(self, job: BatchJob, document_type: str, output_paths, seconds: float):
+    entry = {"job_id": job.id, "document_type": document_type, "content_hash": job.content_hash(), "outputs": output_paths, "seconds": seconds}
+    with self._lock:
+      with open(self.path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+      self.completed[(job.id, document_type)] = entry["content_hash"]
+
+# ====================================================================================================
+# The experience found for a qualification, shared by all jobs of a batch. The service memoizes experience
+# per qualification on disk; this also makes a job wait for a qualification that another job is already
+# querying rather than query it again.
+
+class SharedCandidateSkills:
+  def __init__(self, svc, subject_id: str):
+    self.svc = svc
+    self.subject_id = subject_id
+    self._lock = threading.Lock()
+    self._skills = {}
+    self.queries = 0
+    self.reuses = 0
+
+  def get(self, qualification: str) -> str:
+    key = GenerationMemo.normalize_qualification(qualification)
+    with self._lock:
+      future = self._skills.get(key)
+      is_owner = future == None
+      if is_owner:
+        future = Future()
+        self._skills[key] = future
+        self.queries += 1
+      else:
+        self.reuses += 1
+    if not is_owner:
+      return future.result()
+
+    try:
+      future.set_result(self.svc.get_candidate_skill(self.subject_id, qualification))
+    except Exception as e:
+      # Let a later job retry the qualification
+      with self._lock:
+        self._skills.pop(key, None)
+      future.set_exception(e)
+    return future.result()
+
+  def stats(self):
+    with self._lock:
+      return {"queries": self.queries, "reuses": self.reuses}
+
+# ====================================================================================================
+
+def generate_document(svc, subject_id: str, job: BatchJob, document_type: str, skills: SharedCandidateSkills) -> str:
+  subject_context = job.subject_context(svc.get_subject_context(subject_id))
+  if document_type == "coverletter":
+    return svc.generate_cover_letter(subject_id, subject_context, skills.get)
+  if document_type == "resume":
+    return svc.generate_resume(subject_id, subject_context)
+  raise ValueError("Unknown document type: " + document_type)
+
+def document_name(job: BatchJob, document_type: str) -> str:
+  return job.id + "_" + document_type
+
+def output_paths_for(output_folder: str, job: BatchJob, document_type: str, formats):
+  return [os.path.join(output_folder, DocumentRenderer.safe_file_name(document_name(job, document_type)) + DocumentRenderer.EXTENSIONS[format]) for format in formats]
+
+# Generate the documents of every job that have not been completed yet and render them to the given formats.
+# on_result(job, document_type, output_paths, error) is called as each document finishes. Returns a summary
+# of the batch.
+def run_batch(svc, subject_id: str, jobs, output_folder: str, document_types = DOCUMENT_TYPES, max_concurrent_jobs: int = 4, on_result = None,
+              formats = ("txt",), render_workers: int = 4):
+  output_folder = os.path.expanduser(output_folder)
+  os.makedirs(output_folder, exist_ok=True)
+  completion_log = CompletionLog(os.path.join(output_folder, COMPLETION_LOG_FILE_NAME))
+  skills = SharedCandidateSkills(svc, subject_id)
+  renderer = DocumentRenderer.DocumentRenderer(output_folder, max_workers=render_workers)
+
+  tasks = []
+  skipped = 0
+  for job in jobs:
+    for document_type in document_types:
+      if completion_log.is_complete(job, document_type, output_paths_for(output_folder, job, document_type, formats)):
+        skipped += 1
+      else:
+        tasks.append((job, document_type))
+
+  failures = []
+  render_jobs = []
+
+  def report(job: BatchJob, document_type: str, output_paths, error: Exception):
+    if error != None:
+      failures.append({"job_id": job.id, "document_type": document_type, "error": str(error)})
+    if on_result != None:
+      on_result(job, document_type, output_paths, error)
+
+  # Generation hands the text to the renderer and moves on to the next job. A document is only recorded as
+  # complete once every format has been written.
+  def run(job: BatchJob, document_type: str):
+    start = time.perf_counter()
+    text = generate_document(svc, subject_id, job, document_type, skills)
+
+    def rendered(render_job: DocumentRenderer.RenderJob):
+      if render_job.errors:
+        report(job, document_type, list(render_job.outputs.values()), Exception("Unable to render " + json.dumps(render_job.errors)))
+        return
+      output_paths = [render_job.outputs[format] for format in formats]
+      completion_log.record(job, document_type, output_paths, time.perf_counter() - start)
+      report(job, document_type, output_paths, None)
+
+    render_jobs.append(renderer.submit(text, document_name(job, document_type), formats, on_done=rendered))
+
+  start = time.perf_counter()
+  # Build the subject once up front instead of in every job
+  svc.get_subject_resources(subject_id)
+  with ThreadPoolExecutor(max_workers=max(1, max_concurrent_jobs)) as executor:
+    futures = {executor.submit(run, job, document_type): (job, document_type) for job, document_type in tasks}
+    for future in as_completed(futures):
+      job, document_type = futures[future]
+      try:
+        future.result()
+      except Exception as e:
+        report(job, document_type, [], e)
+  for render_job in render_jobs:
+    render_job.wait()
+
+  return {
+    "jobs": len(jobs),
+    "generated": len(tasks) - len(failures),
+    "skipped": skipped,
+    "failed": failures,
+    "seconds": time.perf_counter() - start,
+    "qualifications": skills.stats(),
+    "rate_limiter": svc.llm_rate_limiter.stats(),
+    "renderer": renderer.stats(),
+  }
+
+# ====================================================================================================
+
+def main():
+  parser = argparse.ArgumentParser(description="Generate cover letters and resumes for a JSONL file or a directory of job descriptions")
+  parser.add_argument("jobs", help="JSONL file or directory of job descriptions")
+  parser.add_argument("--subject-id", default="AlexWorden")
+  parser.add_argument("--output", default="~/Documents/GeneratedCoverLetters")
+  parser.add_argument("--documents", nargs="+", choices=DOCUMENT_TYPES, default=list(DOCUMENT_TYPES))
+  parser.add_argument("--formats", nargs="+", choices=DocumentRenderer.FORMATS, default=["txt"])
+  parser.add_argument("--concurrency", type=int, default=4, help="Jobs generated at once")
+  parser.add_argument("--requests-per-minute", type=float, default=None, help="Limit on LLM calls across all jobs")
+  args = parser.parse_args()
+
+  import CareerAgentService
+  svc = CareerAgentService.CareerAgentService()
+  if args.requests_per_minute:
+    svc.llm_rate_limiter.set_rate(args.requests_per_minute)
+
+  jobs = load_jobs(args.jobs)
+  print("Loaded " + str(len(jobs)) + " job descriptions from " + args.jobs)
+
+  def on_result(job: BatchJob, document_type: str, output_paths, error: Exception):
+    if error != None:
+      print("Failed " + document_type + " for " + job.id + ": " + str(error))
+    else:
+      print("Saved " + document_type + " for " + job.id + " to " + ", ".join(output_paths))
+
+  summary = run_batch(svc, args.subject_id, jobs, args.output, args.documents, args.concurrency, on_result, formats=args.formats)
+  print(json.dumps(summary, indent=2))
+  return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
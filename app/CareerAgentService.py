@@ -1,23 +1,49 @@
 import os
-import shutil
 import json
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 import SubjectContext as SubjectContext
-
-import openai
-from langchain.chains import ConversationalRetrievalChain, RetrievalQA
-from langchain.memory import ConversationBufferMemory
-from langchain.chat_models import ChatOpenAI
-from langchain.document_loaders import DirectoryLoader, TextLoader
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.indexes import VectorstoreIndexCreator
-from langchain.indexes.vectorstore import VectorStoreIndexWrapper
-from langchain.llms import OpenAI
-from langchain.vectorstores import Chroma
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-
-import constants as constants
-
-os.environ["OPENAI_API_KEY"] = constants.APIKEY
+import SubjectRegistry as SubjectRegistry
+import IndexManifest as IndexManifest
+import LexicalIndex as LexicalIndex
+import ConcurrentCalls as ConcurrentCalls
+import AnswerCache as AnswerCache
+import ChatMemory as ChatMemory
+import SessionStore as SessionStore
+import StartupReport as StartupReport
+import RateLimiter as RateLimiter
+import GenerationMemo as GenerationMemo
+import Precompute as Precompute
+import DocumentRenderer as DocumentRenderer
+import Metrics as Metrics
+
+# The OpenAI key comes from constants.py when there is one, otherwise from the OPENAI_API_KEY environment variable
+try:
+  import constants as constants
+  os.environ["OPENAI_API_KEY"] = constants.APIKEY
+except ImportError:
+  pass
+
+# langchain, openai, Chroma and the unstructured loaders take seconds to import, so they (and the modules of
+# this app that depend on them) are imported where they are used. Calling this imports them all up front.
+def import_langchain():
+  import openai
+  import langchain.chains
+  import langchain.chat_models
+  import langchain.document_loaders
+  import langchain.embeddings
+  import langchain.llms
+  import langchain.vectorstores
+  import langchain.text_splitter
+  import EmbeddingCache
+  import TokenStreaming
+  import NumpyVectorStore
+  import SharedRetrieval
+  import LLMMetrics
+  import DocumentIngestion
 
 class CareerAgentService:
 
@@ -27,64 +53,311 @@ class CareerAgentService:
     self.PERSIST_FOLDER = "personal_docs_persist"
     self.GPT_4K_MODEL = "gpt-3.5-turbo"
     self.GPT_16K_MODEL = "gpt-3.5-turbo-16k"
+    # "chroma" or "numpy" (the in-process NumpyVectorStore, persisted in NUMPY_STORE_FOLDER of each subject's persist folder)
+    self.VECTOR_STORE = os.environ.get("VECTOR_STORE", "chroma")
+    self.RETRIEVAL_MEMO_SIZE = int(os.environ.get("RETRIEVAL_MEMO_SIZE", "256"))
+    # "vector", "hybrid" (BM25 and vector rankings fused) or "auto" (BM25 alone, without embedding the query,
+    # when it is confident, otherwise hybrid). The BM25 index is built alongside each subject's vectorstore
+    # in the opt-in modes. The chains retrieve with templated prompts whose instruction words BM25 would also
+    # score, so vector retrieval stays the default until the hybrid modes are shown to keep answer quality.
+    self.RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "vector")
+    self.LEXICAL_WEIGHT = float(os.environ.get("LEXICAL_WEIGHT", "1.0"))
+    self.NUMPY_STORE_FOLDER = "numpy_store"
+    # A resident subject's index is compared with the manifest on disk at most this often, so that a worker
+    # reloads an index another process has refreshed (a negative value disables the check)
+    self.INDEX_VERSION_CHECK_SECONDS = float(os.environ.get("INDEX_VERSION_CHECK_SECONDS", "5"))
+    self.index_version_checked = {}
+    # Documents are split into chunks of CHUNK_SIZE characters, and the new chunks of a refresh are embedded
+    # EMBEDDING_BATCH_SIZE at a time while the remaining files are parsed on INGESTION_WORKERS processes
+    self.CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", "1000"))
+    self.CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", "0"))
+    self.EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "256"))
+    self.INGESTION_WORKERS = int(os.environ["INGESTION_WORKERS"]) if "INGESTION_WORKERS" in os.environ else None
+    # Throughput and peak memory per file type of the last refresh of each subject's index
+    self.ingestion_reports = {}
+    # Embeddings of document chunks and queries are cached on disk, shared by all subjects
+    self.EMBEDDING_CACHE_PATH = self.PERSIST_FOLDER + "/embedding_cache.sqlite"
+    self.EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+    # The per-qualification calls made while generating a cover letter run concurrently
+    self.QUALIFICATION_CONCURRENCY = int(os.environ.get("QUALIFICATION_CONCURRENCY", "6"))
+    self.QUALIFICATION_TIMEOUT_SECONDS = float(os.environ.get("QUALIFICATION_TIMEOUT_SECONDS", "60"))
+    # Every LLM call of the service waits for this limiter (unlimited unless LLM_REQUESTS_PER_MINUTE is set)
+    self.llm_rate_limiter = RateLimiter.RateLimiter(float(os.environ["LLM_REQUESTS_PER_MINUTE"]) if "LLM_REQUESTS_PER_MINUTE" in os.environ else None)
+    self.embeddings = None
+    self.embeddings_lock = threading.Lock()
+    # Qualifications extracted from job descriptions, and the experience found for each qualification, are kept on disk
+    self.GENERATION_MEMO_PATH = self.PERSIST_FOLDER + "/generation_memo.sqlite"
+    self.GENERATION_MEMO_MAX_ENTRIES = int(os.environ.get("GENERATION_MEMO_MAX_ENTRIES", "10000"))
+    self.generation_memo = None
+
+    # Import, index load and chain construction times, and when the service became ready
+    self.startup_report = StartupReport.StartupReport()
+    self.warm_up_state = "not_started"
+    self.warm_up_error = None
+
+    # Answers to stateless questions are cached per subject and matched exactly or by embedding similarity
+    self.answer_cache = AnswerCache.AnswerCache(lambda texts: self.get_embeddings().embed_documents(texts),
+      similarity_threshold = float(os.environ.get("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.98")),
+      min_term_overlap = float(os.environ.get("ANSWER_CACHE_MIN_TERM_OVERLAP", "0.5")),
+      max_entries_per_subject = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES_PER_SUBJECT", "256")),
+      ttl_seconds = float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", "86400")))
     
-    #define a dictionary to store the chat_history for each user_context
-    self.store_embedding_index = {}
-    self.store_chat_history = {}
-    self.store_small_chain = {}
-    self.store_large_chain = {}
+    # Bound the number of subjects (or the estimated memory of their indexes, see SubjectRegistry.estimate_size_bytes)
+    # that are kept resident at once. EMBEDDING_DIMENSIONS is used in the estimate for a Chroma index.
+    self.MAX_RESIDENT_SUBJECTS = int(os.environ.get("MAX_RESIDENT_SUBJECTS", "8"))
+    self.MAX_RESIDENT_SUBJECT_BYTES = int(os.environ["MAX_RESIDENT_SUBJECT_BYTES"]) if "MAX_RESIDENT_SUBJECT_BYTES" in os.environ else None
+    self.EMBEDDING_DIMENSIONS = int(os.environ.get("EMBEDDING_DIMENSIONS", "1536"))
+
+    # Subject contexts, chat histories and document job statuses are kept in this process ("memory"), or in a
+    # SQLite database shared by the worker processes of a pre-fork server ("sqlite", see gunicorn.conf.py)
+    self.SESSION_STORE = os.environ.get("SESSION_STORE", "memory")
+    self.SESSION_STORE_PATH = os.environ.get("SESSION_STORE_PATH", self.PERSIST_FOLDER + "/sessions.sqlite")
+    self.session_store = SessionStore.SessionStore(self.SESSION_STORE_PATH) if self.SESSION_STORE == "sqlite" else None
+
+    # Chat histories are kept per subject and visitor session, within a token budget. Older turns are compacted
+    # into a rolling summary in the background and idle sessions are dropped.
+    chat_memory_settings = dict(model_name = self.GPT_4K_MODEL,
+      token_budget = int(os.environ.get("CHAT_HISTORY_TOKEN_BUDGET", "1500")),
+      keep_recent_turns = int(os.environ.get("CHAT_HISTORY_RECENT_TURNS", "2")),
+      idle_seconds = float(os.environ.get("CHAT_SESSION_IDLE_SECONDS", "1800")))
+    if (self.session_store != None):
+      self.chat_memory = ChatMemory.SharedChatMemory(self.session_store, self.summarize_conversation, **chat_memory_settings)
+    else:
+      self.chat_memory = ChatMemory.ChatMemory(self.summarize_conversation, **chat_memory_settings)
     self.store_subject_context = {}
 
+    # Setting a job description starts generating the cover letter's skills and mission statement (and, if
+    # PRECOMPUTE_RESUME is set, the resume) in the background
+    self.PRECOMPUTE_RESUME = os.environ.get("PRECOMPUTE_RESUME", "false").lower() in ("1", "true", "yes")
+    self.precompute = Precompute.PrecomputeManager(max_workers=int(os.environ.get("PRECOMPUTE_WORKERS", "3")))
+
+    # Documents requested through submit_document are generated on document_executor and rendered to files in
+    # GENERATED_DOCS_FOLDER by the renderer's worker pool
+    self.GENERATED_DOCS_FOLDER = os.environ.get("GENERATED_DOCS_FOLDER", "generated_docs")
+    self.document_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("DOCUMENT_GENERATION_WORKERS", "4")), thread_name_prefix="document")
+    self.renderer = DocumentRenderer.DocumentRenderer(self.GENERATED_DOCS_FOLDER, max_workers=int(os.environ.get("RENDER_WORKERS", "4")))
+
+    # The embedding index and chains of each subject are built lazily when the subject is first requested
+    self.subject_registry = SubjectRegistry.SubjectRegistry(
+      builder = lambda subject_id: self.build_subject_resources(subject_id, rebuild_index=False),
+      max_subjects = self.MAX_RESIDENT_SUBJECTS,
+      max_memory_bytes = self.MAX_RESIDENT_SUBJECT_BYTES,
+      on_evict = self.on_subject_evicted)
+
+    # Cache, chat memory and subject registry statistics are reported on /metrics when it is scraped
+    Metrics.REGISTRY.callback_gauge("career_agent_component_stats", "Statistics of the caches, chat memory and subject registry", self.collect_component_stats)
+
     # TODO: The name of the candidate will be set dynamically when multiple subjects are supported
     subject_context = SubjectContext.SubjectContext(applicant_name = "Alex Worden", subject_id = "AlexWorden")
-    self.save_subject_context(subject_context)
-    self.initialize_subject(subject_context.id, rebuild_index=False)
+    # A shared store keeps the job description that another worker (or an earlier run) set
+    self.save_subject_context(subject_context, only_if_missing=True)
 
 # ====================================================================================================
 # These 'private' methods will be refactored to retrieve resources that have been persisted and/or cached
 # and are relative to the given user_context
 
+  # With a shared session store every call returns a new SubjectContext, so changes must be saved with
+  # save_subject_context
   def get_subject_context(self, subject_id: str) -> SubjectContext:
-    return self.store_subject_context[subject_id]
+    if (self.session_store != None):
+      return self.session_store.get_subject_context(subject_id)
+    return self.store_subject_context.get(subject_id)
   
-  def save_subject_context(self, subject_context: SubjectContext):
+  # With only_if_missing a subject that already has a context keeps it, checked and saved in one step so that
+  # workers starting together cannot overwrite each other's
+  def save_subject_context(self, subject_context: SubjectContext, only_if_missing: bool = False):
     if (subject_context == None or subject_context.id == None):
       raise Exception("Subject Context and its id cannot be None")
-    self.store_subject_context[subject_context.id] = subject_context
-
-  # Store the chat_history in a dictionary with the user_context.id as the key
-  def set_chat_history(self, subject_id: str, chat_history):
-    self.store_chat_history[subject_id] = chat_history
+    if (self.session_store != None):
+      self.session_store.save_subject_context(subject_context, only_if_missing=only_if_missing)
+    elif (only_if_missing):
+      self.store_subject_context.setdefault(subject_context.id, subject_context)
+    else:
+      self.store_subject_context[subject_context.id] = subject_context
 
-  # Get the chat_history from the dictionary with the user_context.id as the key
-  def get_chat_history(self, subject_id: str):
-    return self.store_chat_history[subject_id]
+  def get_subject_ids(self):
+    if (self.session_store != None):
+      return self.session_store.subject_ids()
+    return list(self.store_subject_context.keys())
 
-  # Clear the chat_history for the user_context
-  def clear_chat_history(self, subject_id: str):
-    self.store_chat_history[subject_id] = []
+  # Set the job the subject is applying for and, unless precompute is False, start preparing its documents
+  def set_job_description(self, subject_id: str, job_desc: str, job_title: str, company_name: str, precompute=True):
+    subject_context = self.get_subject_context(subject_id)
+    if (subject_context == None):
+      raise Exception("Subject Context not found for subject_id: " + subject_id)
+    subject_context.job_desc = job_desc
+    subject_context.job_title = job_title
+    subject_context.company_name = company_name
+    self.save_subject_context(subject_context)
+    if (precompute):
+      self.start_precompute(subject_id)
+    else:
+      self.precompute.cancel(subject_id)
+
+  # Add a (question, answer) turn to the chat_history of a visitor session
+  def append_chat_history(self, subject_id: str, question: str, answer: str, session_id: str = None):
+    self.chat_memory.append(subject_id, session_id, question, answer)
+
+  # Get the chat_history of a visitor session, limited to the chat history token budget
+  def get_chat_history(self, subject_id: str, session_id: str = None):
+    return self.chat_memory.get_history(subject_id, session_id)
+
+  # Clear the chat_history of every session of the subject, or of only the given session
+  def clear_chat_history(self, subject_id: str, session_id: str = None):
+    self.chat_memory.clear(subject_id, session_id)
+
+  def get_subject_resources(self, subject_id: str) -> SubjectRegistry.SubjectResources:
+    resources = self.subject_registry.get(subject_id)
+    if (self.is_index_version_check_due(subject_id) and self.is_index_stale(subject_id, resources)):
+      print("The index of subject " + subject_id + " was refreshed by another process, reloading it")
+      self.subject_registry.invalidate(subject_id)
+      resources = self.subject_registry.get(subject_id)
+    return resources
+
+  def is_index_version_check_due(self, subject_id: str) -> bool:
+    if (self.INDEX_VERSION_CHECK_SECONDS < 0):
+      return False
+    return time.monotonic() - self.index_version_checked.get(subject_id, 0.0) >= self.INDEX_VERSION_CHECK_SECONDS
+
+  # Whether the manifest on disk describes a different index than the resident one
+  def is_index_stale(self, subject_id: str, resources: SubjectRegistry.SubjectResources) -> bool:
+    self.index_version_checked[subject_id] = time.monotonic()
+    try:
+      with open(IndexManifest.IndexManifest.path_for(self.index_folder(subject_id)), "r") as f:
+        version = json.load(f).get("version")
+    except (OSError, ValueError):
+      return False
+    return (version != None and version != resources.index_version)
 
   def get_embedding_index(self, subject_id: str):
-    return self.store_embedding_index[subject_id]
-  
-  def set_embedding_index(self, subject_id: str, index):
-    self.store_embedding_index[subject_id] = index
+    return self.get_subject_resources(subject_id).index
 
   def get_small_chain(self, subject_id: str):
-    return self.store_small_chain[subject_id]
-
-  def set_small_chain(self, subject_id: str, small_chain):
-    self.store_small_chain[subject_id] = small_chain
+    return self.get_subject_resources(subject_id).small_chain
 
   def get_large_chain(self, subject_id: str):
-    return self.store_large_chain[subject_id]
+    return self.get_subject_resources(subject_id).large_chain
+
+  # Release the per-subject state of a subject that has been evicted from the registry
+  def on_subject_evicted(self, subject_id: str, resources: SubjectRegistry.SubjectResources):
+    print("Evicting subject " + subject_id + " from memory")
+    # Chat histories in a shared session store are still in use by the other workers
+    if (self.session_store == None):
+      self.clear_chat_history(subject_id)
+    self.answer_cache.invalidate(subject_id)
+
+  # The embedding function shared by every subject's vectorstore
+  def get_embeddings(self):
+    with self.embeddings_lock:
+      if (self.embeddings == None):
+        import EmbeddingCache
+        self.embeddings = EmbeddingCache.CachedEmbeddings(self.create_embeddings(), self.EMBEDDING_CACHE_PATH, max_entries=self.EMBEDDING_CACHE_MAX_ENTRIES)
+      return self.embeddings
+
+  def get_embedding_cache_stats(self):
+    return self.get_embeddings().stats()
+
+  def get_generation_memo(self) -> GenerationMemo.GenerationMemo:
+    with self.embeddings_lock:
+      if (self.generation_memo == None):
+        self.generation_memo = GenerationMemo.GenerationMemo(self.GENERATION_MEMO_PATH, max_entries=self.GENERATION_MEMO_MAX_ENTRIES)
+      return self.generation_memo
+
+  # ====================================================================================================
+  # Warm-up imports the heavy modules and builds the given subjects (by default every known subject) so that
+  # the first requests do not pay for it. start_warm_up runs it on a background thread.
 
-  def set_large_chain(self, subject_id: str, large_chain):
-    self.store_large_chain[subject_id] = large_chain
+  def warm_up(self, subject_ids = None):
+    self.warm_up_state = "warming"
+    self.warm_up_error = None
+    try:
+      with self.startup_report.stage("import"):
+        import_langchain()
+      for subject_id in (subject_ids if subject_ids != None else self.get_subject_ids()):
+        self.get_subject_resources(subject_id)
+      self.warm_up_state = "ready"
+      self.startup_report.mark("ready")
+      print(str(self.startup_report))
+    except Exception as e:
+      self.warm_up_state = "failed"
+      self.warm_up_error = str(e)
+      print("Warm-up failed: " + str(e))
+
+  def start_warm_up(self, subject_ids = None) -> threading.Thread:
+    thread = threading.Thread(target=self.warm_up, args=(subject_ids,), name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+  # ====================================================================================================
+  # Pre-fork serving (see gunicorn.conf.py). The master binds the port and forks its workers without warming
+  # up, and each worker warms up in the background while /readyz keeps traffic away from it. With
+  # VECTOR_STORE=numpy the index vectors are memory-mapped read-only, so their pages are shared by every
+  # worker rather than copied. No database connection may be used on both sides of the fork, so the master
+  # closes its connections before each fork and each worker opens its own on first use.
+
+  def prepare_to_fork(self):
+    if (self.embeddings != None):
+      self.embeddings.close()
+    if (self.generation_memo != None):
+      self.generation_memo.close()
+    if (self.session_store != None):
+      self.session_store.close()
+
+  # The LLM rate limit applies to the whole server, so each of the workers gets its share
+  def after_fork(self, workers: int):
+    if (self.llm_rate_limiter.requests_per_minute and workers > 1):
+      self.llm_rate_limiter.set_rate(self.llm_rate_limiter.requests_per_minute / workers)
+    # The master bound the port before forking, so the worker serves as soon as this returns
+    self.startup_report.mark("listening")
+    self.start_warm_up()
+
+  def is_ready(self) -> bool:
+    return self.warm_up_state == "ready"
+
+  def get_warm_up_status(self):
+    return {"state": self.warm_up_state, "error": self.warm_up_error, "startup": self.startup_report.as_dict()}
+
+  # Cold (first request builds the subject) and warm (subject already resident) latency of subject lookups
+  def get_registry_stats(self):
+    return self.subject_registry.stats()
+
+  # Searches made and memoized rankings reused by the retrieval layer of a subject
+  def get_retrieval_stats(self, subject_id: str):
+    return self.get_subject_resources(subject_id).retrieval.stats()
+
+  # Parsing time, throughput and peak memory per file type of the last refresh of a subject's index (None if
+  # the index was reused)
+  def get_ingestion_report(self, subject_id: str):
+    return self.ingestion_reports.get(subject_id)
+
+  # Hit rate and the LLM time saved by the answer cache
+  def get_answer_cache_stats(self):
+    return self.answer_cache.stats()
+
+  # The numeric statistics of each component as (labels, value) samples for the metrics registry. The
+  # embedding cache is only reported once it exists, so scraping does not import langchain.
+  def collect_component_stats(self):
+    components = {
+      "answer_cache": self.answer_cache.stats(),
+      "chat_memory": self.chat_memory.stats(),
+      "subject_registry": self.subject_registry.stats(),
+      "precompute": self.precompute.stats(),
+      "renderer": self.renderer.stats(),
+    }
+    if (self.embeddings != None):
+      components["embedding_cache"] = self.embeddings.stats()
+    if (self.generation_memo != None):
+      components["generation_memo"] = self.generation_memo.stats()
+    samples = []
+    for component, stats in components.items():
+      for stat, value in stats.items():
+        if (isinstance(value, (int, float)) and not isinstance(value, bool)):
+          samples.append(({"component": component, "stat": stat}, value))
+    return samples
 
   # ====================================================================================================
 
-  def ask_conversational_question(self, subject_id, question: str, use_chat_history=True): 
+  def ask_conversational_question(self, subject_id, question: str, use_chat_history=True, session_id: str = None): 
     
     # If the question is empty, return an empty string
     if (question == ""):
@@ -94,8 +367,7 @@ class CareerAgentService:
     if (subject_context == None):
       raise Exception("Subject Context not found for subject_id: " + subject_id)
 
-    if (use_chat_history):
-      chat_history = self.get_chat_history(subject_id)
+    chat_history = self.get_chat_history(subject_id, session_id) if use_chat_history else []
     
     # If there is no chat history or we aren't using a chat history, augment the question with the PROMPT_CANDIDATE to give the answer the desired personality
     if ((use_chat_history == False) or (len(chat_history) == 0)):
@@ -105,114 +377,331 @@ class CareerAgentService:
     answer = small_chain({"question": question, "chat_history": chat_history})['answer']
     
     if (use_chat_history):
-      chat_history.append((question, answer))
-      self.set_chat_history(subject_id, chat_history)
+      self.append_chat_history(subject_id, question, answer, session_id)
     
     return answer
 
   # ====================================================================================================
 
-  def ask_simple_with_context(self, subject_id, question: str, use_chat_history=False):
-    small_chain = self.get_small_chain(subject_id)
+  # Fold earlier turns of a conversation into the rolling summary kept by the chat memory
+  def summarize_conversation(self, previous_summary: str, turns):
+    conversation = ""
+    for question, answer in turns:
+      conversation += "Question: " + question + "\nAnswer: " + answer + "\n\n"
+    prompt = "Concisely summarize the following conversation between a recruiter and a job candidate, keeping every fact the candidate stated about their skills and experience. Provide the summary as a short paragraph.\n\n"
+    if previous_summary:
+      prompt += "Summary of the earlier conversation:\n" + previous_summary + "\n\n"
+    prompt += "Conversation:\n" + conversation
+    return self.create_chat_model(self.GPT_4K_MODEL, temperature=0).predict(prompt)
+
+  # ====================================================================================================
+
+  # With use_chat_history the answer uses, and is added to, the chat history of the visitor session session_id
+  def ask_simple_with_context(self, subject_id, question: str, use_chat_history=False, session_id: str = None):
+    resources = self.get_subject_resources(subject_id)
     if (use_chat_history):
-      return small_chain({"question": question, "chat_history": self.get_chat_history(subject_id)})['answer']
+      answer = resources.small_chain({"question": question, "chat_history": self.get_chat_history(subject_id, session_id)})['answer']
+      self.append_chat_history(subject_id, question, answer, session_id)
+      return answer
     else: 
-      return small_chain({"question": question, "chat_history": []})['answer']
+      # Without a chat history the answer only depends on the question and the subject's index, so it can be cached
+      cached_answer = self.answer_cache.get(subject_id, resources.index_version, question)
+      if (cached_answer != None):
+        return cached_answer
+      start = time.perf_counter()
+      answer = resources.small_chain({"question": question, "chat_history": []})['answer']
+      self.answer_cache.put(subject_id, resources.index_version, question, answer, time.perf_counter() - start)
+      return answer
+
+  # ====================================================================================================
+
+  # Same as ask_simple_with_context but yields the answer token by token as the LLM generates it
+  def stream_simple_with_context(self, subject_id, question: str, use_chat_history=False, session_id: str = None):
+    import TokenStreaming
+    resources = self.get_subject_resources(subject_id)
+    if (use_chat_history):
+      return self.record_streamed_answer(TokenStreaming.stream_chain(resources.small_chain, {"question": question, "chat_history": self.get_chat_history(subject_id, session_id)}),
+        subject_id, question, session_id)
+    cached_answer = self.answer_cache.get(subject_id, resources.index_version, question)
+    if (cached_answer != None):
+      return iter([cached_answer])
+    return self.cache_streamed_answer(TokenStreaming.stream_chain(resources.small_chain, {"question": question, "chat_history": []}),
+      subject_id, resources.index_version, question)
+
+  # Pass the tokens through and cache the whole answer once the stream completes
+  def cache_streamed_answer(self, tokens, subject_id: str, index_version: str, question: str):
+    start = time.perf_counter()
+    answer_tokens = []
+    for token in tokens:
+      answer_tokens.append(token)
+      yield token
+    self.answer_cache.put(subject_id, index_version, question, "".join(answer_tokens), time.perf_counter() - start)
+
+  # Pass the tokens through and add the whole answer to the session's chat history once the stream completes
+  def record_streamed_answer(self, tokens, subject_id: str, question: str, session_id: str = None):
+    answer_tokens = []
+    for token in tokens:
+      answer_tokens.append(token)
+      yield token
+    self.append_chat_history(subject_id, question, "".join(answer_tokens), session_id)
+
+  # ====================================================================================================
+  # asyncio variants of the above for the async API server. The chains make their LLM and retrieval calls
+  # without blocking the event loop; building a subject that is not yet resident runs on a worker thread.
+
+  async def aget_subject_resources(self, subject_id: str) -> SubjectRegistry.SubjectResources:
+    if (self.subject_registry.is_resident(subject_id) and not self.is_index_version_check_due(subject_id)):
+      return self.subject_registry.get(subject_id)
+    return await asyncio.to_thread(self.get_subject_resources, subject_id)
+
+  async def aask_simple_with_context(self, subject_id, question: str, use_chat_history=False, session_id: str = None):
+    resources = await self.aget_subject_resources(subject_id)
+    if (use_chat_history):
+      chat_history = await asyncio.to_thread(self.get_chat_history, subject_id, session_id)
+      answer = (await resources.small_chain.acall({"question": question, "chat_history": chat_history}))['answer']
+      await asyncio.to_thread(self.append_chat_history, subject_id, question, answer, session_id)
+      return answer
+    cached_answer = await asyncio.to_thread(self.answer_cache.get, subject_id, resources.index_version, question)
+    if (cached_answer != None):
+      return cached_answer
+    start = time.perf_counter()
+    answer = (await resources.small_chain.acall({"question": question, "chat_history": []}))['answer']
+    await asyncio.to_thread(self.answer_cache.put, subject_id, resources.index_version, question, answer, time.perf_counter() - start)
+    return answer
+
+  async def astream_simple_with_context(self, subject_id, question: str, use_chat_history=False, session_id: str = None):
+    import TokenStreaming
+    resources = await self.aget_subject_resources(subject_id)
+    if (use_chat_history):
+      chat_history = await asyncio.to_thread(self.get_chat_history, subject_id, session_id)
+      answer_tokens = []
+      async for token in TokenStreaming.astream_chain(resources.small_chain, {"question": question, "chat_history": chat_history}):
+        answer_tokens.append(token)
+        yield token
+      await asyncio.to_thread(self.append_chat_history, subject_id, question, "".join(answer_tokens), session_id)
+      return
+    cached_answer = await asyncio.to_thread(self.answer_cache.get, subject_id, resources.index_version, question)
+    if (cached_answer != None):
+      yield cached_answer
+      return
+    start = time.perf_counter()
+    answer_tokens = []
+    async for token in TokenStreaming.astream_chain(resources.small_chain, {"question": question, "chat_history": []}):
+      answer_tokens.append(token)
+      yield token
+    await asyncio.to_thread(self.answer_cache.put, subject_id, resources.index_version, question, "".join(answer_tokens), time.perf_counter() - start)
 
   # ====================================================================================================
 
-  def ask_complex_with_context(self, subject_id: str, question: str, use_chat_history=False):
+  def ask_complex_with_context(self, subject_id: str, question: str, use_chat_history=False, session_id: str = None):
     big_chain = self.get_large_chain(subject_id)
     if (use_chat_history):
-      return big_chain({"question": question, "chat_history": self.get_chat_history(subject_id)})['answer']
+      answer = big_chain({"question": question, "chat_history": self.get_chat_history(subject_id, session_id)})['answer']
+      self.append_chat_history(subject_id, question, answer, session_id)
+      return answer
     else:
       return big_chain({"question": question, "chat_history": []})['answer']
 
   # ====================================================================================================
 
   def query_context(self, subject_id, question):
-    return self.get_embedding_index(subject_id).query(question)
+    query_chain = self.get_subject_resources(subject_id).query_chain
+    with Metrics.stage("query_context"):
+      return query_chain.run(question)
 
   # ====================================================================================================
   
   def ask_without_context(self, prompt):
-    response = openai.Completion.create(
-      model="gpt-3.5-turbo-instruct",
-      prompt=prompt,
-      temperature=0,
-      max_tokens=250
-    )
-    return response['choices'][0]['text']
+    return self.create_completion_model(model_name="gpt-3.5-turbo-instruct", temperature=0, max_tokens=250).predict(prompt)
+
+  # ====================================================================================================
+  # The models used by the service. Override these to run the service against other (e.g. local stub) backends.
+  # The callbacks of model_callbacks apply the LLM rate limit and record the latency and token usage of every
+  # call on /metrics.
+
+  def create_chat_model(self, model: str, **kwargs):
+    from langchain.chat_models import ChatOpenAI
+    return ChatOpenAI(model=model, callbacks=self.model_callbacks(model), **kwargs)
+
+  def create_completion_model(self, **kwargs):
+    from langchain.llms import OpenAI
+    return OpenAI(callbacks=self.model_callbacks(kwargs.get("model_name", "text-davinci-003")), **kwargs)
+
+  def model_callbacks(self, model_name: str):
+    import LLMMetrics
+    return [LLMMetrics.RateLimitCallbackHandler(self.llm_rate_limiter), LLMMetrics.TokenUsageCallbackHandler(model_name)]
+
+  def create_embeddings(self):
+    from langchain.embeddings import OpenAIEmbeddings
+    return OpenAIEmbeddings()
 
   # ====================================================================================================
 
   def initialize_subject(self, subject_id: str, rebuild_index=False):
+    resources = self.build_subject_resources(subject_id, rebuild_index)
+    self.subject_registry.put(subject_id, resources)
+    self.answer_cache.invalidate(subject_id)
+    self.get_generation_memo().invalidate_subject(subject_id, resources.index_version)
+    # Anything precomputed from the previous documents is stale
+    self.precompute.cancel(subject_id)
+    self.clear_chat_history(subject_id)
+
+  # ====================================================================================================
+
+  # Open the persisted vectorstore of a subject and return it with the folder that holds its index manifest.
+  # VECTOR_STORE=numpy selects the in-process NumpyVectorStore, which is created from the subject's Chroma
+  # index the first time it is opened so that nothing has to be re-embedded.
+  def open_vectorstore(self, subject_id: str):
+    from langchain.vectorstores import Chroma
+    import NumpyVectorStore
+    chroma_folder = self.PERSIST_FOLDER + "/" + subject_id
+    if (self.VECTOR_STORE != "numpy"):
+      return chroma_folder, Chroma(persist_directory=chroma_folder, embedding_function=self.get_embeddings())
+
+    numpy_folder = self.index_folder(subject_id)
+    if (not os.path.exists(numpy_folder) and os.path.exists(chroma_folder)):
+      print("Importing the Chroma index in " + chroma_folder + " into " + numpy_folder + "...")
+      vectorstore = NumpyVectorStore.NumpyVectorStore.from_chroma(chroma_folder, self.get_embeddings(), persist_directory=numpy_folder)
+      vectorstore.persist()
+      # An index built without a manifest will be re-chunked, so seed the embedding cache with its vectors
+      self.get_embeddings().seed(vectorstore.texts, vectorstore.matrix)
+      chroma_manifest = IndexManifest.IndexManifest.load(chroma_folder)
+      if (chroma_manifest != None):
+        chroma_manifest.save(numpy_folder)
+      return numpy_folder, vectorstore
+    return numpy_folder, NumpyVectorStore.NumpyVectorStore(self.get_embeddings(), persist_directory=numpy_folder)
+
+  # The memory held by a subject's index, estimated from its chunks
+  def estimate_index_bytes(self, vectorstore, lexical_index) -> int:
+    if hasattr(vectorstore, "matrix"):
+      texts, dimensions = vectorstore.texts, (vectorstore.matrix.shape[1] if len(vectorstore.matrix) else 0)
+    else:
+      texts, dimensions = (lexical_index.texts if lexical_index != None else IndexManifest.stored_chunks(vectorstore)[1]), self.EMBEDDING_DIMENSIONS
+    return SubjectRegistry.estimate_size_bytes(texts, dimensions, lexical_index)
+
+  # The folder that holds a subject's persisted vectorstore and its index manifest
+  def index_folder(self, subject_id: str) -> str:
+    chroma_folder = self.PERSIST_FOLDER + "/" + subject_id
+    return (chroma_folder + "/" + self.NUMPY_STORE_FOLDER) if self.VECTOR_STORE == "numpy" else chroma_folder
+
+  # ====================================================================================================
+
+  def build_subject_resources(self, subject_id: str, rebuild_index=False) -> SubjectRegistry.SubjectResources:
 
     subject_ctx = self.get_subject_context(subject_id)
     # if the subject_ctx is None, throw an error
     if (subject_ctx == None):
       raise Exception("Subject Context not found for subject_id: " + subject_id)
       
-    # TODO: Refactor to not be hardcoded foler and allow for multiple folders based upon the subject_id
     personal_docs_folder = self.PERSONAL_DOCS_FOLDER + "/" + subject_id
-    persist_folder = self.PERSIST_FOLDER + "/" + subject_id
-
-    if rebuild_index:
-      print("Rebuilding the personal docs index...")
-      # if the persist_folder exists, delete it
-      if os.path.exists(persist_folder):
-        shutil.rmtree(persist_folder)
-      # create a new index
-      loader = DirectoryLoader(personal_docs_folder)
-      index = VectorstoreIndexCreator(
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=0), 
-        vectorstore_kwargs={"persist_directory":persist_folder}).from_loaders([loader])
-    else:
-      print("Reusing vectorstore from " + persist_folder + " directory...\n")
-      vectorstore = Chroma(persist_directory=persist_folder, embedding_function=OpenAIEmbeddings())
+    with self.startup_report.stage("import"):
+      import_langchain()
+    from langchain.chains import ConversationalRetrievalChain, RetrievalQA
+    from langchain.indexes.vectorstore import VectorStoreIndexWrapper
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    import SharedRetrieval
+    import DocumentIngestion
+
+    with self.startup_report.stage("index_load"), IndexManifest.index_lock(self.PERSIST_FOLDER + "/" + subject_id):
+      persist_folder, vectorstore = self.open_vectorstore(subject_id)
+      manifest = IndexManifest.IndexManifest.load(persist_folder)
+      chunk_settings = {"chunk_size": self.CHUNK_SIZE, "chunk_overlap": self.CHUNK_OVERLAP}
+      if rebuild_index or manifest == None or manifest.settings != chunk_settings:
+        # Only the files and chunks that changed since the last build are re-chunked and re-embedded
+        print("Refreshing the personal docs index in " + persist_folder + "...")
+        ingestion = DocumentIngestion.IngestionPipeline(
+          RecursiveCharacterTextSplitter(chunk_size=self.CHUNK_SIZE, chunk_overlap=self.CHUNK_OVERLAP),
+          max_workers = self.INGESTION_WORKERS)
+        sync_result = IndexManifest.sync_index(vectorstore, personal_docs_folder, persist_folder, ingestion.load_chunks,
+          embed_batch_size = self.EMBEDDING_BATCH_SIZE, seed_embeddings = self.get_embeddings().seed, settings = chunk_settings)
+        self.ingestion_reports[subject_id] = ingestion.report()
+        print("Refreshed index: " + str(sync_result))
+        print(str(ingestion) + "\n")
+        if (self.VECTOR_STORE == "numpy"):
+          # Reopen the refreshed index so that its vectors are memory-mapped rather than held in this process
+          persist_folder, vectorstore = self.open_vectorstore(subject_id)
+        manifest = sync_result.manifest
+      else:
+        print("Reusing vectorstore from " + persist_folder + " directory...\n")
       index = VectorStoreIndexWrapper(vectorstore=vectorstore)
+
+      lexical_index = None
+      if (self.RETRIEVAL_MODE != "vector"):
+        lexical_index = LexicalIndex.LexicalIndex.load(persist_folder, manifest.version())
+        if (lexical_index == None):
+          ids, texts, metadatas = IndexManifest.stored_chunks(vectorstore)
+          lexical_index = LexicalIndex.LexicalIndex.from_chunks(ids, texts, metadatas, version=manifest.version())
+          lexical_index.persist(persist_folder)
+
+    with self.startup_report.stage("chain_construction"):
+      # Every chain of the subject retrieves through one layer that searches once at the largest k and memoizes rankings
+      retrieval = SharedRetrieval.SubjectRetrieval(vectorstore, manifest.version(), max_k=10, memo_size=self.RETRIEVAL_MEMO_SIZE,
+        lexical_index = lexical_index, mode = self.RETRIEVAL_MODE, lexical_weight = self.LEXICAL_WEIGHT)
+
+      # ====================================================================================================  
+      # It is unfortunate that the langchain developers chose to use the unintuitive __call__ paradigm on their "chain" objects. This creates the confusing syntax that this chain object behaves like a function. 
+
+      # The answering LLM streams its tokens (when a caller asks for them), the question condenser does not
+      small_chain = ConversationalRetrievalChain.from_llm(
+        llm=self.create_chat_model(self.GPT_4K_MODEL, streaming=True),
+        condense_question_llm=self.create_chat_model(self.GPT_4K_MODEL),
+        retriever=retrieval.as_retriever(k=4),
+        verbose=False,
+      )
+
+      large_chain = ConversationalRetrievalChain.from_llm(
+        llm=self.create_chat_model(self.GPT_16K_MODEL),
+        retriever=retrieval.as_retriever(k=10),
+        verbose=True,
+      )
+
+      # The same chain VectorStoreIndexWrapper.query would build, but over the shared retrieval layer
+      query_chain = RetrievalQA.from_chain_type(llm=self.create_completion_model(temperature=0), retriever=retrieval.as_retriever(k=4))
     
-    # ====================================================================================================  
-    # It is unfortunate that the langchain developers chose to use the unintuitive __call__ paradigm on their "chain" objects. This creates the confusing syntax that this chain object behaves like a function. 
-
-    small_chain = ConversationalRetrievalChain.from_llm(
-      llm=ChatOpenAI(model=self.GPT_4K_MODEL),
-      retriever=index.vectorstore.as_retriever(search_kwargs={"k": 4}),
-      verbose=False,
-    )
-
-    large_chain = ConversationalRetrievalChain.from_llm(
-      llm=ChatOpenAI(model=self.GPT_16K_MODEL),
-      retriever=index.vectorstore.as_retriever(search_kwargs={"k": 10}),
-      verbose=True,
-    )
-    
-    self.set_embedding_index(subject_id, index)
-    self.set_small_chain(subject_id, small_chain)
-    self.set_large_chain(subject_id, large_chain)
-    self.clear_chat_history(subject_id)
+    return SubjectRegistry.SubjectResources(subject_id, index, small_chain, large_chain,
+      size_bytes = self.estimate_index_bytes(vectorstore, lexical_index),
+      index_version = manifest.version(),
+      retrieval = retrieval,
+      query_chain = query_chain)
 
   # ====================================================================================================
-  def get_matching_candidate_skills(self, subject_id: str): 
-    subject_context = self.get_subject_context(subject_id)
+  # The job is read from the subject's context unless a subject_context holding the job is given, which lets
+  # batch generation run many jobs of the same subject at once. get_candidate_skill(qualification) can be
+  # given to share the experience found for a qualification between jobs. Setting cancel_event stops the
+  # work (with Precompute.Cancelled) before its next LLM call.
+
+  def get_matching_candidate_skills(self, subject_id: str, subject_context: SubjectContext = None, get_candidate_skill = None, cancel_event: threading.Event = None): 
+    if (subject_context == None):
+      subject_context = self.get_subject_context(subject_id)
     if (subject_context == None):
       raise Exception("Subject Context not found for subject_id: " + subject_id)
     
     if (subject_context.job_desc == None):
       raise Exception("Job description has not been set. Use the 'JD' command to set the job description.")
 
-    job_qualification = self.ask_without_context("As an expert recruiter, identify and summarize up to 6 of the highest priority qualifications from the following Job Description given below. Provide your answer in JSON list format like the following example:\n\n [ \"Qualification Summary Text\", \"Qualification Summary Text\", \"Qualification Summary Text\" ]\n\nJob Description:\n" + subject_context.job_desc)
-    print("\nTop Job Requirements:\n" + job_qualification)
-
-    # Parse the top_requirements as JSON and iterate over the list of job_qualifications
-    job_qualification = json.loads(job_qualification)
+    job_qualification = self.get_job_qualifications(subject_context.job_desc)
+    Precompute.raise_if_cancelled(cancel_event)
+    # Create a short paragraph on how the candidate's context meets each job qualification. The qualifications are
+    # independent of each other so they are queried concurrently, and a failed qualification is dropped.
+    if (get_candidate_skill == None):
+      get_candidate_skill = lambda qualification: self.get_candidate_skill(subject_id, qualification)
+    if (cancel_event != None):
+      query_skill = get_candidate_skill
+      get_candidate_skill = lambda qualification: Precompute.raise_if_cancelled(cancel_event) or query_skill(qualification)
+    results = ConcurrentCalls.map_ordered(
+      get_candidate_skill,
+      job_qualification,
+      max_workers = self.QUALIFICATION_CONCURRENCY,
+      timeout_seconds = self.QUALIFICATION_TIMEOUT_SECONDS)
     most_relevant_skills = []
-    for qualification in job_qualification:
-      # Create a short paragraph on how the candidate's context meets each job qualification
-      candidate_skill = self.query_context(subject_id, "You are an expert resume writer candidate described by the given context. Write text for a bullet point in a job application cover letter that is a concise summary that demonstrates your experiences and skills meet the following Job Qualification. Your answer must be from a first person perspective. Avoid directly quoting text from the following qualification word-for-word and do not claim to have skills or experience not described in the context.\n\nJob Qualification: " + qualification + "\n\n")
-      print("\nJob qualification: " + qualification + "\nExperience: " + candidate_skill + "\n\n")
+    for result in results:
+      if not result.ok:
+        Metrics.FALLBACKS.inc(kind="qualification_skipped")
+        print("\nSkipping job qualification: " + str(result.item) + "\nError: " + str(result.error) + "\n\n")
+        continue
+      print("\nJob qualification: " + result.item + "\nExperience: " + result.value + "\n\n")
       # Add the candidate_skill to the list of most_relevant_skills
-      most_relevant_skills.append(candidate_skill)
+      most_relevant_skills.append(result.value)
 
     print("\n" + subject_context.applicant_name + "'s most relevant experience to the most important requirement in the job description are:\n")
     # Create a bullet list of the most_relevant_skills and append to a string
@@ -224,8 +713,10 @@ class CareerAgentService:
 
     # create a JSON list of the most_relevant_skills
     most_relevant_skills_json_list = json.dumps(most_relevant_skills)
+    Precompute.raise_if_cancelled(cancel_event)
 
-    cleaned_json_skills = self.ask_complex_with_context(subject_id, "You are an recruitment expert and have been asked to copy-edit the following list of candidate skills to be included in a cover letter. You MUST provide your answer in JSON format where each list item is a string in a JSON list like the following format:\n [\"Item description\", \"Item description\", \"Item description\"]. Remove repeated skills and redundant statements from the input list items and condense each item in the following list without losing valuable Knowledge, Skills, and Abilities (KSA) or soft skills such as such as optimism, kindness, intellectual curiosity, strong work ethic, empathy, and integrity. Order the list in order of importance, and limit to a maximum of 6 items. Always include the first item as the number of years experience:\n\n" + most_relevant_skills_json_list)
+    with Metrics.stage("skills_cleanup"):
+      cleaned_json_skills = self.ask_complex_with_context(subject_id, "You are an recruitment expert and have been asked to copy-edit the following list of candidate skills to be included in a cover letter. You MUST provide your answer in JSON format where each list item is a string in a JSON list like the following format:\n [\"Item description\", \"Item description\", \"Item description\"]. Remove repeated skills and redundant statements from the input list items and condense each item in the following list without losing valuable Knowledge, Skills, and Abilities (KSA) or soft skills such as such as optimism, kindness, intellectual curiosity, strong work ethic, empathy, and integrity. Order the list in order of importance, and limit to a maximum of 6 items. Always include the first item as the number of years experience:\n\n" + most_relevant_skills_json_list)
     print("Cleaned Skills:\n" + cleaned_json_skills + "\n")
 
     # parse the jscon cleaned_json_skills into a list
@@ -234,22 +725,152 @@ class CareerAgentService:
       job_skills = json.loads(cleaned_json_skills)
     except: 
       print("Error parsing JSON. Trying to convert to JSON list of strings.")
-      cleaned_json_skills = self.ask_without_context("Format the following into a JSON list of strings:\n" + cleaned_json_skills  + "\n")
+      Metrics.FALLBACKS.inc(kind="json_repair")
+      with Metrics.stage("json_repair"):
+        cleaned_json_skills = self.ask_without_context("Format the following into a JSON list of strings:\n" + cleaned_json_skills  + "\n")
       try:
         job_skills = json.loads(cleaned_json_skills)
       except:
+        Metrics.FALLBACKS.inc(kind="json_repair_failed")
         print("Unable to create cover letter. Error parsing JSON response from OpenAI: \n" + cleaned_json_skills + "\n")
         return []
 
     return (job_skills)
 
   # ====================================================================================================
-  def generate_cover_letter(self, subject_id: str):
+  # Speculatively generate the parts of the documents for the subject's current job. generate_cover_letter and
+  # generate_resume join this work when it is for the job they are asked for.
+
+  def start_precompute(self, subject_id: str) -> Precompute.JobPrecompute:
+    def skills(subject_context, cancel_event):
+      return self.get_matching_candidate_skills(subject_id, subject_context, cancel_event=cancel_event)
+
+    def mission(subject_context, cancel_event):
+      Precompute.raise_if_cancelled(cancel_event)
+      return self.get_mission_alignment(subject_id, subject_context)
+
+    def resume(subject_context, cancel_event):
+      Precompute.raise_if_cancelled(cancel_event)
+      return self.write_resume(subject_id, subject_context)
+
+    tasks = {"skills": skills, "mission": mission}
+    if (self.PRECOMPUTE_RESUME):
+      tasks["resume"] = resume
+    return self.precompute.start(self.get_subject_context(subject_id), tasks)
+
+  def get_precompute_status(self, subject_id: str):
+    return self.precompute.status(subject_id)
+
+  # ====================================================================================================
+  # Generate a "coverletter" or "resume" for the subject's current job (or render the given text instead) in
+  # the background and render it to the given formats. The returned RenderJob is the handle to poll.
+
+  def submit_document(self, subject_id: str, document_type: str, formats = ("pdf",), text: str = None) -> DocumentRenderer.RenderJob:
     subject_context = self.get_subject_context(subject_id)
     if (subject_context == None):
       raise Exception("Subject Context not found for subject_id: " + subject_id)
+    if (text == None and document_type not in ("coverletter", "resume")):
+      raise ValueError("Unknown document type: " + document_type)
+    if (text == None and subject_context.job_desc == None):
+      raise Exception("Job description has not been set. Use the 'JD' command to set the job description.")
+
+    # The job is captured now, so the document matches the job that was set when it was requested
+    subject_context = Precompute.snapshot(subject_context)
+    name = str(subject_context.company_name) + "_" + str(subject_context.job_title) + "_" + document_type
+    # Each job renders into GENERATED_DOCS_FOLDER/<subject>/<job id>, so a job only ever serves its own files
+    job = self.renderer.create_job(name, formats, subfolder=subject_id, per_job_folder=True)
+    if (text != None):
+      self.renderer.render(job, text, on_done=self.save_document_job)
+      self.save_document_job(job)
+      return job
+
+    def generate():
+      try:
+        if (document_type == "coverletter"):
+          document = self.generate_cover_letter(subject_id, subject_context)
+        else:
+          document = self.generate_resume(subject_id, subject_context)
+      except Exception as e:
+        print("Unable to generate " + document_type + ": " + str(e))
+        self.renderer.fail(job, e)
+        self.save_document_job(job)
+        return
+      self.renderer.render(job, document, on_done=self.save_document_job)
+      self.save_document_job(job)
+
+    job.status = "generating"
+    self.save_document_job(job)
+    self.document_executor.submit(contextvars.copy_context().run, generate)
+    return job
+
+  # A job submitted to another worker is read back from the shared session store
+  def get_document_job(self, job_id: str) -> DocumentRenderer.RenderJob:
+    job = self.renderer.get(job_id)
+    if (job == None and self.session_store != None):
+      stored_job = self.session_store.get_document_job(job_id)
+      if (stored_job != None):
+        return DocumentRenderer.RenderJob.from_dict(stored_job, self.renderer.output_folder)
+    return job
+
+  def save_document_job(self, job: DocumentRenderer.RenderJob):
+    if (self.session_store != None):
+      self.session_store.save_document_job(job.as_dict())
+
+  # ====================================================================================================
+  # The highest priority qualifications of a job description, extracted once per distinct job description
+  def get_job_qualifications(self, job_desc: str):
+    memo = self.get_generation_memo()
+    job_qualification = memo.get_qualifications(job_desc)
+    if (job_qualification != None):
+      Metrics.CACHE_LOOKUPS.inc(cache="qualifications_memo", result="hit")
+      print("\nTop Job Requirements (memoized):\n" + json.dumps(job_qualification))
+      return job_qualification
+    Metrics.CACHE_LOOKUPS.inc(cache="qualifications_memo", result="miss")
+
+    with Metrics.stage("qualification_extraction"):
+      job_qualification = self.ask_without_context("As an expert recruiter, identify and summarize up to 6 of the highest priority qualifications from the following Job Description given below. Provide your answer in JSON list format like the following example:\n\n [ \"Qualification Summary Text\", \"Qualification Summary Text\", \"Qualification Summary Text\" ]\n\nJob Description:\n" + job_desc)
+    print("\nTop Job Requirements:\n" + job_qualification)
+
+    # Parse the top_requirements as JSON. Only a list that parsed is memoized.
+    job_qualification = json.loads(job_qualification)
+    memo.put_qualifications(job_desc, job_qualification)
+    return job_qualification
+
+  # ====================================================================================================
+  # The candidate's experience for a qualification, memoized per subject and version of the subject's index
+  def get_candidate_skill(self, subject_id: str, qualification: str):
+    memo = self.get_generation_memo()
+    index_version = self.get_subject_resources(subject_id).index_version
+    skill = memo.get_skill(subject_id, index_version, qualification)
+    if (skill != None):
+      Metrics.CACHE_LOOKUPS.inc(cache="skill_memo", result="hit")
+      return skill
+    Metrics.CACHE_LOOKUPS.inc(cache="skill_memo", result="miss")
+
+    with Metrics.stage("qualification_query"):
+      skill = self.query_context(subject_id, "You are an expert resume writer candidate described by the given context. Write text for a bullet point in a job application cover letter that is a concise summary that demonstrates your experiences and skills meet the following Job Qualification. Your answer must be from a first person perspective. Avoid directly quoting text from the following qualification word-for-word and do not claim to have skills or experience not described in the context.\n\nJob Qualification: " + qualification + "\n\n")
+    memo.put_skill(subject_id, index_version, qualification, skill)
+    return skill
+
+  # ====================================================================================================
+  def generate_cover_letter(self, subject_id: str, subject_context: SubjectContext = None, get_candidate_skill = None):
+    if (subject_context == None):
+      subject_context = self.get_subject_context(subject_id)
+    if (subject_context == None):
+      raise Exception("Subject Context not found for subject_id: " + subject_id)
     
-    skill_list = self.get_matching_candidate_skills(subject_id)
+    # Join the work started when the job description was set. Without it, the mission statement (which does not
+    # depend on the skills) is generated while the skills are being matched.
+    precompute = self.precompute.get(subject_context)
+    if (precompute == None):
+      mission_executor = ThreadPoolExecutor(max_workers=1)
+      mission_future = mission_executor.submit(contextvars.copy_context().run, self.get_mission_alignment, subject_id, subject_context)
+      mission_executor.shutdown(wait=False)
+
+    with Metrics.stage("candidate_skills"):
+      skill_list = precompute.result("skills") if precompute != None else None
+      if (skill_list == None):
+        skill_list = self.get_matching_candidate_skills(subject_id, subject_context, get_candidate_skill)
 
     cover_letter = "Thank you for considering my application for the role of " + subject_context.job_title + " at " + subject_context.company_name + ". I believe the following skills and experience I have are a great fit:\n\n"
     for skill in skill_list:
@@ -257,7 +878,9 @@ class CareerAgentService:
     
     cover_letter += "\n\n"
 
-    mission_alignment = self.ask_complex_with_context(subject_id, "You are a diligent and smart job applicant. Write a very short closing statement in a cover letter to demonstrate how the company mission resonates with your interestes, career aspirations, or passions. Provide your answer by completing the following sentence in less than 25 words: I am excited about the opportunity to work at " + subject_context.company_name + " because I \n\n Base your answer upon the following job description:\n\n" + subject_context.job_desc + "\n")
+    mission_alignment = precompute.result("mission") if precompute != None else mission_future.result()
+    if (mission_alignment == None):
+      mission_alignment = self.get_mission_alignment(subject_id, subject_context)
 
     cover_letter += mission_alignment + "\n\n"
 
@@ -266,15 +889,31 @@ class CareerAgentService:
 
 
   # ====================================================================================================
-  def generate_resume(self, subject_id: str):
+  def get_mission_alignment(self, subject_id: str, subject_context: SubjectContext = None):
+    if (subject_context == None):
+      subject_context = self.get_subject_context(subject_id)
+    with Metrics.stage("mission_alignment"):
+      return self.ask_complex_with_context(subject_id, "You are a diligent and smart job applicant. Write a very short closing statement in a cover letter to demonstrate how the company mission resonates with your interestes, career aspirations, or passions. Provide your answer by completing the following sentence in less than 25 words: I am excited about the opportunity to work at " + subject_context.company_name + " because I \n\n Base your answer upon the following job description:\n\n" + subject_context.job_desc + "\n")
+
+  # ====================================================================================================
+  def generate_resume(self, subject_id: str, subject_context: SubjectContext = None):
 
-    subject_context = self.get_subject_context(subject_id)
+    if (subject_context == None):
+      subject_context = self.get_subject_context(subject_id)
     if (subject_context == None):
       raise Exception("Subject Context not found for subject_id: " + subject_id)
 
+    precompute = self.precompute.get(subject_context)
+    resume = precompute.result("resume") if precompute != None else None
+    if (resume == None):
+      resume = self.write_resume(subject_id, subject_context)
+    return resume
+
+  def write_resume(self, subject_id: str, subject_context: SubjectContext):
     query = "Write a resume for " + subject_context.applicant_name + " with the following sections: \n" + "Summary: summarising the candidate's valuable experience\nSummary of Skills and Experience: a short bullet list the candidates's relevant skills and experience to the job description\nWork Experience: Provide an entry for each company the candidate has worked at and a 3-5 item bullet list their relevant accomplishments\nEducation:\nThe resume must be tailored to the following job description:\n" + subject_context.job_desc + "\n"
 
-    resume = self.ask_complex_with_context(query)
+    with Metrics.stage("resume"):
+      resume = self.ask_complex_with_context(subject_id, query)
     return resume
 
   # ====================================================================================================
@@ -0,0 +1,203 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import tiktoken
+
+DEFAULT_SESSION_ID = "default"
+
+# The question paired with the rolling summary when it is sent to a chain as the first turn of the history
+SUMMARY_QUESTION = "Summarize our conversation so far."
+
+# ====================================================================================================
+
+class ChatSession:
+  def __init__(self):
+    self.summary = ""
+    # (question, answer, token count) for each turn that has not been compacted into the summary
+    self.turns = []
+    self.compacting = False
+    self.last_used = time.monotonic()
+    self.lock = threading.Lock()
+
+# ====================================================================================================
+# Chat histories kept per (subject, visitor session). The history sent with a question is limited to a
+# token budget: the most recent turns are sent verbatim and older turns are folded into a rolling summary
+# by summarize(previous_summary, turns) on a background thread. Sessions that have been idle for longer
+# than idle_seconds are dropped.
+
+class ChatMemory:
+
+  def __init__(self, summarize, model_name: str = "gpt-3.5-turbo", token_budget: int = 1500, keep_recent_turns: int = 2, idle_seconds: float = 1800, max_workers: int = 2):
+    self.summarize = summarize
+    self.token_budget = token_budget
+    self.keep_recent_turns = keep_recent_turns
+    self.idle_seconds = idle_seconds
+    self.model_name = model_name
+    # Loading an encoding can download its BPE ranks, so it is done on first use
+    self.encoding = None
+
+    self._lock = threading.Lock()
+    self._sessions = {}
+    self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    self.compactions = 0
+    self.compaction_failures = 0
+    self.evictions = 0
+
+  def count_tokens(self, text: str) -> int:
+    if self.encoding == None:
+      try:
+        self.encoding = tiktoken.encoding_for_model(self.model_name)
+      except KeyError:
+        self.encoding = tiktoken.get_encoding("cl100k_base")
+    return len(self.encoding.encode(text))
+
+  # ====================================================================================================
+
+  # The history to send with the next question, as the (question, answer) pairs the chains expect
+  def get_history(self, subject_id: str, session_id: str = DEFAULT_SESSION_ID):
+    session = self._session(subject_id, session_id)
+    with session.lock:
+      return self._fit_history(session.summary, session.turns)
+
+  def append(self, subject_id: str, session_id: str, question: str, answer: str):
+    session = self._session(subject_id, session_id)
+    with session.lock:
+      session.turns.append((question, answer, self.count_tokens(question) + self.count_tokens(answer)))
+      over_budget = self.count_tokens(session.summary) + sum(tokens for q, a, tokens in session.turns) > self.token_budget
+      if (over_budget and not session.compacting and len(session.turns) > self.keep_recent_turns):
+        session.compacting = True
+        self._executor.submit(self._compact, session)
+
+  def clear(self, subject_id: str, session_id: str = None):
+    with self._lock:
+      for key in list(self._sessions.keys()):
+        if (key[0] == subject_id and (session_id == None or key[1] == session_id)):
+          del self._sessions[key]
+
+  def stats(self):
+    with self._lock:
+      return {
+        "sessions": len(self._sessions),
+        "compactions": self.compactions,
+        "compaction_failures": self.compaction_failures,
+        "evictions": self.evictions,
+      }
+
+  # ====================================================================================================
+
+  # The summary and as many of the most recent (question, answer, token count) turns as fit in the budget
+  def _fit_history(self, summary: str, turns):
+    budget = self.token_budget
+    history = []
+    if summary:
+      budget -= self.count_tokens(summary)
+    for question, answer, tokens in reversed(turns):
+      if (tokens > budget and history):
+        break
+      history.insert(0, (question, answer))
+      budget -= tokens
+    if summary:
+      history.insert(0, (SUMMARY_QUESTION, summary))
+    return history
+
+  def _session(self, subject_id: str, session_id: str) -> ChatSession:
+    now = time.monotonic()
+    with self._lock:
+      self._evict_idle(now)
+      key = (subject_id, session_id if session_id != None else DEFAULT_SESSION_ID)
+      session = self._sessions.get(key)
+      if session == None:
+        session = ChatSession()
+        self._sessions[key] = session
+      session.last_used = now
+      return session
+
+  # Must be called with self._lock held
+  def _evict_idle(self, now: float):
+    if self.idle_seconds == None:
+      return
+    for key in [key for key, session in self._sessions.items() if now - session.last_used > self.idle_seconds]:
+      del self._sessions[key]
+      self.evictions += 1
+
+  # Fold all but the most recent turns into the summary. The LLM call is made without holding the session
+  # lock, and turns appended meanwhile are kept.
+  def _compact(self, session: ChatSession):
+    try:
+      with session.lock:
+        compacted = session.turns[:len(session.turns) - self.keep_recent_turns]
+        previous_summary = session.summary
+      summary = self.summarize(previous_summary, [(question, answer) for question, answer, tokens in compacted])
+      with session.lock:
+        session.summary = summary
+        session.turns = session.turns[len(compacted):]
+      with self._lock:
+        self.compactions += 1
+    except Exception as e:
+      print("Unable to compact chat history: " + str(e))
+      with self._lock:
+        self.compaction_failures += 1
+    finally:
+      with session.lock:
+        session.compacting = False
+
+# ====================================================================================================
+# A ChatMemory whose sessions are kept in a SessionStore, so that the worker processes of a pre-fork server
+# share them. A session is compacted by whichever worker first finds it over budget; the store's claim
+# keeps other workers from compacting it at the same time.
+
+class SharedChatMemory(ChatMemory):
+
+  def __init__(self, store, summarize, compaction_lease_seconds: float = 120, **kwargs):
+    super().__init__(summarize, **kwargs)
+    self.store = store
+    self.compaction_lease_seconds = compaction_lease_seconds
+
+  def get_history(self, subject_id: str, session_id: str = DEFAULT_SESSION_ID):
+    summary, turns = self.store.get_chat_session(subject_id, session_id if session_id != None else DEFAULT_SESSION_ID)
+    return self._fit_history(summary, [(question, answer, tokens) for turn_id, question, answer, tokens in turns])
+
+  def append(self, subject_id: str, session_id: str, question: str, answer: str):
+    session_id = session_id if session_id != None else DEFAULT_SESSION_ID
+    self._evict_idle_sessions()
+    self.store.append_chat_turn(subject_id, session_id, question, answer, self.count_tokens(question) + self.count_tokens(answer))
+    summary, turns = self.store.get_chat_session(subject_id, session_id)
+    over_budget = self.count_tokens(summary) + sum(turn[3] for turn in turns) > self.token_budget
+    if (over_budget and len(turns) > self.keep_recent_turns and self.store.claim_compaction(subject_id, session_id, self.compaction_lease_seconds)):
+      self._executor.submit(self._compact_shared, subject_id, session_id)
+
+  def clear(self, subject_id: str, session_id: str = None):
+    self.store.clear_chat_sessions(subject_id, session_id)
+
+  def stats(self):
+    stats = super().stats()
+    stats["sessions"] = self.store.chat_session_count()
+    return stats
+
+  # ====================================================================================================
+
+  def _evict_idle_sessions(self):
+    if self.idle_seconds == None:
+      return
+    evicted = self.store.evict_idle_chat_sessions(self.idle_seconds)
+    with self._lock:
+      self.evictions += evicted
+
+  def _compact_shared(self, subject_id: str, session_id: str):
+    try:
+      summary, turns = self.store.get_chat_session(subject_id, session_id)
+      compacted = turns[:len(turns) - self.keep_recent_turns]
+      if not compacted:
+        self.store.release_compaction(subject_id, session_id)
+        return
+      summary = self.summarize(summary, [(question, answer) for turn_id, question, answer, tokens in compacted])
+      self.store.save_chat_summary(subject_id, session_id, summary, compacted[-1][0])
+      with self._lock:
+        self.compactions += 1
+    except Exception as e:
+      print("Unable to compact chat history: " + str(e))
+      self.store.release_compaction(subject_id, session_id)
+      with self._lock:
+        self.compaction_failures += 1
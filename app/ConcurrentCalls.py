@@ -0,0 +1,69 @@
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# ====================================================================================================
+# The outcome of a single call made by map_ordered. Exactly one of value or error is meaningful.
+
+class CallResult:
+  def __init__(self, item, value = None, error: Exception = None):
+    self.item = item
+    self.value = value
+    self.error = error
+
+  @property
+  def ok(self) -> bool:
+    return self.error == None
+
+# ====================================================================================================
+# Call func(item) for every item using up to max_workers threads and return a CallResult per item in
+# the order of the items. A call that raises, or that runs for longer than timeout_seconds after it
+# started, is reported as an error instead of failing the other calls. Timed-out calls cannot be
+# interrupted, so their threads are abandoned to finish in the background. Each call runs in a copy of
+# the caller's context, so context variables such as the request trace are visible to func.
+
+def map_ordered(func, items, max_workers: int, timeout_seconds: float = None):
+  items = list(items)
+  results = [None] * len(items)
+  if not items:
+    return results
+
+  started = {}
+
+  def run(i, item):
+    started[i] = time.monotonic()
+    return func(item)
+
+  executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))))
+  futures = {executor.submit(contextvars.copy_context().run, run, i, item): i for i, item in enumerate(items)}
+  pending = set(futures)
+  try:
+    while pending:
+      done, pending = wait(pending, timeout=_next_deadline(pending, futures, started, timeout_seconds), return_when=FIRST_COMPLETED)
+      for future in done:
+        i = futures[future]
+        try:
+          results[i] = CallResult(items[i], value=future.result())
+        except Exception as e:
+          results[i] = CallResult(items[i], error=e)
+
+      if timeout_seconds != None:
+        now = time.monotonic()
+        for future in list(pending):
+          i = futures[future]
+          if (i in started and now - started[i] >= timeout_seconds):
+            pending.remove(future)
+            results[i] = CallResult(items[i], error=TimeoutError("Call timed out after " + str(timeout_seconds) + " seconds"))
+  finally:
+    executor.shutdown(wait=False, cancel_futures=True)
+  return results
+
+# Seconds until the earliest running call reaches its timeout (or None to wait for the next completion)
+def _next_deadline(pending, futures, started, timeout_seconds):
+  if timeout_seconds == None:
+    return None
+  now = time.monotonic()
+  remaining = [started[futures[future]] + timeout_seconds - now for future in pending if futures[future] in started]
+  if not remaining:
+    return timeout_seconds
+  return max(0.0, min(remaining))
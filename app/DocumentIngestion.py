@@ -0,0 +1,183 @@
+import os
+import time
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# ====================================================================================================
+# Parses the documents of a subject for indexing. Plain text and markdown files are read directly, without
+# the unstructured stack. PDFs, Word documents and images (OCR) are parsed with unstructured in a pool of
+# worker processes, so several heavy files are parsed at once and their memory is returned to the OS when
+# the pool shuts down. Each file is split into chunks as soon as it has been parsed and handed to the
+# caller, which embeds the chunks in batches (see IndexManifest.sync_index) while other files are still
+# being parsed. The time and size of the parsing are reported per file type, and with measure_memory the
+# peak memory of each parse too (tracemalloc slows parsing down severalfold, so it is off unless asked for).
+#
+# The worker processes are spawned, so they import the __main__ module of the parent as __mp_main__: an
+# entry point that may ingest documents must guard its startup code with if __name__ == "__main__", and
+# must not build a service at import time when it is imported as __mp_main__ (see APIServer).
+
+FAST_PATH_EXTENSIONS = (".txt", ".md", ".markdown")
+
+def file_type(path: str) -> str:
+  return os.path.splitext(path)[1].lower() or "(none)"
+
+# The fast path reads the whole file into one string, which is all it allocates
+def read_text_file(path: str, measure_memory: bool = False):
+  with open(path, "r", encoding="utf-8", errors="replace") as f:
+    text = f.read()
+  return [(text, {"source": path})], (len(text.encode("utf-8")) if measure_memory else 0)
+
+# Runs in a worker process, one file at a time. Returns the (text, metadata) of each element unstructured
+# found (which unlike langchain Documents is cheap to send back to the parent), the parse time, and with
+# measure_memory the peak memory the parse allocated on the Python heap, measured for this file alone (0
+# otherwise). Memory allocated outside the Python allocator (e.g. by native PDF or OCR libraries) is not included.
+def parse_with_unstructured(path: str, measure_memory: bool = False):
+  from langchain.document_loaders import UnstructuredFileLoader
+  if not measure_memory:
+    start = time.perf_counter()
+    parts = [(document.page_content, document.metadata) for document in UnstructuredFileLoader(path).load()]
+    return parts, time.perf_counter() - start, 0
+  tracemalloc.start()
+  start = time.perf_counter()
+  try:
+    parts = [(document.page_content, document.metadata) for document in UnstructuredFileLoader(path).load()]
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+  return parts, time.perf_counter() - start, peak_bytes
+
+# ====================================================================================================
+
+class FileTypeStats:
+  def __init__(self):
+    self.files = 0
+    self.failures = 0
+    self.bytes = 0
+    self.chunks = 0
+    self.parse_seconds = 0.0
+    self.peak_parse_bytes = 0
+
+  def as_dict(self):
+    return {
+      "files": self.files,
+      "failures": self.failures,
+      "bytes": self.bytes,
+      "chunks": self.chunks,
+      "parse_seconds": self.parse_seconds,
+      "mb_per_second": (self.bytes / 1e6 / self.parse_seconds) if self.parse_seconds > 0 else None,
+      "peak_parse_bytes": self.peak_parse_bytes,
+    }
+
+class IngestionPipeline:
+
+  # text_splitter splits the langchain Documents of a file into chunks. max_workers is the size of the process
+  # pool that parses the files not on the fast path (the number of CPUs by default). measure_memory reports
+  # the peak memory of each parse, at the cost of slower parsing.
+  def __init__(self, text_splitter, max_workers: int = None, measure_memory: bool = False):
+    self.text_splitter = text_splitter
+    self.max_workers = max_workers
+    self.measure_memory = measure_memory
+    self.stats = {}
+    self.seconds = 0.0
+
+  # Parse and split the files, yielding (path, chunks) for each file as soon as it is ready: the fast path
+  # files first, then the other files in the order their parsing finishes. A file that cannot be parsed is
+  # reported and skipped.
+  def load_chunks(self, paths):
+    start = time.perf_counter()
+    paths = list(paths)
+    slow_paths = [path for path in paths if file_type(path) not in FAST_PATH_EXTENSIONS]
+    try:
+      for path in paths:
+        if file_type(path) not in FAST_PATH_EXTENSIONS:
+          continue
+        parse_start = time.perf_counter()
+        try:
+          parts, parse_bytes = read_text_file(path, self.measure_memory)
+        except Exception as e:
+          self._record_failure(path, e)
+          continue
+        yield path, self._split(path, parts, time.perf_counter() - parse_start, parse_bytes)
+
+      if slow_paths:
+        # Spawned rather than forked workers, since the parent is usually a threaded server
+        workers = self.max_workers or min(len(slow_paths), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+          futures = {executor.submit(parse_with_unstructured, path, self.measure_memory): path for path in slow_paths}
+          for future in as_completed(futures):
+            path = futures[future]
+            try:
+              parts, parse_seconds, parse_bytes = future.result()
+            except Exception as e:
+              self._record_failure(path, e)
+              continue
+            yield path, self._split(path, parts, parse_seconds, parse_bytes)
+    finally:
+      self.seconds += time.perf_counter() - start
+
+  def report(self):
+    return {
+      "seconds": self.seconds,
+      # peak_parse_bytes is only measured with measure_memory
+      "memory_measured": self.measure_memory,
+      "file_types": {extension: stats.as_dict() for extension, stats in sorted(self.stats.items())},
+    }
+
+  def __str__(self):
+    lines = ["Ingested in " + format(self.seconds, ".2f") + "s:"]
+    for extension, stats in sorted(self.stats.items()):
+      throughput = stats.as_dict()["mb_per_second"]
+      lines.append("  " + extension + ": " + str(stats.files) + " files (" + str(stats.failures) + " failed), " +
+        format(stats.bytes / 1e6, ".2f") + " MB, " + str(stats.chunks) + " chunks, " + format(stats.parse_seconds, ".2f") + "s parsing" +
+        ((", " + format(throughput, ".2f") + " MB/s") if throughput != None else "") +
+        ((", largest parse " + format(stats.peak_parse_bytes / 1e6, ".1f") + " MB") if self.measure_memory else ""))
+    return "\n".join(lines)
+
+  # ====================================================================================================
+
+  # parse_bytes is the peak memory the parsing of this one file allocated
+  def _split(self, path: str, parts, parse_seconds: float, parse_bytes: int):
+    from langchain.schema import Document
+    chunks = self.text_splitter.split_documents([Document(page_content=text, metadata=metadata) for text, metadata in parts])
+    stats = self._stats_for(path)
+    stats.files += 1
+    stats.bytes += os.path.getsize(path)
+    stats.chunks += len(chunks)
+    stats.parse_seconds += parse_seconds
+    stats.peak_parse_bytes = max(stats.peak_parse_bytes, parse_bytes)
+    return chunks
+
+  def _record_failure(self, path: str, error: Exception):
+    print("Unable to parse " + path + ": " + str(error))
+    self._stats_for(path).failures += 1
+
+  def _stats_for(self, path: str) -> FileTypeStats:
+    extension = file_type(path)
+    if extension not in self.stats:
+      self.stats[extension] = FileTypeStats()
+    return self.stats[extension]
+
+# ====================================================================================================
+# Parse and chunk a folder without embedding it, to measure ingestion:
+#   python DocumentIngestion.py ../non_parsed_personal_docs [--workers 4] [--chunk-size 1000] [--chunk-overlap 0] [--measure-memory]
+
+def main():
+  import argparse
+  import IndexManifest
+  from langchain.text_splitter import RecursiveCharacterTextSplitter
+  parser = argparse.ArgumentParser(description="Parse and chunk the documents in a folder and report the ingestion throughput per file type")
+  parser.add_argument("folder")
+  parser.add_argument("--workers", type=int, default=None)
+  parser.add_argument("--chunk-size", type=int, default=1000)
+  parser.add_argument("--chunk-overlap", type=int, default=0)
+  parser.add_argument("--measure-memory", action="store_true", help="Report the peak memory of each parse (slows parsing down)")
+  args = parser.parse_args()
+
+  pipeline = IngestionPipeline(RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap), max_workers=args.workers, measure_memory=args.measure_memory)
+  for path, chunks in pipeline.load_chunks(IndexManifest.list_document_files(args.folder)):
+    print(path + ": " + str(len(chunks)) + " chunks")
+  print(pipeline)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,235 @@
+import os
+import re
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# ====================================================================================================
+# Renders generated documents (cover letters, resumes) to files on a pool of worker threads, off the path
+# of the request or generation that produced them. Each requested format of a document is rendered in
+# parallel and written atomically (to a temporary file that is then renamed), so a reader never sees a
+# partially written document. A RenderJob is the handle to poll, wait on, or download the results.
+#
+# PDF rendering needs fpdf and DOCX rendering needs python-docx. They are imported once, on first use, and
+# a format whose library is missing fails on its own without failing the other formats of the job.
+
+FORMATS = ("pdf", "md", "docx", "txt")
+EXTENSIONS = {"pdf": ".pdf", "md": ".md", "docx": ".docx", "txt": ".txt"}
+MEDIA_TYPES = {
+  "pdf": "application/pdf",
+  "md": "text/markdown; charset=utf-8",
+  "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+  "txt": "text/plain; charset=utf-8",
+}
+
+def safe_file_name(name: str) -> str:
+  return re.sub(r"[\\/:*?\"<>|\x00-\x1f]+", "_", name).strip(" .") or "document"
+
+# Write a file through write(temp_path) and move it into place
+def write_atomic(path: str, write):
+  temp_path = path + "." + uuid.uuid4().hex + ".tmp"
+  try:
+    write(temp_path)
+    os.replace(temp_path, path)
+  finally:
+    if os.path.exists(temp_path):
+      os.remove(temp_path)
+
+# ====================================================================================================
+
+def render_txt(text: str, path: str, title: str = None):
+  def write(temp_path):
+    with open(temp_path, "w", encoding="utf-8") as f:
+      f.write(text)
+  write_atomic(path, write)
+
+def render_md(text: str, path: str, title: str = None):
+  def write(temp_path):
+    with open(temp_path, "w", encoding="utf-8") as f:
+      if title:
+        f.write("# " + title + "\n\n")
+      f.write(text)
+  write_atomic(path, write)
+
+_import_lock = threading.Lock()
+_fpdf_class = None
+
+def render_pdf(text: str, path: str, title: str = None):
+  global _fpdf_class
+  with _import_lock:
+    if _fpdf_class == None:
+      from fpdf import FPDF
+      _fpdf_class = FPDF
+  pdf = _fpdf_class()
+  pdf.add_page()
+  pdf.set_font("Arial", size=12)
+  # The core PDF fonts only cover Latin-1, so other characters are replaced instead of failing the document
+  pdf.multi_cell(0, 5, text.encode("latin-1", "replace").decode("latin-1"))
+  write_atomic(path, lambda temp_path: pdf.output(temp_path))
+
+def render_docx(text: str, path: str, title: str = None):
+  import docx
+  document = docx.Document()
+  if title:
+    document.add_heading(title, level=1)
+  for paragraph in text.split("\n\n"):
+    document.add_paragraph(paragraph.strip("\n"))
+  write_atomic(path, lambda temp_path: document.save(temp_path))
+
+RENDERERS = {"pdf": render_pdf, "md": render_md, "docx": render_docx, "txt": render_txt}
+
+# ====================================================================================================
+
+class RenderJob:
+  def __init__(self, name: str, formats, output_folder: str):
+    self.id = uuid.uuid4().hex
+    self.name = safe_file_name(name)
+    self.formats = list(formats)
+    self.output_folder = output_folder
+    # "pending" or "generating" (waiting for its text), "rendering", "done" or "failed" (the text could not be
+    # generated or no format could be rendered)
+    self.status = "pending"
+    self.outputs = {}
+    self.errors = {}
+    self.created = time.time()
+    self.finished = None
+    self._remaining = len(self.formats)
+    self._event = threading.Event()
+
+  # A read-only copy of a job from its as_dict(), e.g. one rendered by another worker process
+  @classmethod
+  def from_dict(cls, data, output_folder: str):
+    job = cls(data["name"], data["formats"], output_folder)
+    job.id = data["id"]
+    job.status = data["status"]
+    job.outputs = dict(data["outputs"])
+    job.errors = dict(data["errors"])
+    job._remaining = 0
+    if job.status in ("done", "failed"):
+      job.finished = job.created + (data["seconds"] or 0)
+      job._event.set()
+    return job
+
+  def output_path(self, format: str) -> str:
+    return os.path.join(self.output_folder, self.name + EXTENSIONS[format])
+
+  def wait(self, timeout: float = None) -> bool:
+    return self._event.wait(timeout)
+
+  def done(self) -> bool:
+    return self._event.is_set()
+
+  def as_dict(self):
+    return {
+      "id": self.id,
+      "name": self.name,
+      "status": self.status,
+      "formats": self.formats,
+      "outputs": dict(self.outputs),
+      "errors": dict(self.errors),
+      "seconds": (self.finished - self.created) if self.finished != None else None,
+    }
+
+class DocumentRenderer:
+
+  def __init__(self, output_folder: str, max_workers: int = 4, max_jobs: int = 1000):
+    self.output_folder = os.path.expanduser(output_folder)
+    self.max_jobs = max_jobs
+    self._lock = threading.Lock()
+    self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="render")
+    # The most recent jobs, so their handles can be polled
+    self._jobs = OrderedDict()
+
+    self.rendered = 0
+    self.failures = 0
+    self.seconds_rendering = 0.0
+
+  # ====================================================================================================
+
+  # Render text to the given formats as files named name + extension. on_done(job) is called on a worker
+  # thread once every format has been rendered or has failed.
+  def submit(self, text: str, name: str, formats = ("pdf",), title: str = None, on_done = None) -> RenderJob:
+    job = self.create_job(name, formats)
+    self.render(job, text, title, on_done)
+    return job
+
+  # A job whose text is not known yet, e.g. because the document is still being generated. Call render or
+  # fail when it is. The files are written to subfolder of the output folder, if given, and to a folder of
+  # their own if per_job_folder is set, so that jobs with the same name never overwrite each other.
+  def create_job(self, name: str, formats = ("pdf",), subfolder: str = None, per_job_folder: bool = False) -> RenderJob:
+    unknown = [format for format in formats if format not in RENDERERS]
+    if unknown:
+      raise ValueError("Unknown document formats: " + ", ".join(unknown))
+    job = RenderJob(name, formats, self.output_folder)
+    if subfolder:
+      job.output_folder = os.path.join(job.output_folder, safe_file_name(subfolder))
+    if per_job_folder:
+      job.output_folder = os.path.join(job.output_folder, job.id)
+    with self._lock:
+      self._jobs[job.id] = job
+      while len(self._jobs) > self.max_jobs:
+        self._jobs.popitem(last=False)
+    return job
+
+  def render(self, job: RenderJob, text: str, title: str = None, on_done = None):
+    os.makedirs(job.output_folder, exist_ok=True)
+    job.status = "rendering"
+    if not job.formats:
+      self._finish(job, on_done)
+    for format in job.formats:
+      self._executor.submit(self._render_format, job, format, text, title, on_done)
+
+  def fail(self, job: RenderJob, error: Exception):
+    job.errors["generation"] = str(error)
+    job.status = "failed"
+    job.finished = time.time()
+    job._event.set()
+
+  def get(self, job_id: str) -> RenderJob:
+    with self._lock:
+      return self._jobs.get(job_id)
+
+  def stats(self):
+    with self._lock:
+      return {
+        "jobs": len(self._jobs),
+        "rendered": self.rendered,
+        "failures": self.failures,
+        "seconds_rendering": self.seconds_rendering,
+      }
+
+  # ====================================================================================================
+
+  def _render_format(self, job: RenderJob, format: str, text: str, title: str, on_done):
+    start = time.perf_counter()
+    path = job.output_path(format)
+    try:
+      RENDERERS[format](text, path, title)
+      error = None
+    except Exception as e:
+      error = e
+    elapsed = time.perf_counter() - start
+    with self._lock:
+      self.seconds_rendering += elapsed
+      if error == None:
+        self.rendered += 1
+        job.outputs[format] = path
+      else:
+        self.failures += 1
+        job.errors[format] = str(error)
+      job._remaining -= 1
+      finished = job._remaining == 0
+    if finished:
+      self._finish(job, on_done)
+
+  def _finish(self, job: RenderJob, on_done):
+    job.status = "done" if (job.outputs or not job.formats) else "failed"
+    job.finished = time.time()
+    job._event.set()
+    if on_done != None:
+      try:
+        on_done(job)
+      except Exception as e:
+        print("Error after rendering " + job.name + ": " + str(e))
@@ -0,0 +1,194 @@
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from array import array
+
+from langchain.embeddings.base import Embeddings
+
+import SQLiteConnection as SQLiteConnection
+
+# ====================================================================================================
+# An Embeddings wrapper that stores every vector it computes in a SQLite database keyed by the
+# embedding model name and a hash of the text. Document chunks and query strings share the cache, so
+# index rebuilds and recurring questions only pay for text that has never been embedded before.
+#
+# A hit does not write to the database: the last use of the entries that were hit is recorded in memory
+# and written in one batch with the next store, or once touch_flush_size entries or touch_flush_seconds
+# have accumulated. The number of entries is counted once and then tracked as entries are added, so the
+# least recently used entries are only counted and evicted when the cache goes over max_entries, and then
+# down to evict_to_fraction of it. With several processes each tracks its own additions, so the cache can
+# briefly hold more than max_entries until one of them evicts.
+
+class CachedEmbeddings(Embeddings):
+
+  def __init__(self, embeddings: Embeddings, cache_path: str, model_name: str = None, max_entries: int = 100000,
+               evict_to_fraction: float = 0.9, touch_flush_size: int = 256, touch_flush_seconds: float = 30):
+    self.embeddings = embeddings
+    self.cache_path = cache_path
+    self.model_name = model_name if model_name != None else getattr(embeddings, "model", type(embeddings).__name__)
+    self.max_entries = max_entries
+    self.evict_to_fraction = evict_to_fraction
+    self.touch_flush_size = touch_flush_size
+    self.touch_flush_seconds = touch_flush_seconds
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+    self._lock = threading.Lock()
+    cache_folder = os.path.dirname(cache_path)
+    if cache_folder:
+      os.makedirs(cache_folder, exist_ok=True)
+    self._sqlite = SQLiteConnection.SQLiteConnection(cache_path)
+    # text_hash -> when it was last hit, not yet written to the database
+    self._touched = {}
+    self._touches_flushed = time.monotonic()
+    self._entry_count = None
+    self._connection.execute("CREATE TABLE IF NOT EXISTS embeddings (model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (model, text_hash))")
+    self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+    self._connection.commit()
+
+  # ====================================================================================================
+
+  def embed_documents(self, texts):
+    vectors = self._lookup(texts)
+    missing = [i for i, vector in enumerate(vectors) if vector == None]
+    if missing:
+      # Embed each distinct missing text once, in a single call to the underlying embeddings
+      missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+      computed = dict(zip(missing_texts, self.embeddings.embed_documents(missing_texts)))
+      self._store(computed)
+      for i in missing:
+        vectors[i] = computed[texts[i]]
+    return vectors
+
+  def embed_query(self, text):
+    vector = self._lookup([text])[0]
+    if vector == None:
+      vector = self.embeddings.embed_query(text)
+      self._store({text: vector})
+    return vector
+
+  # The cache and the wrapped embeddings are synchronous, so async callers run them on a worker thread
+  async def aembed_documents(self, texts):
+    return await asyncio.to_thread(self.embed_documents, texts)
+
+  async def aembed_query(self, text):
+    return await asyncio.to_thread(self.embed_query, text)
+
+  # Store vectors that were computed elsewhere (e.g. imported from an existing index) for the given texts
+  def seed(self, texts, vectors):
+    self._store({text: [float(value) for value in vector] for text, vector in zip(texts, vectors)})
+
+  # ====================================================================================================
+
+  def stats(self):
+    with self._lock:
+      entries = self._entries()
+    lookups = self.hits + self.misses
+    return {
+      "model": self.model_name,
+      "entries": entries,
+      "max_entries": self.max_entries,
+      "hits": self.hits,
+      "misses": self.misses,
+      "hit_rate": (self.hits / lookups) if lookups else 0.0,
+      "evictions": self.evictions,
+    }
+
+  def clear(self):
+    with self._lock:
+      self._touched.clear()
+      self._connection.execute("DELETE FROM embeddings WHERE model = ?", (self.model_name,))
+      self._connection.commit()
+      self._entry_count = None
+
+  def close(self):
+    with self._lock:
+      if self._sqlite.is_open():
+        self._flush_touches()
+        self._connection.commit()
+      self._sqlite.close()
+      self._entry_count = None
+
+  # Opened on first use in each process (see SQLiteConnection)
+  @property
+  def _connection(self):
+    # Last uses recorded by the parent of a forked process are the parent's to write
+    if self._sqlite.opened_before_fork():
+      self._touched.clear()
+      self._entry_count = None
+    return self._sqlite.get()
+
+  # ====================================================================================================
+
+  def _key(self, text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+  def _lookup(self, texts):
+    keys = [self._key(text) for text in texts]
+    found = {}
+    with self._lock:
+      # Stay well below SQLite's limit on the number of bound parameters
+      for start in range(0, len(keys), 500):
+        batch = keys[start:start + 500]
+        rows = self._connection.execute(
+          "SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN (" + ",".join("?" * len(batch)) + ")",
+          [self.model_name] + batch).fetchall()
+        for text_hash, blob in rows:
+          vector = array("f")
+          vector.frombytes(blob)
+          found[text_hash] = vector.tolist()
+      if found:
+        now = time.time()
+        for text_hash in found:
+          self._touched[text_hash] = now
+        if (len(self._touched) >= self.touch_flush_size or time.monotonic() - self._touches_flushed >= self.touch_flush_seconds):
+          self._flush_touches()
+          self._connection.commit()
+      vectors = [found.get(key) for key in keys]
+      hit_count = sum(1 for vector in vectors if vector != None)
+      self.hits += hit_count
+      self.misses += len(vectors) - hit_count
+    return vectors
+
+  def _store(self, vectors_by_text):
+    now = time.time()
+    rows = [(self.model_name, self._key(text), array("f", vector).tobytes(), now) for text, vector in vectors_by_text.items()]
+    with self._lock:
+      entries = self._entries()
+      # A text that is already cached keeps its vector, which was computed by the same model
+      cursor = self._connection.executemany("INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)", rows)
+      self._entry_count = entries + max(cursor.rowcount, 0)
+      self._flush_touches()
+      self._evict()
+      self._connection.commit()
+
+  # ====================================================================================================
+  # Must be called with self._lock held
+
+  def _entries(self) -> int:
+    if self._entry_count == None:
+      self._entry_count = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    return self._entry_count
+
+  def _flush_touches(self):
+    if self._touched:
+      self._connection.executemany("UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+        [(last_used, self.model_name, text_hash) for text_hash, last_used in self._touched.items()])
+      self._touched.clear()
+    self._touches_flushed = time.monotonic()
+
+  # Drops the least recently used entries once there are more than max_entries, down to evict_to_fraction of it
+  def _evict(self):
+    if (self.max_entries == None or self._entries() <= self.max_entries):
+      return
+    # Other processes may have added entries too, so count them before evicting
+    count = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    excess = count - int(self.max_entries * self.evict_to_fraction)
+    if excess > 0:
+      self._connection.execute("DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)", (excess,))
+      self.evictions += excess
+    self._entry_count = count - max(excess, 0)
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+import SQLiteConnection as SQLiteConnection
+
+# ====================================================================================================
+# Persists the intermediate results of cover letter generation in a SQLite database so that a job
+# description seen before, or a qualification shared by several job descriptions, is not sent to the LLM
+# again:
+#
+#   qualifications: hash of the job description -> the qualifications extracted from it
+#   skills:         (subject, index version, normalized qualification) -> the candidate's experience bullet
+#
+# Skills are keyed by the version of the subject's index, so they are never reused after the subject's
+# documents change, and invalidate_subject drops the rows of older versions. Each table keeps at most
+# max_entries rows, evicting the least recently used. As in EmbeddingCache, a hit does not write to the
+# database: its last use is recorded in memory and written in one batch with the next store, or once
+# touch_flush_size entries or touch_flush_seconds have accumulated.
+
+def normalize_qualification(qualification: str) -> str:
+  return " ".join(qualification.lower().split()).rstrip(".;:, ")
+
+def hash_job_description(job_desc: str) -> str:
+  return hashlib.sha256(job_desc.strip().encode("utf-8")).hexdigest()
+
+class GenerationMemo:
+
+  def __init__(self, cache_path: str, max_entries: int = 10000, touch_flush_size: int = 256, touch_flush_seconds: float = 30):
+    self.cache_path = cache_path
+    self.max_entries = max_entries
+    self.touch_flush_size = touch_flush_size
+    self.touch_flush_seconds = touch_flush_seconds
+
+    self.qualification_hits = 0
+    self.qualification_misses = 0
+    self.skill_hits = 0
+    self.skill_misses = 0
+    self.evictions = 0
+    self.invalidations = 0
+
+    self._lock = threading.Lock()
+    cache_folder = os.path.dirname(cache_path)
+    if cache_folder:
+      os.makedirs(cache_folder, exist_ok=True)
+    self._sqlite = SQLiteConnection.SQLiteConnection(cache_path)
+    # job_hash / (subject_id, index_version, qualification) -> when it was last hit, not yet written to the database
+    self._touched_qualifications = {}
+    self._touched_skills = {}
+    self._touches_flushed = time.monotonic()
+    self._connection.execute("CREATE TABLE IF NOT EXISTS qualifications (job_hash TEXT PRIMARY KEY, qualifications TEXT NOT NULL, last_used REAL NOT NULL)")
+    self._connection.execute("CREATE TABLE IF NOT EXISTS skills (subject_id TEXT NOT NULL, index_version TEXT NOT NULL, qualification TEXT NOT NULL, skill TEXT NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (subject_id, index_version, qualification))")
+    self._connection.execute("CREATE INDEX IF NOT EXISTS qualifications_last_used ON qualifications (last_used)")
+    self._connection.execute("CREATE INDEX IF NOT EXISTS skills_last_used ON skills (last_used)")
+    self._connection.commit()
+
+  # ====================================================================================================
+
+  def get_qualifications(self, job_desc: str):
+    job_hash = hash_job_description(job_desc)
+    with self._lock:
+      row = self._connection.execute("SELECT qualifications FROM qualifications WHERE job_hash = ?", (job_hash,)).fetchone()
+      if row == None:
+        self.qualification_misses += 1
+        return None
+      self._touched_qualifications[job_hash] = time.time()
+      self._flush_touches_if_due()
+      self.qualification_hits += 1
+      return json.loads(row[0])
+
+  def put_qualifications(self, job_desc: str, qualifications):
+    with self._lock:
+      self._connection.execute("INSERT OR REPLACE INTO qualifications (job_hash, qualifications, last_used) VALUES (?, ?, ?)",
+        (hash_job_description(job_desc), json.dumps(qualifications), time.time()))
+      self._flush_touches()
+      self._evict("qualifications")
+      self._connection.commit()
+
+  def get_skill(self, subject_id: str, index_version: str, qualification: str):
+    key = (subject_id, index_version or "", normalize_qualification(qualification))
+    with self._lock:
+      row = self._connection.execute("SELECT skill FROM skills WHERE subject_id = ? AND index_version = ? AND qualification = ?", key).fetchone()
+      if row == None:
+        self.skill_misses += 1
+        return None
+      self._touched_skills[key] = time.time()
+      self._flush_touches_if_due()
+      self.skill_hits += 1
+      return row[0]
+
+  def put_skill(self, subject_id: str, index_version: str, qualification: str, skill: str):
+    with self._lock:
+      self._connection.execute("INSERT OR REPLACE INTO skills (subject_id, index_version, qualification, skill, last_used) VALUES (?, ?, ?, ?, ?)",
+        (subject_id, index_version or "", normalize_qualification(qualification), skill, time.time()))
+      self._flush_touches()
+      self._evict("skills")
+      self._connection.commit()
+
+  # Drop the skills of a subject that were found in any index version other than current_index_version
+  # (all of them if it is None)
+  def invalidate_subject(self, subject_id: str, current_index_version: str = None):
+    with self._lock:
+      if current_index_version == None:
+        cursor = self._connection.execute("DELETE FROM skills WHERE subject_id = ?", (subject_id,))
+      else:
+        cursor = self._connection.execute("DELETE FROM skills WHERE subject_id = ? AND index_version != ?", (subject_id, current_index_version))
+      self.invalidations += cursor.rowcount
+      self._connection.commit()
+
+  # ====================================================================================================
+
+  def stats(self):
+    with self._lock:
+      qualification_entries = self._connection.execute("SELECT COUNT(*) FROM qualifications").fetchone()[0]
+      skill_entries = self._connection.execute("SELECT COUNT(*) FROM skills").fetchone()[0]
+      return {
+        "qualification_entries": qualification_entries,
+        "qualification_hits": self.qualification_hits,
+        "qualification_misses": self.qualification_misses,
+        "skill_entries": skill_entries,
+        "skill_hits": self.skill_hits,
+        "skill_misses": self.skill_misses,
+        "max_entries": self.max_entries,
+        "evictions": self.evictions,
+        "invalidations": self.invalidations,
+      }
+
+  def clear(self):
+    with self._lock:
+      self._touched_qualifications.clear()
+      self._touched_skills.clear()
+      self._connection.execute("DELETE FROM qualifications")
+      self._connection.execute("DELETE FROM skills")
+      self._connection.commit()
+
+  def close(self):
+    with self._lock:
+      if self._sqlite.is_open():
+        self._flush_touches()
+        self._connection.commit()
+      self._sqlite.close()
+
+  # Opened on first use in each process (see SQLiteConnection)
+  @property
+  def _connection(self):
+    # Last uses recorded by the parent of a forked process are the parent's to write
+    if self._sqlite.opened_before_fork():
+      self._touched_qualifications.clear()
+      self._touched_skills.clear()
+    return self._sqlite.get()
+
+  # ====================================================================================================
+  # Must be called with self._lock held
+
+  def _flush_touches(self):
+    if self._touched_qualifications:
+      self._connection.executemany("UPDATE qualifications SET last_used = ? WHERE job_hash = ?",
+        [(last_used, job_hash) for job_hash, last_used in self._touched_qualifications.items()])
+      self._touched_qualifications.clear()
+    if self._touched_skills:
+      self._connection.executemany("UPDATE skills SET last_used = ? WHERE subject_id = ? AND index_version = ? AND qualification = ?",
+        [(last_used,) + key for key, last_used in self._touched_skills.items()])
+      self._touched_skills.clear()
+    self._touches_flushed = time.monotonic()
+
+  def _flush_touches_if_due(self):
+    touched = len(self._touched_qualifications) + len(self._touched_skills)
+    if (touched >= self.touch_flush_size or time.monotonic() - self._touches_flushed >= self.touch_flush_seconds):
+      self._flush_touches()
+      self._connection.commit()
+
+  # Drops the least recently used rows of table over max_entries
+  def _evict(self, table: str):
+    if self.max_entries == None:
+      return
+    count = self._connection.execute("SELECT COUNT(*) FROM " + table).fetchone()[0]
+    excess = count - self.max_entries
+    if excess > 0:
+      self._connection.execute("DELETE FROM " + table + " WHERE rowid IN (SELECT rowid FROM " + table + " ORDER BY last_used ASC LIMIT ?)", (excess,))
+      self.evictions += excess
@@ -0,0 +1,254 @@
+import os
+import json
+import hashlib
+import contextlib
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+# The manifest records the content hash of every indexed file and the ids of the chunks that were
+# embedded for it, so that a refresh only re-chunks changed files and only re-embeds changed chunks.
+MANIFEST_FILE_NAME = "index_manifest.json"
+
+def hash_text(text: str) -> str:
+  return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def hash_file(path: str) -> str:
+  digest = hashlib.sha256()
+  with open(path, "rb") as f:
+    for block in iter(lambda: f.read(1 << 16), b""):
+      digest.update(block)
+  return digest.hexdigest()
+
+# Chunk ids are derived from the file and the chunk text so an unchanged chunk keeps its id (and its
+# vector) across refreshes. Repeated identical chunks within a file are disambiguated by occurrence.
+def chunk_ids_for(relative_path: str, chunk_texts):
+  ids = []
+  occurrences = {}
+  for text in chunk_texts:
+    base_id = hash_text(relative_path + "\0" + text)
+    occurrence = occurrences.get(base_id, 0)
+    occurrences[base_id] = occurrence + 1
+    ids.append(base_id if occurrence == 0 else base_id + "-" + str(occurrence))
+  return ids
+
+# ====================================================================================================
+
+class IndexManifest:
+
+  def __init__(self, files = None, settings = None):
+    # relative file path -> {"hash": file content hash, "chunk_ids": [chunk ids in file order]}
+    self.files = files if files != None else {}
+    # How the files were split into chunks (e.g. {"chunk_size": 1000, "chunk_overlap": 0})
+    self.settings = settings
+
+  @staticmethod
+  def path_for(persist_folder: str) -> str:
+    return os.path.join(persist_folder, MANIFEST_FILE_NAME)
+
+  @classmethod
+  def load(cls, persist_folder: str):
+    path = cls.path_for(persist_folder)
+    if not os.path.exists(path):
+      return None
+    with open(path, "r") as f:
+      data = json.load(f)
+    return cls(data.get("files", {}), data.get("settings"))
+
+  def save(self, persist_folder: str):
+    os.makedirs(persist_folder, exist_ok=True)
+    path = self.path_for(persist_folder)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+      json.dump({"version": self.version(), "settings": self.settings, "files": self.files}, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+  def all_chunk_ids(self):
+    return [chunk_id for entry in self.files.values() for chunk_id in entry["chunk_ids"]]
+
+  # A digest of the indexed content and of how it was chunked. It changes whenever any chunk is added,
+  # changed or removed.
+  def version(self) -> str:
+    digest = hashlib.sha256()
+    if self.settings != None:
+      digest.update(json.dumps(self.settings, sort_keys=True).encode("utf-8"))
+    for relative_path in sorted(self.files):
+      digest.update(relative_path.encode("utf-8"))
+      digest.update(self.files[relative_path]["hash"].encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+# ====================================================================================================
+
+class SyncResult:
+  def __init__(self, manifest: IndexManifest):
+    self.manifest = manifest
+    self.files_unchanged = 0
+    self.files_changed = 0
+    self.files_removed = 0
+    self.chunks_added = 0
+    self.chunks_deleted = 0
+    self.chunks_kept = 0
+
+  def __str__(self):
+    return ("files unchanged: " + str(self.files_unchanged) + ", changed: " + str(self.files_changed) + ", removed: " + str(self.files_removed) +
+            "; chunks kept: " + str(self.chunks_kept) + ", added: " + str(self.chunks_added) + ", deleted: " + str(self.chunks_deleted))
+
+def list_document_files(docs_folder: str):
+  paths = []
+  for root, dirs, files in os.walk(docs_folder):
+    dirs[:] = [d for d in dirs if not d.startswith(".")]
+    for file_name in files:
+      if not file_name.startswith("."):
+        paths.append(os.path.join(root, file_name))
+  return sorted(paths)
+
+# Chroma exposes its ids through the underlying collection, NumpyVectorStore directly
+def stored_ids(vectorstore):
+  if hasattr(vectorstore, "_collection"):
+    return vectorstore._collection.get(include=[])["ids"]
+  return vectorstore.get_ids()
+
+# The (ids, texts, metadatas) of every chunk in the vectorstore
+def stored_chunks(vectorstore):
+  if hasattr(vectorstore, "_collection"):
+    data = vectorstore._collection.get(include=["documents", "metadatas"])
+    return data["ids"], data["documents"], [metadata if metadata != None else {} for metadata in data["metadatas"]]
+  return vectorstore.get_ids(), list(vectorstore.texts), list(vectorstore.metadatas)
+
+# The (texts, vectors) of every chunk in the vectorstore
+def stored_vectors(vectorstore):
+  if hasattr(vectorstore, "_collection"):
+    data = vectorstore._collection.get(include=["documents", "embeddings"])
+    return data["documents"], data["embeddings"]
+  return list(vectorstore.texts), vectorstore.matrix
+
+def delete_ids(vectorstore, ids):
+  if hasattr(vectorstore, "_collection"):
+    vectorstore._collection.delete(ids=ids)
+  else:
+    vectorstore.delete(ids)
+
+# Held while a process opens or refreshes the index in persist_folder, so that worker processes that each
+# build their subjects (e.g. hypercorn --workers) take turns, and only the first refreshes a changed index.
+# A no-op where file locks are not available.
+@contextlib.contextmanager
+def index_lock(persist_folder: str):
+  if fcntl == None:
+    yield
+    return
+  lock_folder = os.path.dirname(os.path.abspath(persist_folder))
+  os.makedirs(lock_folder, exist_ok=True)
+  with open(os.path.join(lock_folder, "." + os.path.basename(os.path.abspath(persist_folder)) + ".lock"), "w") as lock_file:
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    try:
+      yield
+    finally:
+      fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# ====================================================================================================
+# Bring the vectorstore in persist_folder in line with the documents in docs_folder. Only files whose
+# content hash changed are loaded and split, only chunks that are new are embedded, and the vectors of
+# chunks that no longer exist are deleted from the collection in place.
+#
+# load_chunks(paths) must yield (path, chunks) for each of the paths it can load, where chunks is the list of
+# langchain Documents the file was split into (see DocumentIngestion.IngestionPipeline). The new chunks are
+# embedded in batches of embed_batch_size as they arrive, so embedding overlaps the loading of later files.
+# settings describes how load_chunks splits the files; when it differs from the settings of the previous
+# build every file is re-chunked, though the chunks whose text did not change keep their vectors.
+#
+# The manifest is saved last, so a refresh that stops part way leaves chunks the saved manifest does not know
+# about. The collection is therefore reconciled with its stored ids rather than with the manifest: a chunk
+# whose id is already stored is not added again, and every stored id the new manifest does not list is deleted.
+#
+# An index without a manifest (e.g. built by VectorstoreIndexCreator) has ids that cannot be mapped back to
+# chunks, so it is rebuilt from an empty collection. Its vectors are first passed to seed_embeddings(texts,
+# vectors), e.g. EmbeddingCache.CachedEmbeddings.seed, so that the chunks whose text is unchanged are not
+# embedded again.
+
+def sync_index(vectorstore, docs_folder: str, persist_folder: str, load_chunks, embed_batch_size: int = 256, seed_embeddings = None, settings = None) -> SyncResult:
+  previous = IndexManifest.load(persist_folder)
+  if previous == None:
+    existing_ids = stored_ids(vectorstore)
+    if existing_ids:
+      if (seed_embeddings != None):
+        print("Migrating the " + str(len(existing_ids)) + " chunks of the index in " + persist_folder + ", which has no manifest, reusing their vectors")
+        seed_embeddings(*stored_vectors(vectorstore))
+      else:
+        print("The index in " + persist_folder + " has no manifest, so its " + str(len(existing_ids)) + " chunks will be embedded again")
+      delete_ids(vectorstore, existing_ids)
+    previous = IndexManifest()
+
+  existing_ids = set(stored_ids(vectorstore))
+  manifest = IndexManifest(settings=settings)
+  result = SyncResult(manifest)
+  if (previous.files and previous.settings != settings):
+    print("The chunking settings changed from " + str(previous.settings) + " to " + str(settings) + ", re-chunking every file")
+  file_hashes = {}
+
+  for path in list_document_files(docs_folder):
+    relative_path = os.path.relpath(path, docs_folder)
+    file_hash = hash_file(path)
+    previous_entry = previous.files.get(relative_path)
+
+    if (previous_entry != None and previous_entry["hash"] == file_hash and previous.settings == settings):
+      manifest.files[relative_path] = previous_entry
+      result.files_unchanged += 1
+      result.chunks_kept += len(previous_entry["chunk_ids"])
+    else:
+      file_hashes[path] = file_hash
+
+  new_texts = []
+  new_metadatas = []
+  new_ids = []
+
+  def add_new_chunks():
+    # Each batch is embedded in as few embedding calls as the embedding function allows
+    vectorstore.add_texts(new_texts, metadatas=new_metadatas, ids=new_ids)
+    result.chunks_added += len(new_ids)
+    del new_texts[:], new_metadatas[:], new_ids[:]
+
+  for path, chunks in load_chunks(list(file_hashes)):
+    relative_path = os.path.relpath(path, docs_folder)
+    chunk_ids = chunk_ids_for(relative_path, [chunk.page_content for chunk in chunks])
+
+    for chunk, chunk_id in zip(chunks, chunk_ids):
+      if chunk_id in existing_ids:
+        result.chunks_kept += 1
+      else:
+        new_texts.append(chunk.page_content)
+        new_metadatas.append(chunk.metadata)
+        new_ids.append(chunk_id)
+
+    manifest.files[relative_path] = {"hash": file_hashes[path], "chunk_ids": chunk_ids}
+    result.files_changed += 1
+    if len(new_ids) >= embed_batch_size:
+      add_new_chunks()
+
+  if new_ids:
+    add_new_chunks()
+
+  # A changed file that could not be loaded keeps the chunks of its previous version, and since its recorded
+  # hash is still the previous one it is loaded again on the next refresh
+  for path in file_hashes:
+    relative_path = os.path.relpath(path, docs_folder)
+    previous_entry = previous.files.get(relative_path)
+    if (relative_path not in manifest.files and previous_entry != None):
+      # Chunked with other settings, so recorded without a hash to be loaded again on the next refresh
+      manifest.files[relative_path] = previous_entry if previous.settings == settings else dict(previous_entry, hash="")
+      result.chunks_kept += len(previous_entry["chunk_ids"])
+
+  result.files_removed = sum(1 for relative_path in previous.files if relative_path not in manifest.files)
+
+  # The chunks of changed and removed files, and any left behind by a refresh that did not finish
+  live_ids = set(manifest.all_chunk_ids())
+  stale_ids = [chunk_id for chunk_id in existing_ids if chunk_id not in live_ids]
+  if stale_ids:
+    delete_ids(vectorstore, stale_ids)
+    result.chunks_deleted = len(stale_ids)
+
+  if hasattr(vectorstore, "persist"):
+    vectorstore.persist()
+  manifest.save(persist_folder)
+  return result
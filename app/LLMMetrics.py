@@ -0,0 +1,67 @@
+import time
+import threading
+
+import tiktoken
+from langchain.callbacks.base import BaseCallbackHandler
+
+import Metrics
+
+# ====================================================================================================
+# Callbacks attached to every LLM created by the service.
+#
+# TokenUsageCallbackHandler records the latency, outcome and prompt/completion tokens of every call made
+# by the LLM it is attached to. OpenAI reports token usage for non-streaming calls; for streaming calls
+# (and backends that do not report usage) the tokens are counted with tiktoken.
+
+class TokenUsageCallbackHandler(BaseCallbackHandler):
+  _encoding = None
+
+  def __init__(self, model_name: str):
+    self.model_name = model_name
+    self._lock = threading.Lock()
+    # run id -> (start time, prompts)
+    self._runs = {}
+
+  def on_llm_start(self, serialized, prompts, *, run_id = None, **kwargs):
+    with self._lock:
+      self._runs[run_id] = (time.perf_counter(), prompts)
+
+  def on_llm_end(self, response, *, run_id = None, **kwargs):
+    with self._lock:
+      start, prompts = self._runs.pop(run_id, (None, []))
+    if start != None:
+      Metrics.LLM_SECONDS.observe(time.perf_counter() - start, model=self.model_name)
+    Metrics.LLM_CALLS.inc(model=self.model_name, outcome="ok")
+
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if "prompt_tokens" in usage:
+      prompt_tokens = usage["prompt_tokens"]
+      completion_tokens = usage.get("completion_tokens", 0)
+    else:
+      prompt_tokens = sum(self.count_tokens(prompt) for prompt in prompts)
+      completion_tokens = sum(self.count_tokens(generation.text) for generations in response.generations for generation in generations)
+    Metrics.record_tokens(self.model_name, prompt_tokens, completion_tokens)
+
+  def on_llm_error(self, error, *, run_id = None, **kwargs):
+    with self._lock:
+      self._runs.pop(run_id, None)
+    Metrics.LLM_CALLS.inc(model=self.model_name, outcome="error")
+
+  @classmethod
+  def count_tokens(cls, text: str) -> int:
+    if cls._encoding == None:
+      cls._encoding = tiktoken.get_encoding("cl100k_base")
+    return len(cls._encoding.encode(text))
+
+# ====================================================================================================
+# Holds each LLM call until the shared RateLimiter allows it. Callbacks run before the request is sent, so
+# this applies the limit to every model, including those inside already constructed chains.
+
+class RateLimitCallbackHandler(BaseCallbackHandler):
+  def __init__(self, rate_limiter):
+    self.rate_limiter = rate_limiter
+
+  def on_llm_start(self, serialized, prompts, **kwargs):
+    waited = self.rate_limiter.acquire()
+    if waited:
+      Metrics.STAGE_SECONDS.observe(waited, stage="rate_limit_wait")
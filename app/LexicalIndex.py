@@ -0,0 +1,109 @@
+import os
+import re
+import json
+import math
+from collections import Counter
+
+LEXICAL_INDEX_FILE_NAME = "lexical_index.json"
+
+# ====================================================================================================
+# A BM25 inverted index over the chunks of a subject's vectorstore. It is built when the subject's index
+# is refreshed and persisted next to it, so a keyword query ("Kubernetes", "Salesforce", a company name)
+# can be ranked locally without embedding it. is_confident tells whether a lexical ranking can be used on
+# its own: the query is a few specific terms and the best chunk contains all of them.
+
+STOP_WORDS = frozenset((
+  "a an and are as at be been but by can could did do does for from had has have how i in into is it its me my "
+  "of on or our so that the their them there these they this to was we were what when where which who why will "
+  "with would you your about any tell describe give"
+).split())
+
+# Words, numbers, and terms like c++, c#, node.js and ci/cd are kept whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:(?:\.|/)[a-z0-9]+)*(?:\+\+|#)?")
+
+def tokenize(text: str):
+  return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+class LexicalIndex:
+
+  # postings: term -> [[chunk number, term frequency], ...]
+  def __init__(self, ids, texts, metadatas, postings, lengths, version: str = None, k1: float = 1.5, b: float = 0.75):
+    self.ids = ids
+    self.texts = texts
+    self.metadatas = metadatas
+    self.postings = postings
+    self.lengths = lengths
+    self.version = version
+    self.k1 = k1
+    self.b = b
+    self.average_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+  @classmethod
+  def from_chunks(cls, ids, texts, metadatas, version: str = None):
+    postings = {}
+    lengths = []
+    for number, text in enumerate(texts):
+      tokens = tokenize(text)
+      lengths.append(len(tokens))
+      for term, frequency in Counter(tokens).items():
+        postings.setdefault(term, []).append([number, frequency])
+    return cls(list(ids), list(texts), list(metadatas), postings, lengths, version)
+
+  # ====================================================================================================
+
+  def idf(self, term: str) -> float:
+    document_frequency = len(self.postings.get(term, ()))
+    return math.log(1 + (len(self.ids) - document_frequency + 0.5) / (document_frequency + 0.5))
+
+  # The k best chunks for the query as (chunk number, score), highest first. Chunks that match no query
+  # term are not returned.
+  def search(self, query: str, k: int = 4):
+    scores = {}
+    for term in set(tokenize(query)):
+      postings = self.postings.get(term)
+      if not postings:
+        continue
+      idf = self.idf(term)
+      for number, frequency in postings:
+        normalization = self.k1 * (1 - self.b + self.b * self.lengths[number] / (self.average_length or 1))
+        scores[number] = scores.get(number, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + normalization)
+    return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+  # A ranking is trusted on its own when the query has between 1 and max_terms terms, each found in at most
+  # max_document_fraction of the chunks (so it is specific, not a word every chunk uses), and the best chunk
+  # contains every one of them
+  def is_confident(self, query: str, ranked, max_terms: int = 4, max_document_fraction: float = 0.2) -> bool:
+    terms = set(tokenize(query))
+    if (not ranked or not terms or len(terms) > max_terms):
+      return False
+    best_terms = set(tokenize(self.texts[ranked[0][0]]))
+    for term in terms:
+      document_frequency = len(self.postings.get(term, ()))
+      if (term not in best_terms or document_frequency > max_document_fraction * len(self.ids)):
+        return False
+    return True
+
+  def stats(self):
+    return {"chunks": len(self.ids), "terms": len(self.postings), "average_length": self.average_length}
+
+  # ====================================================================================================
+
+  def persist(self, persist_folder: str):
+    os.makedirs(persist_folder, exist_ok=True)
+    path = os.path.join(persist_folder, LEXICAL_INDEX_FILE_NAME)
+    with open(path + ".tmp", "w") as f:
+      json.dump({"version": self.version, "ids": self.ids, "texts": self.texts, "metadatas": self.metadatas,
+                 "postings": self.postings, "lengths": self.lengths}, f)
+    os.replace(path + ".tmp", path)
+
+  # The persisted index of persist_folder if it was built for the given index version, otherwise None
+  @classmethod
+  def load(cls, persist_folder: str, version: str):
+    path = os.path.join(persist_folder, LEXICAL_INDEX_FILE_NAME)
+    if not os.path.exists(path):
+      return None
+    with open(path, "r") as f:
+      data = json.load(f)
+    if data.get("version") != version:
+      return None
+    return cls(data["ids"], data["texts"], data["metadatas"], data["postings"], data["lengths"], version)
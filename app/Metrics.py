@@ -0,0 +1,210 @@
+import time
+import threading
+import contextlib
+import contextvars
+
+# ====================================================================================================
+# A minimal in-process metrics registry that renders the Prometheus text exposition format, plus an
+# optional per-request Trace that collects the time spent in each stage of a request.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+def _label_key(labelnames, labels):
+  return tuple(str(labels.get(name, "")) for name in labelnames)
+
+def _format_labels(labelnames, key, extra = None):
+  pairs = list(zip(labelnames, key)) + (list(extra.items()) if extra else [])
+  if not pairs:
+    return ""
+  escaped = [name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for name, value in pairs]
+  return "{" + ",".join(escaped) + "}"
+
+def _format_value(value) -> str:
+  if value == float("inf"):
+    return "+Inf"
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+# ====================================================================================================
+
+class Counter:
+  def __init__(self, name: str, help_text: str, labelnames = ()):
+    self.name = name
+    self.help_text = help_text
+    self.labelnames = tuple(labelnames)
+    self._lock = threading.Lock()
+    self._values = {}
+
+  def inc(self, amount: float = 1, **labels):
+    key = _label_key(self.labelnames, labels)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0) + amount
+
+  def render(self):
+    lines = ["# HELP " + self.name + " " + self.help_text, "# TYPE " + self.name + " counter"]
+    with self._lock:
+      for key, value in sorted(self._values.items()):
+        lines.append(self.name + _format_labels(self.labelnames, key) + " " + _format_value(value))
+    return lines
+
+class Histogram:
+  def __init__(self, name: str, help_text: str, labelnames = (), buckets = DEFAULT_BUCKETS):
+    self.name = name
+    self.help_text = help_text
+    self.labelnames = tuple(labelnames)
+    self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+    self._lock = threading.Lock()
+    # label key -> [bucket counts..., sum, count]
+    self._values = {}
+
+  def observe(self, value: float, **labels):
+    key = _label_key(self.labelnames, labels)
+    with self._lock:
+      values = self._values.get(key)
+      if values == None:
+        values = [0] * len(self.buckets) + [0.0, 0]
+        self._values[key] = values
+      for i, bound in enumerate(self.buckets):
+        if value <= bound:
+          values[i] += 1
+      values[-2] += value
+      values[-1] += 1
+
+  def render(self):
+    lines = ["# HELP " + self.name + " " + self.help_text, "# TYPE " + self.name + " histogram"]
+    with self._lock:
+      for key, values in sorted(self._values.items()):
+        for i, bound in enumerate(self.buckets):
+          lines.append(self.name + "_bucket" + _format_labels(self.labelnames, key, {"le": _format_value(bound)}) + " " + str(values[i]))
+        lines.append(self.name + "_sum" + _format_labels(self.labelnames, key) + " " + _format_value(values[-2]))
+        lines.append(self.name + "_count" + _format_labels(self.labelnames, key) + " " + str(values[-1]))
+    return lines
+
+# Reports values read from elsewhere (e.g. cache statistics) when the metrics are scraped.
+# collect() returns a list of (labels dict, value).
+class CallbackGauge:
+  def __init__(self, name: str, help_text: str, collect):
+    self.name = name
+    self.help_text = help_text
+    self.collect = collect
+
+  def render(self):
+    lines = ["# HELP " + self.name + " " + self.help_text, "# TYPE " + self.name + " gauge"]
+    try:
+      samples = self.collect()
+    except Exception:
+      samples = []
+    for labels, value in samples:
+      labelnames = tuple(sorted(labels.keys()))
+      lines.append(self.name + _format_labels(labelnames, tuple(labels[name] for name in labelnames)) + " " + _format_value(value))
+    return lines
+
+# ====================================================================================================
+
+class Registry:
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._metrics = {}
+
+  def register(self, metric):
+    with self._lock:
+      # Registering a name again returns the existing metric, so modules can be reloaded safely
+      return self._metrics.setdefault(metric.name, metric)
+
+  def counter(self, name: str, help_text: str, labelnames = ()) -> Counter:
+    return self.register(Counter(name, help_text, labelnames))
+
+  def histogram(self, name: str, help_text: str, labelnames = (), buckets = DEFAULT_BUCKETS) -> Histogram:
+    return self.register(Histogram(name, help_text, labelnames, buckets))
+
+  def callback_gauge(self, name: str, help_text: str, collect) -> CallbackGauge:
+    with self._lock:
+      # A gauge is re-pointed at the latest collect function, e.g. for a newly created service
+      gauge = CallbackGauge(name, help_text, collect)
+      self._metrics[name] = gauge
+      return gauge
+
+  def render(self) -> str:
+    with self._lock:
+      metrics = list(self._metrics.values())
+    lines = []
+    for metric in metrics:
+      lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.histogram("career_agent_stage_seconds", "Time spent in each stage of generating an answer or document", ["stage"])
+LLM_TOKENS = REGISTRY.counter("career_agent_llm_tokens_total", "Prompt and completion tokens sent to and received from the LLMs", ["model", "kind"])
+LLM_PROMPT_TOKENS = REGISTRY.histogram("career_agent_llm_prompt_tokens", "Prompt tokens per LLM call", ["model"], TOKEN_BUCKETS)
+LLM_CALLS = REGISTRY.counter("career_agent_llm_calls_total", "LLM calls", ["model", "outcome"])
+LLM_SECONDS = REGISTRY.histogram("career_agent_llm_seconds", "Latency of each LLM call", ["model"])
+RETRIEVAL_DOCUMENTS = REGISTRY.histogram("career_agent_retrieval_documents", "Documents returned per retrieval", ["k"], SIZE_BUCKETS)
+RETRIEVALS = REGISTRY.counter("career_agent_retrievals_total", "Retrievals by how they were ranked: vector, hybrid, or lexical only (without embedding the query)", ["mode"])
+CACHE_LOOKUPS = REGISTRY.counter("career_agent_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+PRECOMPUTE = REGISTRY.counter("career_agent_precompute_total", "Speculative precomputes started, superseded by a new job description and joined", ["event"])
+FALLBACKS = REGISTRY.counter("career_agent_fallbacks_total", "Fallback paths taken, e.g. re-asking the LLM for valid JSON", ["kind"])
+HTTP_REQUESTS = REGISTRY.histogram("career_agent_http_request_seconds", "HTTP request latency", ["endpoint", "status"])
+HTTP_STREAMS = REGISTRY.histogram("career_agent_http_stream_seconds", "Time from the start of a streamed HTTP request until its stream ended, by how it ended: done, error or disconnected", ["endpoint", "outcome"])
+
+# ====================================================================================================
+# A Trace collects the stages (and LLM tokens) of a single request when tracing was asked for. It is
+# carried in a context variable, which ConcurrentCalls copies into its worker threads.
+
+class Trace:
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.started = time.perf_counter()
+    self.stages = []
+    self.tokens = {}
+
+  def add_stage(self, name: str, seconds: float):
+    with self._lock:
+      self.stages.append((name, seconds))
+
+  def add_tokens(self, kind: str, count: int):
+    with self._lock:
+      self.tokens[kind] = self.tokens.get(kind, 0) + count
+
+  # Rendered as a Server-Timing header: total duration per stage (with its call count) and token totals
+  def server_timing(self) -> str:
+    with self._lock:
+      totals = {}
+      for name, seconds in self.stages:
+        total = totals.setdefault(name, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+      entries = [name + ";dur=" + format(total[0] * 1000, ".1f") + ';desc="' + str(total[1]) + 'x"' for name, total in totals.items()]
+      entries.extend(kind + ';desc="' + str(count) + '"' for kind, count in self.tokens.items())
+      entries.append("total;dur=" + format((time.perf_counter() - self.started) * 1000, ".1f"))
+      return ", ".join(entries)
+
+current_trace = contextvars.ContextVar("career_agent_trace", default=None)
+
+def start_trace() -> Trace:
+  trace = Trace()
+  current_trace.set(trace)
+  return trace
+
+@contextlib.contextmanager
+def stage(name: str):
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    elapsed = time.perf_counter() - start
+    STAGE_SECONDS.observe(elapsed, stage=name)
+    trace = current_trace.get()
+    if trace != None:
+      trace.add_stage(name, elapsed)
+
+def record_tokens(model: str, prompt_tokens: int, completion_tokens: int):
+  LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+  LLM_TOKENS.inc(completion_tokens, model=model, kind="completion")
+  LLM_PROMPT_TOKENS.observe(prompt_tokens, model=model)
+  trace = current_trace.get()
+  if trace != None:
+    trace.add_tokens("prompt_tokens", prompt_tokens)
+    trace.add_tokens("completion_tokens", completion_tokens)
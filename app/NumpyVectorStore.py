@@ -0,0 +1,173 @@
+import os
+import json
+import uuid
+import shutil
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.vectorstores.base import VectorStore
+
+EMBEDDINGS_FILE_NAME = "embeddings.npy"
+CHUNKS_FILE_NAME = "chunks.json"
+# Each persist writes a new version folder under VERSIONS_FOLDER_NAME and then points CURRENT_FILE_NAME at it
+VERSIONS_FOLDER_NAME = "versions"
+CURRENT_FILE_NAME = "CURRENT"
+
+# ====================================================================================================
+# A small in-process vectorstore for subject corpora of a few hundred chunks. The embeddings are kept as a
+# matrix of unit-length float32 rows that is memory-mapped from disk when loaded, and a search is a single
+# matrix-vector product followed by a partial sort. It implements the parts of the langchain VectorStore
+# interface used by the chains, the retrievers and IndexManifest.sync_index.
+#
+# The embeddings and chunks of a persisted store are written together into a new version folder, which
+# replacing the CURRENT file (a single atomic rename) then makes current, so a reader in another process
+# always loads a matching pair. The previous version is kept for the readers that are still loading it.
+
+class NumpyVectorStore(VectorStore):
+
+  def __init__(self, embedding_function, persist_directory: str = None):
+    self.embedding_function = embedding_function
+    self.persist_directory = persist_directory
+    self.ids = []
+    self.texts = []
+    self.metadatas = []
+    self.matrix = np.zeros((0, 0), dtype=np.float32)
+    if (persist_directory != None and self._current_folder() != None):
+      self._load()
+
+  @property
+  def embeddings(self):
+    return self.embedding_function
+
+  # ====================================================================================================
+
+  def add_texts(self, texts, metadatas = None, ids = None, **kwargs):
+    texts = list(texts)
+    if not texts:
+      return []
+    metadatas = list(metadatas) if metadatas != None else [{} for _ in texts]
+    ids = list(ids) if ids != None else [str(uuid.uuid4()) for _ in texts]
+    vectors = self._unit_rows(self.embedding_function.embed_documents(texts))
+
+    # Adding an id that already exists replaces its chunk
+    existing_ids = set(self.ids)
+    self.delete([chunk_id for chunk_id in ids if chunk_id in existing_ids])
+    self.ids.extend(ids)
+    self.texts.extend(texts)
+    self.metadatas.extend(metadatas)
+    self.matrix = vectors if len(self.matrix) == 0 else np.vstack([self.matrix, vectors])
+    return ids
+
+  def delete(self, ids = None, **kwargs):
+    if not ids:
+      return
+    to_delete = set(ids)
+    keep = [i for i, chunk_id in enumerate(self.ids) if chunk_id not in to_delete]
+    if len(keep) == len(self.ids):
+      return
+    self.ids = [self.ids[i] for i in keep]
+    self.texts = [self.texts[i] for i in keep]
+    self.metadatas = [self.metadatas[i] for i in keep]
+    self.matrix = np.ascontiguousarray(self.matrix[keep]) if keep else np.zeros((0, 0), dtype=np.float32)
+
+  def get_ids(self):
+    return list(self.ids)
+
+  # ====================================================================================================
+
+  def similarity_search(self, query: str, k: int = 4, **kwargs):
+    return [document for document, score in self.similarity_search_with_score(query, k)]
+
+  def similarity_search_with_score(self, query: str, k: int = 4, **kwargs):
+    return self.similarity_search_by_vector_with_score(self.embedding_function.embed_query(query), k)
+
+  def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs):
+    return [document for document, score in self.similarity_search_by_vector_with_score(embedding, k)]
+
+  # Scores are cosine similarities, highest first
+  def similarity_search_by_vector_with_score(self, embedding, k: int = 4):
+    if (len(self.ids) == 0 or k <= 0):
+      return []
+    scores = self.matrix @ self._unit_rows([embedding])[0]
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [(Document(page_content=self.texts[i], metadata=dict(self.metadatas[i])), float(scores[i])) for i in top]
+
+  def _similarity_search_with_relevance_scores(self, query: str, k: int = 4, **kwargs):
+    return self.similarity_search_with_score(query, k)
+
+  # ====================================================================================================
+
+  @classmethod
+  def from_texts(cls, texts, embedding, metadatas = None, ids = None, persist_directory: str = None, **kwargs):
+    store = cls(embedding, persist_directory=persist_directory)
+    store.add_texts(texts, metadatas=metadatas, ids=ids)
+    return store
+
+  # Copy the vectors of an existing Chroma persist directory without re-embedding anything
+  @classmethod
+  def from_chroma(cls, chroma_persist_directory: str, embedding_function, persist_directory: str = None):
+    from langchain.vectorstores import Chroma
+    collection = Chroma(persist_directory=chroma_persist_directory, embedding_function=embedding_function)._collection
+    data = collection.get(include=["embeddings", "documents", "metadatas"])
+    store = cls(embedding_function, persist_directory=persist_directory)
+    store.ids = list(data["ids"])
+    store.texts = list(data["documents"])
+    store.metadatas = [metadata if metadata != None else {} for metadata in data["metadatas"]]
+    store.matrix = store._unit_rows(data["embeddings"]) if store.ids else np.zeros((0, 0), dtype=np.float32)
+    return store
+
+  # ====================================================================================================
+
+  def persist(self):
+    if self.persist_directory == None:
+      return
+    versions_folder = os.path.join(self.persist_directory, VERSIONS_FOLDER_NAME)
+    version = uuid.uuid4().hex
+    version_folder = os.path.join(versions_folder, version)
+    os.makedirs(version_folder)
+    with open(os.path.join(version_folder, EMBEDDINGS_FILE_NAME), "wb") as f:
+      np.save(f, np.ascontiguousarray(self.matrix, dtype=np.float32))
+    with open(os.path.join(version_folder, CHUNKS_FILE_NAME), "w") as f:
+      json.dump({"ids": self.ids, "texts": self.texts, "metadatas": self.metadatas}, f)
+
+    previous_folder = self._current_folder()
+    current_path = os.path.join(self.persist_directory, CURRENT_FILE_NAME)
+    with open(current_path + ".tmp", "w") as f:
+      f.write(version)
+    os.replace(current_path + ".tmp", current_path)
+
+    # Keep the new and the previous version. A process that has memory-mapped an older one keeps its mapping.
+    keep = (version, os.path.basename(previous_folder) if previous_folder != None else None)
+    for name in os.listdir(versions_folder):
+      if name not in keep:
+        shutil.rmtree(os.path.join(versions_folder, name), ignore_errors=True)
+
+  # The folder of the version CURRENT points at, or None if nothing was persisted
+  def _current_folder(self):
+    try:
+      with open(os.path.join(self.persist_directory, CURRENT_FILE_NAME), "r") as f:
+        return os.path.join(self.persist_directory, VERSIONS_FOLDER_NAME, f.read().strip())
+    except FileNotFoundError:
+      return None
+
+  def _load(self):
+    folder = self._current_folder()
+    with open(os.path.join(folder, CHUNKS_FILE_NAME), "r") as f:
+      chunks = json.load(f)
+    self.ids = chunks["ids"]
+    self.texts = chunks["texts"]
+    self.metadatas = chunks["metadatas"]
+    # Memory-mapped read-only; the pages are shared with any other process that maps the same file
+    self.matrix = np.load(os.path.join(folder, EMBEDDINGS_FILE_NAME), mmap_mode="r")
+    if len(self.matrix) != len(self.ids):
+      raise Exception("The persisted store in " + folder + " has " + str(len(self.matrix)) + " embeddings for " + str(len(self.ids)) + " chunks")
+
+  def _unit_rows(self, vectors):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+      matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
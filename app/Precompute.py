@@ -0,0 +1,129 @@
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import SubjectContext as SubjectContext
+import Metrics as Metrics
+
+# ====================================================================================================
+# Speculative work started as soon as a job description is set, so that the cover letter (and optionally
+# the resume) is mostly done by the time it is asked for. There is at most one JobPrecompute per subject:
+# setting another job description cancels the previous one. Calls already sent to the LLM cannot be
+# interrupted, so a cancelled precompute stops at its next stage and its results are ignored.
+#
+# Precomputes live in the process that received the job description. Under a pre-fork server (see
+# gunicorn.conf.py) a document requested from another worker does not join them: only the qualifications
+# and skills they have already matched are reused, through the shared GenerationMemo, while the mission
+# statement and the resume are generated again, and GET /job_description/<subject_id> only reports the
+# precompute of the worker that answers it. The full benefit is only had with a single process, e.g.
+# AsyncAPIServer under hypercorn or a single gunicorn worker.
+
+class Cancelled(Exception):
+  pass
+
+def raise_if_cancelled(cancel_event: threading.Event):
+  if (cancel_event != None and cancel_event.is_set()):
+    raise Cancelled("Superseded by a newer job description")
+
+def job_key(subject_context: SubjectContext):
+  return (subject_context.job_desc, subject_context.job_title, subject_context.company_name)
+
+# A copy of the subject's context, so the precompute keeps working on its job if the context is changed
+def snapshot(subject_context: SubjectContext) -> SubjectContext:
+  copy = SubjectContext.SubjectContext(subject_context.applicant_name, subject_context.id)
+  copy.job_desc = subject_context.job_desc
+  copy.job_title = subject_context.job_title
+  copy.company_name = subject_context.company_name
+  return copy
+
+class JobPrecompute:
+  def __init__(self, subject_context: SubjectContext, tasks, executor: ThreadPoolExecutor):
+    self.subject_context = snapshot(subject_context)
+    self.key = job_key(self.subject_context)
+    self.cancel_event = threading.Event()
+    # task name -> Future. Each task is called with (subject_context, cancel_event).
+    self.futures = {name: executor.submit(contextvars.copy_context().run, task, self.subject_context, self.cancel_event) for name, task in tasks.items()}
+
+  def matches(self, subject_context: SubjectContext) -> bool:
+    return (not self.cancel_event.is_set()) and job_key(subject_context) == self.key
+
+  def cancel(self):
+    self.cancel_event.set()
+    for future in self.futures.values():
+      future.cancel()
+
+  # The result of a task, waiting for it if it is still running, or None if the task was not started or did
+  # not succeed (in which case the caller does the work itself)
+  def result(self, name: str):
+    future = self.futures.get(name)
+    if future == None or future.cancelled():
+      return None
+    try:
+      value = future.result()
+    except Exception as e:
+      print("Precomputed " + name + " is not available: " + str(e))
+      return None
+    Metrics.PRECOMPUTE.inc(event="joined")
+    return value
+
+  def status(self):
+    def state(future):
+      if future.cancelled():
+        return "cancelled"
+      if not future.done():
+        return "running" if future.running() else "pending"
+      return "failed" if future.exception() != None else "done"
+    return {
+      "job_title": self.subject_context.job_title,
+      "company_name": self.subject_context.company_name,
+      "cancelled": self.cancel_event.is_set(),
+      "tasks": {name: state(future) for name, future in self.futures.items()},
+    }
+
+# ====================================================================================================
+
+class PrecomputeManager:
+
+  def __init__(self, max_workers: int = 3):
+    self._lock = threading.Lock()
+    self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="precompute")
+    self._precomputes = {}
+    self.started = 0
+    self.superseded = 0
+
+  # Start the tasks for the subject's current job, superseding any precompute of an earlier job
+  def start(self, subject_context: SubjectContext, tasks) -> JobPrecompute:
+    with self._lock:
+      previous = self._precomputes.get(subject_context.id)
+      if previous != None:
+        previous.cancel()
+        self.superseded += 1
+        Metrics.PRECOMPUTE.inc(event="superseded")
+      precompute = JobPrecompute(subject_context, tasks, self._executor)
+      self._precomputes[subject_context.id] = precompute
+      self.started += 1
+      Metrics.PRECOMPUTE.inc(event="started")
+      return precompute
+
+  # The precompute of the subject if it is for the given job
+  def get(self, subject_context: SubjectContext) -> JobPrecompute:
+    with self._lock:
+      precompute = self._precomputes.get(subject_context.id)
+    if precompute != None and precompute.matches(subject_context):
+      return precompute
+    return None
+
+  def cancel(self, subject_id: str):
+    with self._lock:
+      precompute = self._precomputes.pop(subject_id, None)
+    if precompute != None:
+      precompute.cancel()
+
+  def status(self, subject_id: str):
+    with self._lock:
+      precompute = self._precomputes.get(subject_id)
+    return precompute.status() if precompute != None else None
+
+  def stats(self):
+    with self._lock:
+      return {"subjects": len(self._precomputes), "started": self.started, "superseded": self.superseded}
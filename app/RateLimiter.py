@@ -0,0 +1,51 @@
+import time
+import threading
+
+# ====================================================================================================
+# A token bucket shared by every caller of an upstream API. acquire() blocks until a request may be made,
+# so that no more than requests_per_minute requests start in any minute (with bursts of up to burst).
+# A rate of None disables the limit.
+
+class RateLimiter:
+
+  def __init__(self, requests_per_minute: float = None, burst: int = None):
+    self._lock = threading.Lock()
+    self.waits = 0
+    self.seconds_waited = 0.0
+    self.set_rate(requests_per_minute, burst)
+
+  def set_rate(self, requests_per_minute: float = None, burst: int = None):
+    with self._lock:
+      self.requests_per_minute = requests_per_minute
+      self.burst = burst if burst != None else max(1, int(requests_per_minute / 60)) if requests_per_minute else 1
+      self._tokens = float(self.burst)
+      self._updated = time.monotonic()
+
+  # Returns the seconds spent waiting
+  def acquire(self) -> float:
+    waited = 0.0
+    while True:
+      with self._lock:
+        if not self.requests_per_minute:
+          return waited
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.requests_per_minute / 60)
+        self._updated = now
+        if self._tokens >= 1:
+          self._tokens -= 1
+          if waited:
+            self.waits += 1
+            self.seconds_waited += waited
+          return waited
+        delay = (1 - self._tokens) * 60 / self.requests_per_minute
+      time.sleep(delay)
+      waited += delay
+
+  def stats(self):
+    with self._lock:
+      return {
+        "requests_per_minute": self.requests_per_minute,
+        "burst": self.burst,
+        "waits": self.waits,
+        "seconds_waited": self.seconds_waited,
+      }
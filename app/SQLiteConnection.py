@@ -0,0 +1,38 @@
+import os
+import sqlite3
+
+# ====================================================================================================
+# A SQLite connection in WAL mode that is opened on first use in each process, and again after close(). A
+# connection must never be used on both sides of a fork, so a pre-fork server closes it before forking its
+# workers (see CareerAgentService.prepare_to_fork) and each worker then opens its own. It does no locking of
+# its own: the caches and stores that use it hold their lock around every use.
+
+class SQLiteConnection:
+
+  def __init__(self, path: str, busy_timeout_seconds: float = 5):
+    self.path = path
+    self.busy_timeout_seconds = busy_timeout_seconds
+    # The process that last opened the connection
+    self.pid = None
+    self._connection = None
+
+  def get(self) -> sqlite3.Connection:
+    if (self._connection == None or self.pid != os.getpid()):
+      self._connection = sqlite3.connect(self.path, timeout=self.busy_timeout_seconds, check_same_thread=False)
+      self._connection.execute("PRAGMA journal_mode=WAL")
+      self.pid = os.getpid()
+    return self._connection
+
+  # Whether this process has the connection open
+  def is_open(self) -> bool:
+    return self._connection != None and self.pid == os.getpid()
+
+  # Whether the connection was last opened by another process, i.e. this process was forked after it was opened
+  def opened_before_fork(self) -> bool:
+    return self.pid != None and self.pid != os.getpid()
+
+  def close(self):
+    # A connection inherited from the parent is the parent's to close
+    if self.is_open():
+      self._connection.close()
+    self._connection = None
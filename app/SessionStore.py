@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import threading
+
+import SubjectContext as SubjectContext
+import SQLiteConnection as SQLiteConnection
+
+# ====================================================================================================
+# Session state kept in a SQLite database in WAL mode, so that the worker processes of a pre-fork server
+# (see gunicorn.conf.py) share it and any worker can serve any request:
+#
+#   subject_contexts: subject -> its SubjectContext (the applicant and the job being applied for)
+#   chat_sessions:    (subject, visitor session) -> the rolling summary of the conversation
+#   chat_turns:       the turns of each session that have not been folded into its summary
+#   document_jobs:    the status of each document job, so it can be polled from any worker
+#
+# The database connection is opened on first use in each process (see SQLiteConnection). A process that
+# forks must close() the store first, so that a connection is never used on both sides of a fork.
+
+class SessionStore:
+
+  def __init__(self, store_path: str, max_document_jobs: int = 1000, busy_timeout_seconds: float = 30):
+    self.store_path = store_path
+    self.max_document_jobs = max_document_jobs
+    self.busy_timeout_seconds = busy_timeout_seconds
+
+    self._lock = threading.Lock()
+    self._sqlite = SQLiteConnection.SQLiteConnection(store_path, busy_timeout_seconds=busy_timeout_seconds)
+    store_folder = os.path.dirname(store_path)
+    if store_folder:
+      os.makedirs(store_folder, exist_ok=True)
+    with self._lock:
+      self._connection.execute("CREATE TABLE IF NOT EXISTS subject_contexts (subject_id TEXT PRIMARY KEY, context TEXT NOT NULL)")
+      self._connection.execute("CREATE TABLE IF NOT EXISTS chat_sessions (subject_id TEXT NOT NULL, session_id TEXT NOT NULL, summary TEXT NOT NULL, last_used REAL NOT NULL, compacting_until REAL NOT NULL, PRIMARY KEY (subject_id, session_id))")
+      self._connection.execute("CREATE TABLE IF NOT EXISTS chat_turns (id INTEGER PRIMARY KEY AUTOINCREMENT, subject_id TEXT NOT NULL, session_id TEXT NOT NULL, question TEXT NOT NULL, answer TEXT NOT NULL, tokens INTEGER NOT NULL)")
+      self._connection.execute("CREATE TABLE IF NOT EXISTS document_jobs (id TEXT PRIMARY KEY, job TEXT NOT NULL, created REAL NOT NULL)")
+      self._connection.execute("CREATE INDEX IF NOT EXISTS chat_sessions_last_used ON chat_sessions (last_used)")
+      self._connection.execute("CREATE INDEX IF NOT EXISTS chat_turns_session ON chat_turns (subject_id, session_id, id)")
+      self._connection.execute("CREATE INDEX IF NOT EXISTS document_jobs_created ON document_jobs (created)")
+      self._connection.commit()
+
+  @property
+  def _connection(self):
+    return self._sqlite.get()
+
+  def close(self):
+    with self._lock:
+      self._sqlite.close()
+
+  # ====================================================================================================
+
+  def get_subject_context(self, subject_id: str) -> SubjectContext:
+    with self._lock:
+      row = self._connection.execute("SELECT context FROM subject_contexts WHERE subject_id = ?", (subject_id,)).fetchone()
+    if row == None:
+      return None
+    context = json.loads(row[0])
+    subject_context = SubjectContext.SubjectContext(context["applicant_name"], subject_id)
+    subject_context.job_desc = context.get("job_desc")
+    subject_context.job_title = context.get("job_title")
+    subject_context.company_name = context.get("company_name")
+    return subject_context
+
+  # Saves the context, unless only_if_missing is set and the subject already has one
+  def save_subject_context(self, subject_context: SubjectContext, only_if_missing: bool = False):
+    context = json.dumps({
+      "applicant_name": subject_context.applicant_name,
+      "job_desc": subject_context.job_desc,
+      "job_title": subject_context.job_title,
+      "company_name": subject_context.company_name,
+    })
+    with self._lock:
+      self._connection.execute(("INSERT OR IGNORE" if only_if_missing else "INSERT OR REPLACE") + " INTO subject_contexts (subject_id, context) VALUES (?, ?)",
+        (subject_context.id, context))
+      self._connection.commit()
+
+  def subject_ids(self):
+    with self._lock:
+      return [row[0] for row in self._connection.execute("SELECT subject_id FROM subject_contexts ORDER BY subject_id").fetchall()]
+
+  # ====================================================================================================
+
+  # The summary of a chat session and its (turn id, question, answer, token count) turns, oldest first. Reading
+  # does not write: a session's last use is recorded when a turn is appended to it.
+  def get_chat_session(self, subject_id: str, session_id: str):
+    with self._lock:
+      row = self._connection.execute("SELECT summary FROM chat_sessions WHERE subject_id = ? AND session_id = ?", (subject_id, session_id)).fetchone()
+      turns = self._connection.execute("SELECT id, question, answer, tokens FROM chat_turns WHERE subject_id = ? AND session_id = ? ORDER BY id",
+        (subject_id, session_id)).fetchall()
+    return (row[0] if row != None else ""), turns
+
+  def append_chat_turn(self, subject_id: str, session_id: str, question: str, answer: str, tokens: int):
+    with self._lock:
+      self._connection.execute("INSERT OR IGNORE INTO chat_sessions (subject_id, session_id, summary, last_used, compacting_until) VALUES (?, ?, '', ?, 0)",
+        (subject_id, session_id, time.time()))
+      self._connection.execute("UPDATE chat_sessions SET last_used = ? WHERE subject_id = ? AND session_id = ?", (time.time(), subject_id, session_id))
+      self._connection.execute("INSERT INTO chat_turns (subject_id, session_id, question, answer, tokens) VALUES (?, ?, ?, ?, ?)",
+        (subject_id, session_id, question, answer, tokens))
+      self._connection.commit()
+
+  # Claim the compaction of a session for lease_seconds. Only one worker at a time can hold the claim.
+  def claim_compaction(self, subject_id: str, session_id: str, lease_seconds: float) -> bool:
+    now = time.time()
+    with self._lock:
+      cursor = self._connection.execute("UPDATE chat_sessions SET compacting_until = ? WHERE subject_id = ? AND session_id = ? AND compacting_until < ?",
+        (now + lease_seconds, subject_id, session_id, now))
+      self._connection.commit()
+      return cursor.rowcount == 1
+
+  # Replace the summary of a session with one that covers every turn up to through_turn_id, and release the
+  # compaction claim. Turns appended meanwhile are kept.
+  def save_chat_summary(self, subject_id: str, session_id: str, summary: str, through_turn_id: int):
+    with self._lock:
+      self._connection.execute("UPDATE chat_sessions SET summary = ?, compacting_until = 0 WHERE subject_id = ? AND session_id = ?", (summary, subject_id, session_id))
+      self._connection.execute("DELETE FROM chat_turns WHERE subject_id = ? AND session_id = ? AND id <= ?", (subject_id, session_id, through_turn_id))
+      self._connection.commit()
+
+  def release_compaction(self, subject_id: str, session_id: str):
+    with self._lock:
+      self._connection.execute("UPDATE chat_sessions SET compacting_until = 0 WHERE subject_id = ? AND session_id = ?", (subject_id, session_id))
+      self._connection.commit()
+
+  # Delete every session of the subject, or only the given session
+  def clear_chat_sessions(self, subject_id: str, session_id: str = None):
+    condition, parameters = ("subject_id = ?", (subject_id,)) if session_id == None else ("subject_id = ? AND session_id = ?", (subject_id, session_id))
+    with self._lock:
+      self._connection.execute("DELETE FROM chat_sessions WHERE " + condition, parameters)
+      self._connection.execute("DELETE FROM chat_turns WHERE " + condition, parameters)
+      self._connection.commit()
+
+  # Delete the sessions that have had no turn appended for idle_seconds and return how many there were
+  def evict_idle_chat_sessions(self, idle_seconds: float) -> int:
+    cutoff = time.time() - idle_seconds
+    with self._lock:
+      self._connection.execute("DELETE FROM chat_turns WHERE (subject_id, session_id) IN (SELECT subject_id, session_id FROM chat_sessions WHERE last_used < ?)", (cutoff,))
+      cursor = self._connection.execute("DELETE FROM chat_sessions WHERE last_used < ?", (cutoff,))
+      self._connection.commit()
+      return cursor.rowcount
+
+  def chat_session_count(self) -> int:
+    with self._lock:
+      return self._connection.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0]
+
+  # ====================================================================================================
+
+  # job is DocumentRenderer.RenderJob.as_dict() of the job
+  def save_document_job(self, job):
+    with self._lock:
+      self._connection.execute("INSERT OR REPLACE INTO document_jobs (id, job, created) VALUES (?, ?, COALESCE((SELECT created FROM document_jobs WHERE id = ?), ?))",
+        (job["id"], json.dumps(job), job["id"], time.time()))
+      self._connection.execute("DELETE FROM document_jobs WHERE id NOT IN (SELECT id FROM document_jobs ORDER BY created DESC LIMIT ?)", (self.max_document_jobs,))
+      self._connection.commit()
+
+  def get_document_job(self, job_id: str):
+    with self._lock:
+      row = self._connection.execute("SELECT job FROM document_jobs WHERE id = ?", (job_id,)).fetchone()
+    return json.loads(row[0]) if row != None else None
@@ -0,0 +1,165 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from langchain.schema import BaseRetriever, Document
+
+import Metrics
+
+# ====================================================================================================
+# One retrieval layer per subject, shared by every chain of the subject. A query is embedded and searched
+# once at the largest k any consumer needs, consumers with a smaller k get a prefix of that ranking, and
+# recent rankings are memoized. A SubjectRetrieval is built for a single index version, so a rebuilt
+# index gets a fresh, empty memo.
+#
+# With a LexicalIndex the ranking depends on mode:
+#   "vector": the vectorstore ranking only
+#   "hybrid": the BM25 and vectorstore rankings fused by reciprocal rank fusion
+#   "auto":   the BM25 ranking alone when it is confident (see LexicalIndex.is_confident), which saves the
+#             embedding round-trip, and the hybrid ranking otherwise
+
+class SubjectRetrieval:
+
+  def __init__(self, vectorstore, index_version: str = None, max_k: int = 10, memo_size: int = 256, lexical_index = None, mode: str = "vector",
+               lexical_weight: float = 1.0, rank_constant: int = 60):
+    self.vectorstore = vectorstore
+    self.index_version = index_version
+    self.max_k = max_k
+    self.memo_size = memo_size
+    self.lexical_index = lexical_index
+    self.mode = mode if lexical_index != None else "vector"
+    self.lexical_weight = lexical_weight
+    self.rank_constant = rank_constant
+
+    self._lock = threading.Lock()
+    self._memo = OrderedDict()
+    self._in_flight = {}
+
+    self.searches = 0
+    self.memo_hits = 0
+    self.rankings = {"vector": 0, "hybrid": 0, "lexical": 0}
+
+  # ====================================================================================================
+
+  def search(self, query: str, k: int):
+    with self._lock:
+      ranked = self._memo.get(query)
+      if ranked != None:
+        self._memo.move_to_end(query)
+        self.memo_hits += 1
+        Metrics.CACHE_LOOKUPS.inc(cache="retrieval_memo", result="hit")
+        return ranked[:k]
+      # Another thread is already searching for this query, so share its result
+      event = self._in_flight.get(query)
+      is_searcher = event == None
+      if is_searcher:
+        event = threading.Event()
+        self._in_flight[query] = event
+
+    if not is_searcher:
+      event.wait()
+      with self._lock:
+        ranked = self._memo.get(query)
+        if ranked != None:
+          self.memo_hits += 1
+          Metrics.CACHE_LOOKUPS.inc(cache="retrieval_memo", result="hit")
+          return ranked[:k]
+      return self.search(query, k)
+
+    try:
+      Metrics.CACHE_LOOKUPS.inc(cache="retrieval_memo", result="miss")
+      ranked = self._rank(query, max(k, self.max_k))
+      with self._lock:
+        self.searches += 1
+        self._memo[query] = ranked
+        while len(self._memo) > self.memo_size:
+          self._memo.popitem(last=False)
+    finally:
+      with self._lock:
+        self._in_flight.pop(query, None)
+      event.set()
+    return ranked[:k]
+
+  async def asearch(self, query: str, k: int):
+    return await asyncio.to_thread(self.search, query, k)
+
+  def as_retriever(self, k: int):
+    return SharedRetriever(retrieval=self, k=k)
+
+  def stats(self):
+    with self._lock:
+      lookups = self.searches + self.memo_hits
+      return {
+        "index_version": self.index_version,
+        "max_k": self.max_k,
+        "searches": self.searches,
+        "memo_hits": self.memo_hits,
+        "memo_hit_rate": (self.memo_hits / lookups) if lookups else 0.0,
+        "memo_entries": len(self._memo),
+        "mode": self.mode,
+        "vector_rankings": self.rankings["vector"],
+        "hybrid_rankings": self.rankings["hybrid"],
+        "lexical_rankings": self.rankings["lexical"],
+      }
+
+  # ====================================================================================================
+
+  def _rank(self, query: str, k: int):
+    if self.mode == "vector":
+      self._count_ranking("vector")
+      with Metrics.stage("vector_search"):
+        return self.vectorstore.similarity_search(query, k=k)
+
+    # Both rankings are fetched deeper than k so that a chunk ranked just below k by one of them can still
+    # make the fused top k
+    with Metrics.stage("lexical_search"):
+      lexical = self.lexical_index.search(query, 2 * k)
+    if (self.mode == "auto" and self.lexical_index.is_confident(query, lexical)):
+      self._count_ranking("lexical")
+      return [self._lexical_document(number) for number, score in lexical[:k]]
+
+    self._count_ranking("hybrid")
+    with Metrics.stage("vector_search"):
+      vector = self.vectorstore.similarity_search(query, k=2 * k)
+    fused = {}
+    documents = {}
+    for rank, document in enumerate(vector):
+      documents.setdefault(document.page_content, document)
+      fused[document.page_content] = fused.get(document.page_content, 0.0) + 1.0 / (self.rank_constant + rank + 1)
+    for rank, (number, score) in enumerate(lexical):
+      text = self.lexical_index.texts[number]
+      if text not in documents:
+        documents[text] = self._lexical_document(number)
+      fused[text] = fused.get(text, 0.0) + self.lexical_weight / (self.rank_constant + rank + 1)
+    return [documents[text] for text in sorted(fused, key=lambda text: -fused[text])[:k]]
+
+  def _lexical_document(self, number: int):
+    return Document(page_content=self.lexical_index.texts[number], metadata=dict(self.lexical_index.metadatas[number]))
+
+  def _count_ranking(self, mode: str):
+    with self._lock:
+      self.rankings[mode] += 1
+    Metrics.RETRIEVALS.inc(mode=mode)
+
+# ====================================================================================================
+# The langchain retriever handed to the chains. It returns the top k of the shared ranking.
+
+class SharedRetriever(BaseRetriever):
+  retrieval: Any
+  k: int = 4
+
+  class Config:
+    arbitrary_types_allowed = True
+
+  def _get_relevant_documents(self, query: str, *, run_manager = None):
+    with Metrics.stage("retrieval"):
+      documents = self.retrieval.search(query, self.k)
+    Metrics.RETRIEVAL_DOCUMENTS.observe(len(documents), k=self.k)
+    return documents
+
+  async def _aget_relevant_documents(self, query: str, *, run_manager = None):
+    with Metrics.stage("retrieval"):
+      documents = await self.retrieval.asearch(query, self.k)
+    Metrics.RETRIEVAL_DOCUMENTS.observe(len(documents), k=self.k)
+    return documents
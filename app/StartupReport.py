@@ -0,0 +1,52 @@
+import time
+import threading
+import contextlib
+
+# ====================================================================================================
+# Records how long the process took to start: the time spent in each named stage (e.g. importing modules,
+# loading indexes, building chains) and when milestones such as "listening" and "ready" were reached,
+# all relative to when this module was first imported.
+
+PROCESS_START = time.perf_counter()
+
+class StartupReport:
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    # stage name -> [total seconds, count]
+    self.stages = {}
+    # milestone name -> seconds since process start
+    self.milestones = {}
+
+  @contextlib.contextmanager
+  def stage(self, name: str):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      elapsed = time.perf_counter() - start
+      with self._lock:
+        total = self.stages.setdefault(name, [0.0, 0])
+        total[0] += elapsed
+        total[1] += 1
+
+  # Record a milestone the first time it is reached
+  def mark(self, name: str):
+    with self._lock:
+      self.milestones.setdefault(name, time.perf_counter() - PROCESS_START)
+
+  def as_dict(self):
+    with self._lock:
+      return {
+        "stages": {name: {"seconds": total[0], "count": total[1]} for name, total in self.stages.items()},
+        "milestones": dict(self.milestones),
+      }
+
+  def __str__(self):
+    report = self.as_dict()
+    lines = ["Startup report:"]
+    for name, stage in report["stages"].items():
+      lines.append("  " + name + ": " + format(stage["seconds"], ".3f") + "s (" + str(stage["count"]) + "x)")
+    for name, seconds in sorted(report["milestones"].items(), key=lambda item: item[1]):
+      lines.append("  " + name + " after " + format(seconds, ".3f") + "s")
+    return "\n".join(lines)
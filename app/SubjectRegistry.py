@@ -0,0 +1,210 @@
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# ====================================================================================================
+# The per-subject resources (embedding index and chains) that are expensive to build and are kept
+# resident in memory by the SubjectRegistry
+
+class SubjectResources:
+  def __init__(self, subject_id: str, index, small_chain, large_chain, size_bytes: int = 0, index_version: str = None, retrieval = None, query_chain = None):
+    self.subject_id = subject_id
+    # Changes whenever the indexed documents of the subject change
+    self.index_version = index_version
+    self.index = index
+    self.small_chain = small_chain
+    self.large_chain = large_chain
+    # The SharedRetrieval.SubjectRetrieval used by the chains and the RetrievalQA chain used by query_context
+    self.retrieval = retrieval
+    self.query_chain = query_chain
+    # Estimated memory held by the subject (see estimate_size_bytes), used to bound the registry by memory
+    self.size_bytes = size_bytes
+
+# ====================================================================================================
+
+# Approximate sizes of the Python objects that hold a chunk's text and a lexical index posting
+STRING_OVERHEAD_BYTES = 50
+POSTING_BYTES = 120
+
+# An estimate of the memory a subject's index holds: its float32 vectors, the text of its chunks and, with a
+# lexical index, that index's copy of the text and its postings. Memory-mapped vectors (NumpyVectorStore)
+# are counted too, since every search touches all of them. The chains are small next to the index and are
+# not counted.
+def estimate_size_bytes(texts, dimensions: int, lexical_index = None) -> int:
+  text_bytes = sum(len(text) + STRING_OVERHEAD_BYTES for text in texts)
+  size = len(texts) * dimensions * 4 + text_bytes
+  if (lexical_index != None):
+    size += text_bytes + POSTING_BYTES * sum(len(postings) for postings in lexical_index.postings.values())
+  return size
+
+# ====================================================================================================
+# A bounded, least-recently-used registry of SubjectResources. A subject is built by calling
+# builder(subject_id) the first time it is requested. Concurrent first requests for the same subject
+# wait on the same in-flight build rather than each starting their own. A build that was started before the
+# subject was put or invalidated is stale and is not made resident. on_evict(subject_id, resources) is called
+# outside of the registry's lock, so it may use the registry.
+
+class SubjectRegistry:
+
+  def __init__(self, builder, max_subjects: int = 8, max_memory_bytes: int = None, on_evict = None):
+    if (max_subjects != None and max_subjects < 1):
+      raise Exception("max_subjects must be at least 1")
+    self.builder = builder
+    self.max_subjects = max_subjects
+    self.max_memory_bytes = max_memory_bytes
+    self.on_evict = on_evict
+
+    self._lock = threading.Lock()
+    self._resident = OrderedDict()
+    self._in_flight = {}
+    # subject_id -> the number of times it has been put or invalidated
+    self._generations = {}
+
+    self.cold_requests = 0
+    self.cold_seconds_total = 0.0
+    self.cold_seconds_max = 0.0
+    self.warm_requests = 0
+    self.warm_seconds_total = 0.0
+    self.warm_seconds_max = 0.0
+    self.build_failures = 0
+    self.evictions = 0
+
+  # ====================================================================================================
+
+  def get(self, subject_id: str) -> SubjectResources:
+    start = time.perf_counter()
+    with self._lock:
+      resources = self._resident.get(subject_id)
+      if (resources != None):
+        self._resident.move_to_end(subject_id)
+        self._record_warm(time.perf_counter() - start)
+        return resources
+
+      future = self._in_flight.get(subject_id)
+      is_builder = future == None
+      if is_builder:
+        future = Future()
+        self._in_flight[subject_id] = future
+        generation = self._generations.get(subject_id, 0)
+
+    if is_builder:
+      try:
+        resources = self.builder(subject_id)
+      except BaseException as e:
+        with self._lock:
+          if (self._in_flight.get(subject_id) is future):
+            self._in_flight.pop(subject_id, None)
+          self.build_failures += 1
+        future.set_exception(e)
+        raise
+      evicted = []
+      with self._lock:
+        if (self._in_flight.get(subject_id) is future):
+          self._in_flight.pop(subject_id, None)
+        if (self._generations.get(subject_id, 0) == generation):
+          evicted = self._insert(subject_id, resources)
+        elif (subject_id in self._resident):
+          # The subject was put while this build was in flight, so the resources that were put are newer
+          resources = self._resident[subject_id]
+      future.set_result(resources)
+      self._notify_evicted(evicted)
+    else:
+      # Another request is already building this subject, so wait for it to finish
+      resources = future.result()
+
+    self._record_cold(time.perf_counter() - start)
+    return resources
+
+  # ====================================================================================================
+
+  # Replace the resident resources for a subject, e.g. after its index has been rebuilt
+  def put(self, subject_id: str, resources: SubjectResources):
+    with self._lock:
+      self._generations[subject_id] = self._generations.get(subject_id, 0) + 1
+      # A build in flight is now stale, so later requests wait for these resources rather than for it
+      self._in_flight.pop(subject_id, None)
+      evicted = self._insert(subject_id, resources)
+    self._notify_evicted(evicted)
+
+  def invalidate(self, subject_id: str):
+    with self._lock:
+      self._generations[subject_id] = self._generations.get(subject_id, 0) + 1
+      self._in_flight.pop(subject_id, None)
+      resources = self._resident.pop(subject_id, None)
+    if (resources != None):
+      self._notify_evicted([(subject_id, resources)])
+
+  def is_resident(self, subject_id: str) -> bool:
+    with self._lock:
+      return subject_id in self._resident
+
+  def resident_subject_ids(self):
+    with self._lock:
+      return list(self._resident.keys())
+
+  def resident_bytes(self) -> int:
+    with self._lock:
+      return sum(resources.size_bytes for resources in self._resident.values())
+
+  # ====================================================================================================
+
+  def stats(self):
+    with self._lock:
+      return {
+        "resident_subjects": len(self._resident),
+        "resident_bytes": sum(resources.size_bytes for resources in self._resident.values()),
+        "in_flight_builds": len(self._in_flight),
+        "cold_requests": self.cold_requests,
+        "cold_seconds_avg": (self.cold_seconds_total / self.cold_requests) if self.cold_requests else 0.0,
+        "cold_seconds_max": self.cold_seconds_max,
+        "warm_requests": self.warm_requests,
+        "warm_seconds_avg": (self.warm_seconds_total / self.warm_requests) if self.warm_requests else 0.0,
+        "warm_seconds_max": self.warm_seconds_max,
+        "build_failures": self.build_failures,
+        "evictions": self.evictions,
+      }
+
+  # ====================================================================================================
+
+  def _notify_evicted(self, evicted):
+    if self.on_evict != None:
+      for evicted_id, evicted_resources in evicted:
+        self.on_evict(evicted_id, evicted_resources)
+
+  # ====================================================================================================
+  # Must be called with self._lock held
+
+  # Returns the (subject_id, resources) it evicted, for the caller to pass to _notify_evicted once it has
+  # released the lock
+  def _insert(self, subject_id: str, resources: SubjectResources):
+    evicted = []
+    previous = self._resident.pop(subject_id, None)
+    if (previous != None and previous is not resources):
+      evicted.append((subject_id, previous))
+    self._resident[subject_id] = resources
+
+    # Evict the least recently used subjects, but never the one that was just inserted
+    while len(self._resident) > 1 and self._over_budget():
+      evicted_id, evicted_resources = self._resident.popitem(last=False)
+      self.evictions += 1
+      evicted.append((evicted_id, evicted_resources))
+    return evicted
+
+  def _over_budget(self) -> bool:
+    if (self.max_subjects != None and len(self._resident) > self.max_subjects):
+      return True
+    if (self.max_memory_bytes != None):
+      return sum(resources.size_bytes for resources in self._resident.values()) > self.max_memory_bytes
+    return False
+
+  def _record_warm(self, seconds: float):
+    self.warm_requests += 1
+    self.warm_seconds_total += seconds
+    self.warm_seconds_max = max(self.warm_seconds_max, seconds)
+
+  def _record_cold(self, seconds: float):
+    with self._lock:
+      self.cold_requests += 1
+      self.cold_seconds_total += seconds
+      self.cold_seconds_max = max(self.cold_seconds_max, seconds)
@@ -0,0 +1,104 @@
+import queue
+import asyncio
+import threading
+import contextvars
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+# ====================================================================================================
+# Forwards the tokens of a streaming LLM to a queue as they are generated. Only LLMs created with
+# streaming=True emit tokens, so a chain's non-streaming helper LLMs (e.g. the question condenser of a
+# ConversationalRetrievalChain) do not leak their output into the stream. Once cancelled is set (the consumer
+# has gone away) the next token raises StreamCancelled, which langchain propagates to stop the chain since
+# the handler sets raise_error.
+
+class StreamCancelled(Exception):
+  pass
+
+class QueueCallbackHandler(BaseCallbackHandler):
+  raise_error = True
+
+  def __init__(self, token_queue: queue.Queue, cancelled: threading.Event = None):
+    self.token_queue = token_queue
+    self.cancelled = cancelled
+
+  def on_llm_new_token(self, token: str, **kwargs):
+    if (self.cancelled != None and self.cancelled.is_set()):
+      raise StreamCancelled()
+    if token:
+      self.token_queue.put(token)
+
+_END_OF_STREAM = object()
+
+# ====================================================================================================
+# Run chain(inputs) on a background thread and yield its answer token by token. An exception raised by
+# the chain is re-raised in the consumer once the tokens produced before it have been yielded. The thread
+# runs in a copy of the caller's context, so context variables (e.g. the request trace of Metrics) are
+# seen by the chain, and when the consumer stops early (e.g. the client disconnected) the chain is stopped
+# at its next token.
+
+def stream_chain(chain, inputs):
+  token_queue = queue.Queue()
+  cancelled = threading.Event()
+
+  def run():
+    try:
+      chain(inputs, callbacks=[QueueCallbackHandler(token_queue, cancelled)])
+    except StreamCancelled:
+      pass
+    except Exception as e:
+      token_queue.put(e)
+    finally:
+      token_queue.put(_END_OF_STREAM)
+
+  threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+  try:
+    while True:
+      item = token_queue.get()
+      if item is _END_OF_STREAM:
+        return
+      if isinstance(item, Exception):
+        raise item
+      yield item
+  finally:
+    cancelled.set()
+
+# ====================================================================================================
+# The asyncio equivalent of stream_chain. The chain runs as a task on the current event loop and its
+# tokens are handed back to the loop thread-safely, since langchain may call synchronous callback
+# handlers from an executor thread.
+
+class AsyncQueueCallbackHandler(BaseCallbackHandler):
+  def __init__(self, token_queue: asyncio.Queue, loop):
+    self.token_queue = token_queue
+    self.loop = loop
+
+  def on_llm_new_token(self, token: str, **kwargs):
+    if token:
+      self.loop.call_soon_threadsafe(self.token_queue.put_nowait, token)
+
+async def astream_chain(chain, inputs):
+  loop = asyncio.get_running_loop()
+  token_queue = asyncio.Queue()
+
+  async def run():
+    try:
+      await chain.acall(inputs, callbacks=[AsyncQueueCallbackHandler(token_queue, loop)])
+    except Exception as e:
+      loop.call_soon_threadsafe(token_queue.put_nowait, e)
+    finally:
+      loop.call_soon_threadsafe(token_queue.put_nowait, _END_OF_STREAM)
+
+  task = asyncio.ensure_future(run())
+  try:
+    while True:
+      item = await token_queue.get()
+      if item is _END_OF_STREAM:
+        return
+      if isinstance(item, Exception):
+        raise item
+      yield item
+  finally:
+    # The consumer went away (e.g. the client disconnected) so stop generating
+    if not task.done():
+      task.cancel()
@@ -0,0 +1,39 @@
+import os
+import multiprocessing
+
+# ====================================================================================================
+# Pre-fork multi-worker serving of APIServer:
+#
+#   gunicorn -c gunicorn.conf.py APIServer:app
+#
+# As with `python APIServer.py`, the port is opened first and the service warms up in the background: the
+# master loads the app (which imports nothing heavy), binds and forks WEB_CONCURRENCY workers, and each
+# worker warms up on a background thread (importing langchain and loading every subject's index) while it
+# already answers /healthz. /readyz reports 503 until the worker is warm, so traffic is only routed to warm
+# workers. The index files are locked while they are refreshed, so only the first worker re-embeds a changed
+# index and the others load it. The trade-off is that each worker imports langchain and builds its chains
+# itself rather than inheriting them from the master. The subject indexes are NumpyVectorStores whose
+# vectors are memory-mapped read-only, so every worker maps the same pages (benchmarks/worker_memory.py
+# measures how much of each worker's memory is shared), and the subject contexts, chat histories and
+# document jobs are kept in a shared SQLite session store, so any worker can serve any request. A worker notices that another process refreshed a subject's index within
+# INDEX_VERSION_CHECK_SECONDS and reloads it. Each worker handles THREADS_PER_WORKER requests at a time.
+
+os.environ.setdefault("VECTOR_STORE", "numpy")
+os.environ.setdefault("SESSION_STORE", "sqlite")
+
+bind = "0.0.0.0:" + os.environ.get("PORT", "8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "gthread"
+threads = int(os.environ.get("THREADS_PER_WORKER", "8"))
+preload_app = True
+# Cover letters and streamed answers can take minutes
+timeout = int(os.environ.get("WORKER_TIMEOUT_SECONDS", "300"))
+keepalive = 5
+
+def pre_fork(server, worker):
+  import APIServer
+  APIServer.career_agent.prepare_to_fork()
+
+def post_fork(server, worker):
+  import APIServer
+  APIServer.career_agent.after_fork(workers)
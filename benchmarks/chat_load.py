@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+
+# ====================================================================================================
+# Load test of /chat against the Flask server (APIServer) and the asyncio server (AsyncAPIServer), both
+# running the real service with stub LLMs and embeddings (see stub_server.py). Each server is started in its
+# own process, loaded at every requested concurrency, and the throughput and latency percentiles are
+# printed and written as JSON. --service sleep measures the servers alone, with a service that only sleeps.
+#
+#   pip install -r app/requirements.txt -r benchmarks/requirements.txt
+#   python benchmarks/chat_load.py --concurrency 8 64 256 --requests 512 --llm-latency 1.0
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+def percentile(values, fraction: float) -> float:
+  if not values:
+    return 0.0
+  ordered = sorted(values)
+  return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+# ====================================================================================================
+
+async def run_load(url: str, concurrency: int, total_requests: int, stream: bool = False):
+  latencies = []
+  first_byte_latencies = []
+  status_counts = {}
+  next_request = 0
+
+  async def worker(client):
+    nonlocal next_request
+    while next_request < total_requests:
+      next_request += 1
+      # A distinct question per request so that the answer cache does not hide the chain
+      body = {"subject_id": "AlexWorden", "message_text": "What is your management philosophy? (" + str(next_request) + ")", "stream": stream}
+      start = time.perf_counter()
+      try:
+        async with client.stream("POST", url + "/chat", json=body) as response:
+          first_byte = None
+          async for chunk in response.aiter_bytes():
+            if first_byte == None:
+              first_byte = time.perf_counter() - start
+          status = response.status_code
+      except httpx.HTTPError as e:
+        status = type(e).__name__
+        first_byte = None
+      status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+      if status == 200:
+        latencies.append(time.perf_counter() - start)
+        if first_byte != None:
+          first_byte_latencies.append(first_byte)
+
+  limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+  async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+  return {
+    "concurrency": concurrency,
+    "requests": total_requests,
+    "stream": stream,
+    "elapsed_seconds": elapsed,
+    "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+    "latency_p50_seconds": percentile(latencies, 0.50),
+    "latency_p95_seconds": percentile(latencies, 0.95),
+    "latency_p99_seconds": percentile(latencies, 0.99),
+    "first_byte_p50_seconds": percentile(first_byte_latencies, 0.50),
+    "status_counts": status_counts,
+  }
+
+# ====================================================================================================
+
+def start_server(server: str, port: int, args) -> subprocess.Popen:
+  env = dict(os.environ, STUB_SERVICE=args.service, STUB_LLM_LATENCY_SECONDS=str(args.llm_latency), STUB_EMBEDDING_LATENCY_SECONDS=str(args.embedding_latency))
+  bind = "127.0.0.1:" + str(port)
+  if server == "flask":
+    # The way the Flask app would be served in production: one process with a fixed pool of threads
+    command = ["gunicorn", "--bind", bind, "--workers", "1", "--worker-class", "gthread", "--threads", str(args.flask_threads), "stub_server:flask_app"]
+  else:
+    env["MAX_UPSTREAM_CALLS"] = str(args.max_upstream_calls)
+    env["MAX_WAITING_REQUESTS"] = str(args.max_waiting_requests)
+    command = ["hypercorn", "--bind", bind, "stub_server:async_app"]
+  process = subprocess.Popen(command, cwd=BENCHMARKS_FOLDER, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  wait_until_listening(port)
+  return process
+
+def wait_until_listening(port: int, timeout_seconds: float = 120.0):
+  deadline = time.monotonic() + timeout_seconds
+  while time.monotonic() < deadline:
+    try:
+      with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+        return
+    except OSError:
+      time.sleep(0.1)
+  raise Exception("Server did not start listening on port " + str(port))
+
+# ====================================================================================================
+
+def main():
+  parser = argparse.ArgumentParser(description="Compare /chat throughput of the Flask and asyncio API servers with a stub LLM")
+  parser.add_argument("--servers", nargs="+", default=["flask", "async"], choices=["flask", "async"])
+  parser.add_argument("--concurrency", nargs="+", type=int, default=[8, 64, 256])
+  parser.add_argument("--requests", type=int, default=512)
+  parser.add_argument("--llm-latency", type=float, default=1.0)
+  parser.add_argument("--embedding-latency", type=float, default=0.05)
+  parser.add_argument("--service", choices=["offline", "sleep"], default="offline")
+  parser.add_argument("--stream", action="store_true")
+  parser.add_argument("--flask-threads", type=int, default=8)
+  parser.add_argument("--max-upstream-calls", type=int, default=256)
+  parser.add_argument("--max-waiting-requests", type=int, default=1024)
+  parser.add_argument("--port", type=int, default=8091)
+  parser.add_argument("--output", default="chat_load_results.json")
+  args = parser.parse_args()
+
+  results = []
+  for server in args.servers:
+    process = start_server(server, args.port, args)
+    try:
+      for concurrency in args.concurrency:
+        result = asyncio.run(run_load("http://127.0.0.1:" + str(args.port), concurrency, args.requests, args.stream))
+        result["server"] = server
+        results.append(result)
+        print(server.ljust(6) + " concurrency=" + str(concurrency).ljust(5) +
+              " throughput=" + format(result["throughput_rps"], ".1f") + " req/s" +
+              " p50=" + format(result["latency_p50_seconds"], ".2f") + "s" +
+              " p95=" + format(result["latency_p95_seconds"], ".2f") + "s" +
+              " statuses=" + json.dumps(result["status_counts"]))
+    finally:
+      process.terminate()
+      process.wait()
+
+  with open(args.output, "w") as f:
+    json.dump({"service": args.service, "llm_latency_seconds": args.llm_latency, "embedding_latency_seconds": args.embedding_latency, "results": results}, f, indent=2)
+  print("Wrote " + args.output)
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,40 @@
+import os
+import sys
+import shutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import stubs
+import CareerAgentService
+
+APP_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+# ====================================================================================================
+# The real CareerAgentService with its models replaced by the stubs, working on a copy of the subject
+# documents in work_folder so benchmarks never touch the real persisted indexes or need an API key.
+
+class OfflineCareerAgentService(CareerAgentService.CareerAgentService):
+
+  def __init__(self, work_folder: str, llm_latency_seconds: float = 0.5, embedding_latency_seconds: float = 0.05, output_tokens: int = 60):
+    super().__init__()
+    self.llm_latency_seconds = llm_latency_seconds
+    self.embedding_latency_seconds = embedding_latency_seconds
+    self.output_tokens = output_tokens
+
+    self.PERSONAL_DOCS_FOLDER = os.path.join(work_folder, "personal_docs")
+    self.PERSIST_FOLDER = os.path.join(work_folder, "personal_docs_persist")
+    self.EMBEDDING_CACHE_PATH = os.path.join(self.PERSIST_FOLDER, "embedding_cache.sqlite")
+    self.GENERATION_MEMO_PATH = os.path.join(self.PERSIST_FOLDER, "generation_memo.sqlite")
+    if not os.path.exists(self.PERSONAL_DOCS_FOLDER):
+      shutil.copytree(os.path.join(APP_FOLDER, "personal_docs"), self.PERSONAL_DOCS_FOLDER)
+
+  def create_chat_model(self, model: str, **kwargs):
+    return stubs.StubChatModel(latency_seconds=self.llm_latency_seconds, output_tokens=self.output_tokens,
+      streaming=kwargs.get("streaming", False), model_name=model, callbacks=self.model_callbacks(model))
+
+  def create_completion_model(self, **kwargs):
+    return stubs.StubLLM(latency_seconds=self.llm_latency_seconds, output_tokens=self.output_tokens,
+      callbacks=self.model_callbacks(kwargs.get("model_name", "stub")))
+
+  def create_embeddings(self):
+    return stubs.StubEmbeddings(latency_seconds=self.embedding_latency_seconds)
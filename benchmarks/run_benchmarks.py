@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+from concurrent.futures import ThreadPoolExecutor
+
+import stubs
+import offline_service
+
+# ====================================================================================================
+# Offline benchmark suite. Runs the real CareerAgentService (and the Flask /chat endpoint) against stub
+# chat, completion and embedding backends with configurable latency and output size, and writes the
+# results as JSON so that runs can be compared to catch regressions before deploying.
+#
+#   python benchmarks/run_benchmarks.py --llm-latency 0.5 --embedding-latency 0.05 --output results.json
+#   python benchmarks/run_benchmarks.py --only index_build cover_letter
+
+SUBJECT_ID = "AlexWorden"
+EDITED_DOCUMENT = "Alex's Accomplishments.txt"
+
+JOB_DESCRIPTION = """We are looking for an Engineering Manager to lead a team of backend engineers building our cloud platform.
+You have 8+ years of software engineering experience and 3+ years managing engineers, experience with Kubernetes and AWS,
+a track record of hiring and mentoring, strong communication skills and experience partnering with product management."""
+
+QUESTIONS = [
+  "What is your management philosophy?",
+  "Tell me about a time you scaled a team.",
+  "Which cloud platforms have you worked with?",
+  "How do you mentor junior engineers?",
+  "What was your biggest accomplishment at your last company?",
+  "How do you handle underperforming team members?",
+  "What programming languages do you know best?",
+  "Why are you looking for a new role?",
+]
+
+# Keyword-style recruiter queries, which the BM25 index can answer without embedding the query
+KEYWORD_QUERIES = ["Kubernetes", "AWS", "Java", "Salesforce", "Python", "Engineering Manager", "hiring", "startup"]
+
+def percentile(values, fraction: float) -> float:
+  ordered = sorted(values)
+  return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+def latency_summary(latencies):
+  return {
+    "count": len(latencies),
+    "mean_seconds": sum(latencies) / len(latencies) if latencies else 0.0,
+    "p50_seconds": percentile(latencies, 0.50),
+    "p95_seconds": percentile(latencies, 0.95),
+    "max_seconds": max(latencies) if latencies else 0.0,
+  }
+
+# Calls made to the stub backends while running fn, with the time it took
+def measure_calls(fn):
+  before = dict(stubs.CALLS)
+  start = time.perf_counter()
+  value = fn()
+  elapsed = time.perf_counter() - start
+  calls = {kind: count - before.get(kind, 0) for kind, count in stubs.CALLS.items() if count != before.get(kind, 0)}
+  return value, elapsed, calls
+
+# ====================================================================================================
+
+def bench_index_build(svc, args):
+  results = {}
+  value, elapsed, calls = measure_calls(lambda: svc.initialize_subject(SUBJECT_ID, rebuild_index=True))
+  results["cold_build"] = {"seconds": elapsed, "calls": calls}
+
+  value, elapsed, calls = measure_calls(lambda: svc.initialize_subject(SUBJECT_ID, rebuild_index=True))
+  results["refresh_unchanged"] = {"seconds": elapsed, "calls": calls}
+
+  with open(os.path.join(svc.PERSONAL_DOCS_FOLDER, SUBJECT_ID, EDITED_DOCUMENT), "a") as f:
+    f.write("\nMentored three engineers into senior roles in a single year.\n")
+  value, elapsed, calls = measure_calls(lambda: svc.initialize_subject(SUBJECT_ID, rebuild_index=True))
+  results["refresh_one_line_edit"] = {"seconds": elapsed, "calls": calls}
+
+  results["startup_report"] = svc.startup_report.as_dict()
+  return results
+
+def bench_query_context(svc, args):
+  svc.get_subject_resources(SUBJECT_ID)
+  latencies = []
+  def run():
+    for i in range(args.queries):
+      start = time.perf_counter()
+      svc.query_context(SUBJECT_ID, QUESTIONS[i % len(QUESTIONS)])
+      latencies.append(time.perf_counter() - start)
+  value, elapsed, calls = measure_calls(run)
+  return {"latency": latency_summary(latencies), "seconds": elapsed, "calls": calls}
+
+# Retrieval latency and embedding calls of each retrieval mode over the same questions and keyword queries.
+# The embedding cache is cleared before each mode so every mode pays for embedding the queries it embeds.
+def bench_retrieval(svc, args):
+  import SharedRetrieval
+  import LexicalIndex
+  import IndexManifest
+  resources = svc.get_subject_resources(SUBJECT_ID)
+  vectorstore = resources.retrieval.vectorstore
+  lexical_index = LexicalIndex.LexicalIndex.from_chunks(*IndexManifest.stored_chunks(vectorstore), version=resources.index_version)
+  queries = QUESTIONS + KEYWORD_QUERIES
+
+  results = {}
+  for mode in ["vector", "hybrid", "auto"]:
+    svc.get_embeddings().clear()
+    retrieval = SharedRetrieval.SubjectRetrieval(vectorstore, resources.index_version, max_k=10, memo_size=0, lexical_index=lexical_index, mode=mode)
+    latencies = []
+    def run():
+      for query in queries:
+        start = time.perf_counter()
+        retrieval.search(query, 4)
+        latencies.append(time.perf_counter() - start)
+    value, elapsed, calls = measure_calls(run)
+    stats = retrieval.stats()
+    results[mode] = {
+      "latency": latency_summary(latencies),
+      "embedding_calls": calls.get("embedding", 0),
+      "rankings": {kind: stats[kind + "_rankings"] for kind in ["vector", "hybrid", "lexical"]},
+      "calls": calls,
+    }
+  return results
+
+def bench_chat(svc, args):
+  import APIServer
+  APIServer.career_agent = svc
+  svc.get_subject_resources(SUBJECT_ID)
+  client = APIServer.app.test_client()
+
+  results = {}
+  for concurrency in args.concurrency:
+    latencies = []
+    statuses = {}
+    def post(i):
+      # A distinct question per request so that the answer cache does not hide the LLM latency
+      body = {"subject_id": SUBJECT_ID, "message_text": QUESTIONS[i % len(QUESTIONS)] + " (" + str(concurrency) + "-" + str(i) + ")"}
+      start = time.perf_counter()
+      response = client.post("/chat", json=body)
+      latencies.append(time.perf_counter() - start)
+      statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+    def run():
+      with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(post, range(args.chat_requests)))
+    value, elapsed, calls = measure_calls(run)
+    results[str(concurrency)] = {
+      "throughput_rps": args.chat_requests / elapsed if elapsed else 0.0,
+      "latency": latency_summary(latencies),
+      "status_counts": statuses,
+      "calls": calls,
+    }
+  return results
+
+# Embedding calls and latency of the full /chat path (answer cache, retrieval and LLM) in each retrieval
+# mode, over the same questions and keyword queries. The subject is reloaded in each mode, and the
+# embedding and answer caches are cleared, so every mode pays for the embeddings it needs.
+def bench_chat_retrieval_modes(svc, args):
+  import APIServer
+  APIServer.career_agent = svc
+  client = APIServer.app.test_client()
+  queries = QUESTIONS + KEYWORD_QUERIES
+  default_mode = svc.RETRIEVAL_MODE
+
+  results = {}
+  try:
+    for mode in ["vector", "hybrid", "auto"]:
+      svc.RETRIEVAL_MODE = mode
+      svc.subject_registry.invalidate(SUBJECT_ID)
+      svc.get_subject_resources(SUBJECT_ID)
+      svc.get_embeddings().clear()
+      svc.answer_cache.invalidate(SUBJECT_ID)
+      latencies = []
+      def run():
+        for query in queries:
+          start = time.perf_counter()
+          client.post("/chat", json={"subject_id": SUBJECT_ID, "message_text": query})
+          latencies.append(time.perf_counter() - start)
+      value, elapsed, calls = measure_calls(run)
+      results[mode] = {
+        "latency": latency_summary(latencies),
+        "embedding_calls": calls.get("embedding", 0),
+        "calls": calls,
+        "answer_cache": svc.answer_cache.stats(),
+      }
+  finally:
+    svc.RETRIEVAL_MODE = default_mode
+    svc.subject_registry.invalidate(SUBJECT_ID)
+  return results
+
+def bench_cover_letter(svc, args):
+  subject_context = svc.get_subject_context(SUBJECT_ID)
+  subject_context.job_desc = JOB_DESCRIPTION
+  subject_context.job_title = "Engineering Manager"
+  subject_context.company_name = "Example Corp"
+  svc.save_subject_context(subject_context)
+  svc.get_subject_resources(SUBJECT_ID)
+
+  runs = []
+  for i in range(args.cover_letters):
+    cover_letter, elapsed, calls = measure_calls(lambda: svc.generate_cover_letter(SUBJECT_ID))
+    runs.append({"seconds": elapsed, "calls": calls, "characters": len(cover_letter)})
+  return {"latency": latency_summary([run["seconds"] for run in runs]), "runs": runs}
+
+BENCHMARKS = {
+  "index_build": bench_index_build,
+  "query_context": bench_query_context,
+  "retrieval": bench_retrieval,
+  "chat": bench_chat,
+  "chat_retrieval_modes": bench_chat_retrieval_modes,
+  "cover_letter": bench_cover_letter,
+}
+
+# ====================================================================================================
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the career agent offline against stub LLM and embedding backends")
+  parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS.keys()), default=list(BENCHMARKS.keys()))
+  parser.add_argument("--llm-latency", type=float, default=0.5)
+  parser.add_argument("--embedding-latency", type=float, default=0.05)
+  parser.add_argument("--output-tokens", type=int, default=60)
+  parser.add_argument("--queries", type=int, default=16)
+  parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+  parser.add_argument("--chat-requests", type=int, default=64)
+  parser.add_argument("--cover-letters", type=int, default=2)
+  parser.add_argument("--output", default="benchmark_results.json")
+  args = parser.parse_args()
+
+  results = {}
+  with tempfile.TemporaryDirectory() as work_folder:
+    svc = offline_service.OfflineCareerAgentService(work_folder, args.llm_latency, args.embedding_latency, args.output_tokens)
+    for name in args.only:
+      print("Running " + name + "...")
+      results[name] = BENCHMARKS[name](svc, args)
+      print(json.dumps(results[name], indent=2))
+
+  report = {
+    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    "python": platform.python_version(),
+    "config": {
+      "llm_latency_seconds": args.llm_latency,
+      "embedding_latency_seconds": args.embedding_latency,
+      "output_tokens": args.output_tokens,
+    },
+    "results": results,
+  }
+  with open(args.output, "w") as f:
+    json.dump(report, f, indent=2)
+  print("Wrote " + args.output)
+
+if __name__ == "__main__":
+  sys.exit(main())
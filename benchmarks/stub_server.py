@@ -0,0 +1,44 @@
+import os
+import sys
+import types
+import tempfile
+
+# ====================================================================================================
+# Loads the API servers for chat_load.py:
+#
+#   gunicorn -k gthread --threads 8 stub_server:flask_app
+#   hypercorn stub_server:async_app
+#
+# By default the servers run the real CareerAgentService (OfflineCareerAgentService) with stub LLMs and
+# embeddings, so a request goes through the same chains, retrieval and caches as in production, sync or
+# async. STUB_SERVICE=sleep swaps in StubCareerAgentService instead, which only sleeps for the LLM latency,
+# to measure the servers on their own.
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import stubs
+
+SUBJECT_ID = "AlexWorden"
+
+if os.environ.get("STUB_SERVICE", "offline") == "sleep":
+  stub_module = types.ModuleType("CareerAgentService")
+  stub_module.CareerAgentService = lambda: stubs.StubCareerAgentService(float(os.environ.get("STUB_LLM_LATENCY_SECONDS", "1.0")))
+  sys.modules["CareerAgentService"] = stub_module
+else:
+  import offline_service
+  import CareerAgentService
+  work_folder = os.environ.get("BENCHMARK_WORK_FOLDER") or tempfile.mkdtemp(prefix="chat_load_")
+  CareerAgentService.CareerAgentService = lambda: offline_service.OfflineCareerAgentService(work_folder,
+    llm_latency_seconds = float(os.environ.get("STUB_LLM_LATENCY_SECONDS", "1.0")),
+    embedding_latency_seconds = float(os.environ.get("STUB_EMBEDDING_LATENCY_SECONDS", "0.05")),
+    output_tokens = int(os.environ.get("STUB_OUTPUT_TOKENS", "60")))
+
+import APIServer
+import AsyncAPIServer
+
+# Build the subject before serving so the first requests are not measured with the index build
+for service in (APIServer.career_agent, AsyncAPIServer.career_agent):
+  service.warm_up([SUBJECT_ID])
+
+flask_app = APIServer.app
+async_app = AsyncAPIServer.app
@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from collections import Counter
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain.chat_models.base import BaseChatModel
+from langchain.llms.base import LLM
+from langchain.schema import AIMessage, ChatGeneration, ChatResult
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import StartupReport
+
+# ====================================================================================================
+# Local stand-ins for the OpenAI backed pieces of the app so that performance can be measured offline,
+# without an API key and without paying for tokens. Latencies are configurable to mimic the real service.
+
+STUB_ANSWER = "I have led engineering teams building distributed systems for over twenty years, most recently as a hands on engineering manager."
+
+# A CareerAgentService replacement for load testing the API servers. Every answer takes latency_seconds
+# and the streaming variants spread that time evenly across the tokens of the answer.
+class StubCareerAgentService:
+
+  def __init__(self, latency_seconds: float = 1.0, answer: str = STUB_ANSWER):
+    self.latency_seconds = latency_seconds
+    self.answer = answer
+    self.startup_report = StartupReport.StartupReport()
+
+  def warm_up(self, subject_ids = None):
+    self.startup_report.mark("ready")
+
+  def is_ready(self) -> bool:
+    return "ready" in self.startup_report.milestones
+
+  def get_warm_up_status(self):
+    return {"state": "ready" if self.is_ready() else "warming", "error": None, "startup": self.startup_report.as_dict()}
+
+  def _tokens(self):
+    words = self.answer.split(" ")
+    return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+  def ask_simple_with_context(self, subject_id, question: str, use_chat_history=False, session_id: str = None):
+    time.sleep(self.latency_seconds)
+    return self.answer
+
+  def stream_simple_with_context(self, subject_id, question: str, use_chat_history=False, session_id: str = None):
+    tokens = self._tokens()
+    for token in tokens:
+      time.sleep(self.latency_seconds / len(tokens))
+      yield token
+
+  async def aask_simple_with_context(self, subject_id, question: str, use_chat_history=False, session_id: str = None):
+    await asyncio.sleep(self.latency_seconds)
+    return self.answer
+
+  async def astream_simple_with_context(self, subject_id, question: str, use_chat_history=False, session_id: str = None):
+    tokens = self._tokens()
+    for token in tokens:
+      await asyncio.sleep(self.latency_seconds / len(tokens))
+      yield token
+
+# ====================================================================================================
+# Deterministic embeddings: the vector of a text is seeded by its hash, so equal texts always embed to the
+# same unit vector. embed_calls and embedded_texts count the work a real embedding API would have done.
+
+class StubEmbeddings:
+
+  def __init__(self, dimensions: int = 1536, latency_seconds: float = 0.0, model: str = "stub-embedding"):
+    self.dimensions = dimensions
+    self.latency_seconds = latency_seconds
+    self.model = model
+    self.embed_calls = 0
+    self.embedded_texts = 0
+
+  def _vector(self, text: str):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(self.dimensions).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+  def _count(self, text_count: int):
+    with _CALLS_LOCK:
+      self.embed_calls += 1
+      self.embedded_texts += text_count
+      CALLS["embedding"] += 1
+      CALLS["embedded_texts"] += text_count
+
+  def embed_documents(self, texts):
+    self._count(len(texts))
+    time.sleep(self.latency_seconds)
+    return [self._vector(text) for text in texts]
+
+  def embed_query(self, text):
+    self._count(1)
+    time.sleep(self.latency_seconds)
+    return self._vector(text)
+
+  async def aembed_documents(self, texts):
+    return await asyncio.to_thread(self.embed_documents, texts)
+
+  async def aembed_query(self, text):
+    return await asyncio.to_thread(self.embed_query, text)
+
+# ====================================================================================================
+# Stand-ins for ChatOpenAI (the chains and summaries) and OpenAI (query_context and ask_without_context).
+# Each call sleeps for latency_seconds and answers with output_tokens words. Prompts that ask for a JSON
+# list get a JSON list, so the cover letter pipeline can parse them. CALLS counts calls by kind across all
+# stub models and is safe to read from any thread.
+
+CALLS = Counter()
+_CALLS_LOCK = threading.Lock()
+
+STUB_WORDS = ("I led teams that designed built and operated reliable cloud platforms and mentored engineers "
+              "while partnering with product to deliver customer value at scale").split()
+
+def count_call(kind: str, prompt_tokens: int, completion_tokens: int):
+  with _CALLS_LOCK:
+    CALLS[kind] += 1
+    CALLS[kind + "_prompt_tokens"] += prompt_tokens
+    CALLS[kind + "_completion_tokens"] += completion_tokens
+
+def stub_text(prompt: str, output_tokens: int) -> str:
+  rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+  if "JSON" in prompt:
+    items = [" ".join(rng.choice(STUB_WORDS) for _ in range(max(1, output_tokens // 6))) for _ in range(6)]
+    return json.dumps(items)
+  return " ".join(rng.choice(STUB_WORDS) for _ in range(output_tokens))
+
+def stub_tokens(text: str):
+  words = text.split(" ")
+  return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+def token_usage(prompt: str, text: str):
+  prompt_tokens = len(prompt.split())
+  completion_tokens = len(text.split())
+  return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+class StubChatModel(BaseChatModel):
+  latency_seconds: float = 0.5
+  output_tokens: int = 60
+  streaming: bool = False
+  model_name: str = "stub-chat"
+
+  @property
+  def _llm_type(self) -> str:
+    return "stub-chat"
+
+  def _result(self, prompt: str, text: str) -> ChatResult:
+    usage = token_usage(prompt, text)
+    count_call("chat", usage["prompt_tokens"], usage["completion_tokens"])
+    return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))],
+      llm_output={"token_usage": usage, "model_name": self.model_name})
+
+  def _generate(self, messages, stop: Optional[List[str]] = None, run_manager = None, **kwargs: Any) -> ChatResult:
+    prompt = "\n".join(message.content for message in messages)
+    text = stub_text(prompt, self.output_tokens)
+    tokens = stub_tokens(text)
+    for token in tokens:
+      time.sleep(self.latency_seconds / len(tokens))
+      if (self.streaming and run_manager != None):
+        run_manager.on_llm_new_token(token)
+    return self._result(prompt, text)
+
+  async def _agenerate(self, messages, stop: Optional[List[str]] = None, run_manager = None, **kwargs: Any) -> ChatResult:
+    prompt = "\n".join(message.content for message in messages)
+    text = stub_text(prompt, self.output_tokens)
+    tokens = stub_tokens(text)
+    for token in tokens:
+      await asyncio.sleep(self.latency_seconds / len(tokens))
+      if (self.streaming and run_manager != None):
+        await run_manager.on_llm_new_token(token)
+    return self._result(prompt, text)
+
+class StubLLM(LLM):
+  latency_seconds: float = 0.5
+  output_tokens: int = 60
+
+  @property
+  def _llm_type(self) -> str:
+    return "stub-completion"
+
+  def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager = None, **kwargs: Any) -> str:
+    time.sleep(self.latency_seconds)
+    text = stub_text(prompt, self.output_tokens)
+    usage = token_usage(prompt, text)
+    count_call("completion", usage["prompt_tokens"], usage["completion_tokens"])
+    return text
+
+  async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager = None, **kwargs: Any) -> str:
+    await asyncio.sleep(self.latency_seconds)
+    text = stub_text(prompt, self.output_tokens)
+    usage = token_usage(prompt, text)
+    count_call("completion", usage["prompt_tokens"], usage["completion_tokens"])
+    return text
@@ -0,0 +1,129 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+# ====================================================================================================
+# Compares Chroma with the in-process NumpyVectorStore on a synthetic subject corpus embedded with
+# StubEmbeddings. The index is built once with Chroma and imported into a NumpyVectorStore, then each
+# store is loaded and queried in a fresh process so that load time and RSS are measured from a cold start.
+#
+#   python benchmarks/vectorstore_benchmark.py --chunks 500 --queries 200
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_FOLDER, "..", "app"))
+
+WORDS = ("engineering manager team platform kubernetes salesforce java python distributed systems hiring mentoring "
+         "roadmap delivery architecture cloud reliability startup scale product customer agile leadership").split()
+
+def synthetic_chunks(count: int, seed: int = 7):
+  rng = random.Random(seed)
+  return [" ".join(rng.choice(WORDS) for _ in range(150)) + " #" + str(i) for i in range(count)]
+
+def rss_bytes() -> int:
+  try:
+    with open("/proc/self/status") as f:
+      for line in f:
+        if line.startswith("VmRSS:"):
+          return int(line.split()[1]) * 1024
+  except OSError:
+    pass
+  import resource
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def percentile(values, fraction: float) -> float:
+  ordered = sorted(values)
+  return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+# ====================================================================================================
+
+def build(folder: str, chunk_count: int, dimensions: int):
+  from langchain.vectorstores import Chroma
+  import NumpyVectorStore
+  import stubs
+
+  texts = synthetic_chunks(chunk_count)
+  embeddings = stubs.StubEmbeddings(dimensions)
+  chroma_folder = os.path.join(folder, "chroma")
+  chroma = Chroma.from_texts(texts, embeddings, ids=[str(i) for i in range(len(texts))], persist_directory=chroma_folder)
+  if hasattr(chroma, "persist"):
+    chroma.persist()
+  NumpyVectorStore.NumpyVectorStore.from_chroma(chroma_folder, embeddings, persist_directory=os.path.join(folder, "numpy")).persist()
+
+# Runs in a child process: load one store, then time top-k queries
+def measure(store: str, folder: str, query_count: int, k: int, dimensions: int):
+  baseline_rss = rss_bytes()
+  start = time.perf_counter()
+  import stubs
+  embeddings = stubs.StubEmbeddings(dimensions)
+  if store == "chroma":
+    from langchain.vectorstores import Chroma
+    vectorstore = Chroma(persist_directory=os.path.join(folder, "chroma"), embedding_function=embeddings)
+  else:
+    import NumpyVectorStore
+    vectorstore = NumpyVectorStore.NumpyVectorStore(embeddings, persist_directory=os.path.join(folder, "numpy"))
+  # The first query forces any lazy loading so that it is counted as part of the load
+  vectorstore.similarity_search("warm up", k=k)
+  load_seconds = time.perf_counter() - start
+  loaded_rss = rss_bytes()
+
+  # Embed the queries up front so only the search itself is timed
+  query_vectors = [embeddings.embed_query(text) for text in synthetic_chunks(query_count, seed=11)]
+  latencies = []
+  for vector in query_vectors:
+    query_start = time.perf_counter()
+    vectorstore.similarity_search_by_vector(vector, k=k)
+    latencies.append(time.perf_counter() - query_start)
+
+  return {
+    "store": store,
+    "load_seconds": load_seconds,
+    "rss_bytes": loaded_rss,
+    "rss_added_by_load_bytes": loaded_rss - baseline_rss,
+    "query_p50_seconds": percentile(latencies, 0.50),
+    "query_p95_seconds": percentile(latencies, 0.95),
+    "queries": query_count,
+    "k": k,
+  }
+
+# ====================================================================================================
+
+def main():
+  parser = argparse.ArgumentParser(description="Compare Chroma and NumpyVectorStore load time, RSS and query latency")
+  parser.add_argument("--chunks", type=int, default=500)
+  parser.add_argument("--dimensions", type=int, default=1536)
+  parser.add_argument("--queries", type=int, default=200)
+  parser.add_argument("--k", type=int, default=10)
+  parser.add_argument("--output", default="vectorstore_results.json")
+  parser.add_argument("--measure", choices=["chroma", "numpy"], help=argparse.SUPPRESS)
+  parser.add_argument("--folder", help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.measure:
+    print(json.dumps(measure(args.measure, args.folder, args.queries, args.k, args.dimensions)))
+    return
+
+  with tempfile.TemporaryDirectory() as folder:
+    build(folder, args.chunks, args.dimensions)
+    results = []
+    for store in ["chroma", "numpy"]:
+      output = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", store, "--folder", folder,
+        "--queries", str(args.queries), "--k", str(args.k), "--dimensions", str(args.dimensions)],
+        check=True, capture_output=True, text=True).stdout
+      result = json.loads(output.strip().splitlines()[-1])
+      results.append(result)
+      print(store.ljust(7) + " load=" + format(result["load_seconds"] * 1000, ".1f") + "ms" +
+            " rss=" + format(result["rss_bytes"] / 1e6, ".1f") + "MB" +
+            " query p50=" + format(result["query_p50_seconds"] * 1000, ".3f") + "ms" +
+            " p95=" + format(result["query_p95_seconds"] * 1000, ".3f") + "ms")
+
+  with open(args.output, "w") as f:
+    json.dump({"chunks": args.chunks, "dimensions": args.dimensions, "results": results}, f, indent=2)
+  print("Wrote " + args.output)
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+import argparse
+
+# ====================================================================================================
+# Measures how much memory the workers of a running pre-fork server (see app/gunicorn.conf.py) share. For
+# the master and each of its workers it reads /proc/<pid>/smaps_rollup (Linux 4.14+) and reports the RSS,
+# the PSS (each shared page divided between the processes that map it), and the shared and private pages.
+# The private bytes of a worker are what one more worker costs; their total against the summed RSS shows
+# how much the memory-mapped indexes and the pages inherited from the master save.
+#
+#   gunicorn -c gunicorn.conf.py APIServer:app --pid /tmp/gunicorn.pid
+#   python benchmarks/worker_memory.py --pidfile /tmp/gunicorn.pid --output worker_memory.json
+#
+# Measure after warm-up and under load (chat_load.py), since pages are only shared until a worker writes them.
+
+FIELDS = {"Rss": "rss_bytes", "Pss": "pss_bytes", "Shared_Clean": "shared_clean_bytes", "Shared_Dirty": "shared_dirty_bytes",
+          "Private_Clean": "private_clean_bytes", "Private_Dirty": "private_dirty_bytes"}
+
+def memory_of(pid: int):
+  memory = {}
+  with open("/proc/" + str(pid) + "/smaps_rollup") as f:
+    for line in f:
+      parts = line.split()
+      if (len(parts) >= 2 and parts[0].rstrip(":") in FIELDS):
+        memory[FIELDS[parts[0].rstrip(":")]] = int(parts[1]) * 1024
+  memory["private_bytes"] = memory.get("private_clean_bytes", 0) + memory.get("private_dirty_bytes", 0)
+  return memory
+
+def children_of(pid: int):
+  children = []
+  for name in os.listdir("/proc"):
+    if not name.isdigit():
+      continue
+    try:
+      with open("/proc/" + name + "/stat") as f:
+        # The parent pid is the second field after the parenthesized command name
+        if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+          children.append(int(name))
+    except (OSError, IndexError, ValueError):
+      pass
+  return sorted(children)
+
+def total(memories, field: str) -> int:
+  return sum(memory.get(field, 0) for memory in memories)
+
+# ====================================================================================================
+
+def main():
+  parser = argparse.ArgumentParser(description="Report the RSS, PSS and shared memory of a pre-fork server's master and workers")
+  group = parser.add_mutually_exclusive_group(required=True)
+  group.add_argument("--pid", type=int)
+  group.add_argument("--pidfile")
+  parser.add_argument("--output", default=None)
+  args = parser.parse_args()
+
+  master_pid = args.pid
+  if (master_pid == None):
+    with open(args.pidfile) as f:
+      master_pid = int(f.read().strip())
+
+  workers = {pid: memory_of(pid) for pid in children_of(master_pid)}
+  report = {
+    "master": memory_of(master_pid),
+    "workers": {str(pid): memory for pid, memory in workers.items()},
+    "worker_count": len(workers),
+    "workers_rss_bytes": total(workers.values(), "rss_bytes"),
+    "workers_pss_bytes": total(workers.values(), "pss_bytes"),
+    "workers_private_bytes": total(workers.values(), "private_bytes"),
+    "private_bytes_per_worker": (total(workers.values(), "private_bytes") / len(workers)) if workers else 0.0,
+  }
+  print(json.dumps(report, indent=2))
+  if (args.output != None):
+    with open(args.output, "w") as f:
+      json.dump(report, f, indent=2)
+    print("Wrote " + args.output)
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+# The API servers build a service when they are imported, which keeps its files in the working directory
+@pytest.fixture
+def async_api_server(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  import AsyncAPIServer
+  return AsyncAPIServer
+
+def test_requests_beyond_the_waiting_limit_are_rejected(async_api_server):
+  async def run():
+    admission = async_api_server.AdmissionControl(max_in_flight=1, max_waiting=1)
+    await admission.acquire()
+    waiting = asyncio.ensure_future(admission.acquire())
+    await asyncio.sleep(0)
+    with pytest.raises(async_api_server.Overloaded):
+      await admission.acquire()
+    admission.release()
+    await waiting
+    assert (admission.in_flight, admission.waiting, admission.rejected) == (1, 0, 1)
+  asyncio.run(run())
+
+def test_an_overloaded_server_answers_503_with_retry_after(async_api_server, monkeypatch):
+  async def run():
+    admission = async_api_server.AdmissionControl(max_in_flight=1, max_waiting=0)
+    monkeypatch.setattr(async_api_server, "admission", admission)
+    await admission.acquire()
+    response = await async_api_server.app.test_client().post("/chat", json={"subject_id": "AlexWorden", "message_text": "Hi"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert admission.rejected == 1
+  asyncio.run(run())
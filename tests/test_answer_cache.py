@@ -0,0 +1,74 @@
+import numpy as np
+
+import AnswerCache
+
+# Embeds questions the way ada-002 treats them: every question about "experience with <something>" lands
+# close to the same point, well above the similarity threshold, whatever the something is
+class EntityBlindEmbeddings:
+  def __init__(self):
+    self.calls = 0
+
+  def embed_documents(self, questions):
+    self.calls += 1
+    return [self.vector(question) for question in questions]
+
+  def embed_query(self, question: str):
+    self.calls += 1
+    return self.vector(question)
+
+  def vector(self, question: str):
+    base = np.ones(8, dtype=np.float32)
+    if "experience" in question.lower():
+      base[0] += 5
+    # A small per-question perturbation, so the vectors are near but not identical
+    base[1] += (sum(map(ord, question)) % 7) * 0.02
+    return base.tolist()
+
+def test_questions_differing_in_one_entity_do_not_collide():
+  embeddings = EntityBlindEmbeddings()
+  cache = AnswerCache.AnswerCache(embeddings.embed_documents)
+  cache.put("alex", "v1", "Do you have experience with Java?", "Yes, ten years of Java.")
+
+  vector_java = cache._unit_vector(embeddings.embed_query("Do you have experience with Java?"))
+  vector_python = cache._unit_vector(embeddings.embed_query("Do you have experience with Python?"))
+  assert float(vector_java @ vector_python) > cache.similarity_threshold
+
+  assert cache.get("alex", "v1", "Do you have experience with Python?") == None
+  assert cache.stats()["semantic_hits"] == 0
+
+def test_paraphrase_with_the_same_terms_is_a_semantic_hit():
+  embeddings = EntityBlindEmbeddings()
+  cache = AnswerCache.AnswerCache(embeddings.embed_documents)
+  cache.put("alex", "v1", "Do you have experience with Java?", "Yes, ten years of Java.")
+
+  assert cache.get("alex", "v1", "What experience do you have with Java") == "Yes, ten years of Java."
+  assert cache.stats()["semantic_hits"] == 1
+
+def test_exact_match_ignores_case_and_punctuation():
+  cache = AnswerCache.AnswerCache(EntityBlindEmbeddings().embed_documents)
+  cache.put("alex", "v1", "Why this role?", "Because.")
+  assert cache.get("alex", "v1", "why this ROLE") == "Because."
+  assert cache.stats()["exact_hits"] == 1
+
+def test_a_new_index_version_drops_the_answers():
+  cache = AnswerCache.AnswerCache(EntityBlindEmbeddings().embed_documents)
+  cache.put("alex", "v1", "Why this role?", "Because.")
+  assert cache.get("alex", "v2", "Why this role?") == None
+
+def test_a_question_without_a_lexical_neighbour_is_not_embedded():
+  embeddings = EntityBlindEmbeddings()
+  cache = AnswerCache.AnswerCache(embeddings.embed_documents)
+  cache.put("alex", "v1", "Do you have experience with Java?", "Yes, ten years of Java.")
+  assert cache.get("alex", "v1", "Why do you want to work at Acme?") == None
+  assert embeddings.calls == 0
+
+def test_the_question_and_its_candidates_are_embedded_in_one_call():
+  embeddings = EntityBlindEmbeddings()
+  cache = AnswerCache.AnswerCache(embeddings.embed_documents)
+  for language in ["Java", "Python", "Go"]:
+    cache.put("alex", "v1", "Experience with " + language + " at work?", "Some.")
+  cache.get("alex", "v1", "Experience with Rust at work?")
+  assert embeddings.calls == 1
+  # The candidates keep their vectors, so the next lookup only embeds the question
+  cache.get("alex", "v1", "Experience with Scala at work?")
+  assert embeddings.calls == 2
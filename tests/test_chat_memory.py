@@ -0,0 +1,56 @@
+import ChatMemory
+import SessionStore
+
+# One token per word, so that budgets can be worked out by hand (and no encoding is downloaded)
+class WordEncoding:
+  def encode(self, text: str):
+    return text.split()
+
+def chat_memory(summarize = None, **kwargs):
+  memory = ChatMemory.ChatMemory(summarize or (lambda summary, turns: "summary"), **kwargs)
+  memory.encoding = WordEncoding()
+  return memory
+
+def test_sessions_do_not_see_each_others_turns():
+  memory = chat_memory()
+  memory.append("alex", "visitor-1", "Where do you live?", "Seattle.")
+  memory.append("alex", "visitor-2", "Favourite language?", "Python.")
+  memory.append("sam", "visitor-1", "Where do you live?", "Boston.")
+  assert memory.get_history("alex", "visitor-1") == [("Where do you live?", "Seattle.")]
+  assert memory.get_history("alex", "visitor-2") == [("Favourite language?", "Python.")]
+  assert memory.get_history("sam", "visitor-1") == [("Where do you live?", "Boston.")]
+
+  memory.clear("alex", "visitor-1")
+  assert memory.get_history("alex", "visitor-1") == []
+  assert memory.get_history("alex", "visitor-2") == [("Favourite language?", "Python.")]
+
+def test_the_history_keeps_the_most_recent_turns_within_the_budget():
+  # Compaction is kept out of the way by keeping more recent turns than are appended
+  memory = chat_memory(token_budget=10, keep_recent_turns=10)
+  for number in ["one", "two", "three"]:
+    memory.append("alex", "visitor", "Question " + number + " here?", "Answer " + number + ".")
+  # Each turn is five words, so only the last two fit
+  assert memory.get_history("alex", "visitor") == [("Question two here?", "Answer two."), ("Question three here?", "Answer three.")]
+
+def test_older_turns_are_folded_into_a_summary():
+  summarized = []
+  def summarize(summary, turns):
+    summarized.extend(turns)
+    return "Talked about one."
+  memory = chat_memory(summarize, token_budget=10, keep_recent_turns=1, max_workers=1)
+  memory.append("alex", "visitor", "Question one here?", "Answer one.")
+  memory.append("alex", "visitor", "Question two here?", "Answer two.")
+  memory.append("alex", "visitor", "Question three here?", "Answer three.")
+  memory._executor.shutdown(wait=True)
+  history = memory.get_history("alex", "visitor")
+  assert history[0] == (ChatMemory.SUMMARY_QUESTION, "Talked about one.")
+  assert history[-1] == ("Question three here?", "Answer three.")
+  assert ("Question one here?", "Answer one.") in summarized
+
+def test_workers_share_sessions_through_the_store(tmp_path):
+  store = SessionStore.SessionStore(str(tmp_path / "sessions.sqlite"))
+  first, second = [ChatMemory.SharedChatMemory(store, lambda summary, turns: "summary") for worker in range(2)]
+  first.encoding = second.encoding = WordEncoding()
+  first.append("alex", "visitor-1", "Where do you live?", "Seattle.")
+  assert second.get_history("alex", "visitor-1") == [("Where do you live?", "Seattle.")]
+  assert second.get_history("alex", "visitor-2") == []
@@ -0,0 +1,40 @@
+import time
+import threading
+import contextvars
+
+import ConcurrentCalls
+
+def test_results_are_in_the_order_of_the_items():
+  # The first items finish last
+  results = ConcurrentCalls.map_ordered(lambda delay: time.sleep(delay) or delay, [0.05, 0.03, 0.01, 0.0], max_workers=4)
+  assert [result.item for result in results] == [0.05, 0.03, 0.01, 0.0]
+  assert [result.value for result in results] == [0.05, 0.03, 0.01, 0.0]
+
+def test_an_error_is_reported_with_its_item_only():
+  def call(item):
+    if item == 2:
+      raise ValueError("bad item")
+    return item * 10
+  results = ConcurrentCalls.map_ordered(call, [1, 2, 3], max_workers=2)
+  assert [result.ok for result in results] == [True, False, True]
+  assert [result.value for result in results if result.ok] == [10, 30]
+  assert isinstance(results[1].error, ValueError)
+
+def test_a_slow_call_times_out_without_holding_up_the_others():
+  release = threading.Event()
+  def call(item):
+    if item == "slow":
+      release.wait(5)
+    return item
+  started = time.monotonic()
+  results = ConcurrentCalls.map_ordered(call, ["fast", "slow", "also fast"], max_workers=3, timeout_seconds=0.1)
+  release.set()
+  assert time.monotonic() - started < 2
+  assert [result.ok for result in results] == [True, False, True]
+  assert isinstance(results[1].error, TimeoutError)
+
+def test_the_calls_see_the_callers_context():
+  request_id = contextvars.ContextVar("request_id", default=None)
+  request_id.set("abc")
+  results = ConcurrentCalls.map_ordered(lambda item: request_id.get(), [1, 2], max_workers=2)
+  assert [result.value for result in results] == ["abc", "abc"]
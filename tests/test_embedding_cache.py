@@ -0,0 +1,58 @@
+import time
+import sqlite3
+
+import EmbeddingCache
+
+# Counts the texts it is asked to embed
+class CountingEmbeddings:
+  model = "counting"
+
+  def __init__(self):
+    self.embedded = []
+
+  def embed_documents(self, texts):
+    self.embedded.extend(texts)
+    return [[float(len(text)), 1.0] for text in texts]
+
+  def embed_query(self, text):
+    return self.embed_documents([text])[0]
+
+def last_used(cache, text: str) -> float:
+  with sqlite3.connect(cache.cache_path) as connection:
+    return connection.execute("SELECT last_used FROM embeddings WHERE text_hash = ?", (cache._key(text),)).fetchone()[0]
+
+def test_each_text_is_embedded_once(tmp_path):
+  embeddings = CountingEmbeddings()
+  cache = EmbeddingCache.CachedEmbeddings(embeddings, str(tmp_path / "cache.sqlite"))
+  assert cache.embed_documents(["a", "bb", "a"]) == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+  assert cache.embed_query("bb") == [2.0, 1.0]
+  assert embeddings.embedded == ["a", "bb"]
+  stats = cache.stats()
+  assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 3, 2)
+
+def test_hits_are_recorded_in_batches(tmp_path):
+  cache = EmbeddingCache.CachedEmbeddings(CountingEmbeddings(), str(tmp_path / "cache.sqlite"), touch_flush_size=100, touch_flush_seconds=3600)
+  cache.embed_query("a")
+  stored = last_used(cache, "a")
+  time.sleep(0.01)
+  cache.embed_query("a")
+  assert last_used(cache, "a") == stored
+  cache.close()
+  assert last_used(cache, "a") > stored
+
+def test_the_least_recently_used_entries_are_evicted(tmp_path):
+  embeddings = CountingEmbeddings()
+  cache = EmbeddingCache.CachedEmbeddings(embeddings, str(tmp_path / "cache.sqlite"), max_entries=3, evict_to_fraction=1.0)
+  for text in ["a", "bb", "ccc"]:
+    cache.embed_query(text)
+    time.sleep(0.01)
+  cache.embed_query("a")
+  time.sleep(0.01)
+  cache.embed_query("dddd")
+  assert cache.stats()["evictions"] == 1
+  assert cache.stats()["entries"] == 3
+
+  embeddings.embedded = []
+  for text in ["a", "ccc", "dddd", "bb"]:
+    cache.embed_query(text)
+  assert embeddings.embedded == ["bb"]
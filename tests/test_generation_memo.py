@@ -0,0 +1,33 @@
+import time
+import sqlite3
+
+import GenerationMemo
+
+def last_used(memo, job_desc: str) -> float:
+  with sqlite3.connect(memo.cache_path) as connection:
+    return connection.execute("SELECT last_used FROM qualifications WHERE job_hash = ?", (GenerationMemo.hash_job_description(job_desc),)).fetchone()[0]
+
+def test_hits_are_recorded_in_batches(tmp_path):
+  memo = GenerationMemo.GenerationMemo(str(tmp_path / "memo.sqlite"), touch_flush_size=100, touch_flush_seconds=3600)
+  memo.put_qualifications("A job", ["Python"])
+  stored = last_used(memo, "A job")
+  time.sleep(0.01)
+  assert memo.get_qualifications("A job") == ["Python"]
+  assert last_used(memo, "A job") == stored
+  memo.close()
+  assert last_used(memo, "A job") > stored
+
+def test_skills_are_not_reused_after_the_index_version_changes(tmp_path):
+  memo = GenerationMemo.GenerationMemo(str(tmp_path / "memo.sqlite"))
+  memo.put_skill("alex", "v1", "5+ years of Python.", "Built the billing service in Python.")
+  assert memo.get_skill("alex", "v1", "5+ years of python") == "Built the billing service in Python."
+  assert memo.get_skill("alex", "v2", "5+ years of Python.") == None
+
+  memo.put_skill("alex", "v2", "5+ years of Python.", "Led the Python platform team.")
+  memo.put_skill("sam", "v1", "5+ years of Python.", "Wrote Python tooling.")
+  memo.invalidate_subject("alex", "v2")
+  assert memo.get_skill("alex", "v1", "5+ years of Python.") == None
+  assert memo.get_skill("alex", "v2", "5+ years of Python.") == "Led the Python platform team."
+  # Other subjects keep theirs
+  assert memo.get_skill("sam", "v1", "5+ years of Python.") == "Wrote Python tooling."
+  assert memo.stats()["invalidations"] == 1
@@ -0,0 +1,129 @@
+import os
+
+import IndexManifest
+
+class Chunk:
+  def __init__(self, page_content: str, metadata = None):
+    self.page_content = page_content
+    self.metadata = metadata or {}
+
+# A vectorstore with NumpyVectorStore's interface whose embedding function reads seeded vectors before
+# embedding, like EmbeddingCache.CachedEmbeddings
+class FakeVectorStore:
+  def __init__(self):
+    self.ids = []
+    self.texts = []
+    self.metadatas = []
+    self.matrix = []
+    self.seeded = {}
+    self.embedded = []
+
+  def seed(self, texts, vectors):
+    self.seeded.update(zip(texts, vectors))
+
+  def get_ids(self):
+    return list(self.ids)
+
+  def add_texts(self, texts, metadatas = None, ids = None):
+    for text, metadata, chunk_id in zip(texts, metadatas, ids):
+      if text not in self.seeded:
+        self.embedded.append(text)
+      self.ids.append(chunk_id)
+      self.texts.append(text)
+      self.metadatas.append(metadata)
+      self.matrix.append(self.seeded.get(text, [float(len(text))]))
+
+  def delete(self, ids):
+    keep = [i for i, chunk_id in enumerate(self.ids) if chunk_id not in set(ids)]
+    self.ids = [self.ids[i] for i in keep]
+    self.texts = [self.texts[i] for i in keep]
+    self.metadatas = [self.metadatas[i] for i in keep]
+    self.matrix = [self.matrix[i] for i in keep]
+
+def paragraph_chunks(paths):
+  for path in paths:
+    with open(path) as f:
+      yield path, [Chunk(paragraph) for paragraph in f.read().split("\n\n")]
+
+def write_docs(folder, files):
+  os.makedirs(folder, exist_ok=True)
+  for name, text in files.items():
+    with open(os.path.join(folder, name), "w") as f:
+      f.write(text)
+
+def test_an_unchanged_refresh_embeds_nothing(tmp_path):
+  docs, persist = str(tmp_path / "docs"), str(tmp_path / "persist")
+  write_docs(docs, {"a.txt": "one\n\ntwo", "b.txt": "three"})
+  vectorstore = FakeVectorStore()
+  IndexManifest.sync_index(vectorstore, docs, persist, paragraph_chunks)
+  assert sorted(vectorstore.embedded) == ["one", "three", "two"]
+
+  vectorstore.embedded = []
+  result = IndexManifest.sync_index(vectorstore, docs, persist, paragraph_chunks)
+  assert vectorstore.embedded == []
+  assert result.files_unchanged == 2
+
+def test_a_one_line_edit_embeds_only_the_changed_chunk(tmp_path):
+  docs, persist = str(tmp_path / "docs"), str(tmp_path / "persist")
+  write_docs(docs, {"a.txt": "one\n\ntwo\n\nthree", "b.txt": "four"})
+  vectorstore = FakeVectorStore()
+  IndexManifest.sync_index(vectorstore, docs, persist, paragraph_chunks)
+
+  write_docs(docs, {"a.txt": "one\n\ntwo, edited\n\nthree"})
+  vectorstore.embedded = []
+  result = IndexManifest.sync_index(vectorstore, docs, persist, paragraph_chunks)
+  assert vectorstore.embedded == ["two, edited"]
+  assert (result.chunks_added, result.chunks_deleted, result.chunks_kept) == (1, 1, 3)
+  assert (result.files_changed, result.files_unchanged) == (1, 1)
+  assert "two" not in vectorstore.texts
+  assert sorted(vectorstore.ids) == sorted(IndexManifest.chunk_ids_for("a.txt", ["one", "two, edited", "three"]) + IndexManifest.chunk_ids_for("b.txt", ["four"]))
+
+def test_an_index_without_a_manifest_reuses_its_vectors(tmp_path):
+  docs, persist = str(tmp_path / "docs"), str(tmp_path / "persist")
+  write_docs(docs, {"a.txt": "one\n\ntwo"})
+  vectorstore = FakeVectorStore()
+  # Built without a manifest, with ids that do not match the chunk ids
+  vectorstore.ids, vectorstore.texts, vectorstore.metadatas, vectorstore.matrix = ["x", "y"], ["one", "two"], [{}, {}], [[1.0], [2.0]]
+
+  result = IndexManifest.sync_index(vectorstore, docs, persist, paragraph_chunks, seed_embeddings=vectorstore.seed)
+  assert vectorstore.embedded == []
+  assert result.chunks_added == 2
+  assert sorted(vectorstore.ids) == sorted(IndexManifest.chunk_ids_for("a.txt", ["one", "two"]))
+  assert sorted(vectorstore.matrix) == [[1.0], [2.0]]
+
+def test_new_chunking_settings_rechunk_every_file_and_change_the_version(tmp_path):
+  docs, persist = str(tmp_path / "docs"), str(tmp_path / "persist")
+  write_docs(docs, {"a.txt": "one\n\ntwo"})
+  vectorstore = FakeVectorStore()
+  first = IndexManifest.sync_index(vectorstore, docs, persist, paragraph_chunks, settings={"chunk_size": 1000, "chunk_overlap": 0})
+
+  vectorstore.embedded = []
+  second = IndexManifest.sync_index(vectorstore, docs, persist, paragraph_chunks, settings={"chunk_size": 500, "chunk_overlap": 0})
+  assert second.files_changed == 1
+  # The chunks came out the same, so their vectors are kept
+  assert vectorstore.embedded == []
+  assert second.manifest.version() != first.manifest.version()
+  assert IndexManifest.IndexManifest.load(persist).settings == {"chunk_size": 500, "chunk_overlap": 0}
+
+def test_a_refresh_that_stopped_before_saving_the_manifest_is_reconciled(tmp_path, monkeypatch):
+  docs, persist = str(tmp_path / "docs"), str(tmp_path / "persist")
+  write_docs(docs, {"a.txt": "one\n\ntwo"})
+  vectorstore = FakeVectorStore()
+  IndexManifest.sync_index(vectorstore, docs, persist, paragraph_chunks)
+
+  write_docs(docs, {"a.txt": "one\n\nthree"})
+  def fail(self, persist_folder):
+    raise OSError("disk full")
+  with monkeypatch.context() as patch:
+    patch.setattr(IndexManifest.IndexManifest, "save", fail)
+    try:
+      IndexManifest.sync_index(vectorstore, docs, persist, paragraph_chunks)
+    except OSError:
+      pass
+
+  vectorstore.embedded = []
+  result = IndexManifest.sync_index(vectorstore, docs, persist, paragraph_chunks)
+  # "three" was added by the refresh that stopped, so it is not embedded or added again
+  assert vectorstore.embedded == []
+  assert result.chunks_added == 0
+  assert sorted(vectorstore.ids) == sorted(IndexManifest.chunk_ids_for("a.txt", ["one", "three"]))
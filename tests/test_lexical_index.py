@@ -0,0 +1,32 @@
+import LexicalIndex
+
+CHUNKS = [
+  "Led the migration of our platform to Kubernetes on AWS.",
+  "Hired and mentored a team of eight backend engineers.",
+  "Built the Salesforce integration for the sales team.",
+  "Managed the roadmap with product management.",
+  "Wrote the billing service in Java.",
+]
+
+def index():
+  return LexicalIndex.LexicalIndex.from_chunks([str(i) for i in range(len(CHUNKS))], CHUNKS, [{} for chunk in CHUNKS])
+
+def test_a_keyword_query_ranks_the_chunk_that_contains_it_first():
+  ranked = index().search("Kubernetes")
+  assert ranked[0][0] == 0
+  assert len(ranked) == 1
+
+def test_a_few_specific_terms_found_in_the_best_chunk_are_confident():
+  lexical_index = index()
+  assert lexical_index.is_confident("Salesforce", lexical_index.search("Salesforce"))
+  assert lexical_index.is_confident("Kubernetes AWS", lexical_index.search("Kubernetes AWS"))
+
+def test_a_templated_prompt_is_not_confident():
+  lexical_index = index()
+  prompt = "You are an expert resume writer. Job Qualification: experience with Kubernetes and mentoring engineers"
+  assert not lexical_index.is_confident(prompt, lexical_index.search(prompt))
+
+def test_a_term_missing_from_the_best_chunk_is_not_confident():
+  lexical_index = index()
+  assert not lexical_index.is_confident("Kubernetes Java", lexical_index.search("Kubernetes Java"))
+  assert not lexical_index.is_confident("Python", lexical_index.search("Python"))
@@ -0,0 +1,28 @@
+import os
+
+import numpy as np
+
+import NumpyVectorStore
+
+class LengthEmbeddings:
+  def embed_documents(self, texts):
+    return [[float(len(text)), 1.0] for text in texts]
+
+  def embed_query(self, text):
+    return [float(len(text)), 1.0]
+
+def test_a_reload_sees_the_last_persisted_version(tmp_path):
+  folder = str(tmp_path / "store")
+  store = NumpyVectorStore.NumpyVectorStore(LengthEmbeddings(), persist_directory=folder)
+  store.add_texts(["a", "bb"], ids=["1", "2"])
+  store.persist()
+  store.add_texts(["ccc"], ids=["3"])
+  store.persist()
+  store.add_texts(["dddd"], ids=["4"])
+  store.persist()
+
+  reloaded = NumpyVectorStore.NumpyVectorStore(LengthEmbeddings(), persist_directory=folder)
+  assert reloaded.get_ids() == ["1", "2", "3", "4"]
+  assert len(reloaded.matrix) == 4
+  # The current and the previous versions are kept
+  assert len(os.listdir(os.path.join(folder, NumpyVectorStore.VERSIONS_FOLDER_NAME))) == 2
@@ -0,0 +1,56 @@
+import threading
+
+import Precompute
+import SubjectContext
+
+def job(title: str):
+  subject_context = SubjectContext.SubjectContext("Alex Worden", "AlexWorden")
+  subject_context.job_desc = "We need a " + title
+  subject_context.job_title = title
+  subject_context.company_name = "Acme"
+  return subject_context
+
+def test_a_new_job_description_cancels_the_previous_precompute():
+  manager = Precompute.PrecomputeManager(max_workers=2)
+  started = threading.Event()
+  release = threading.Event()
+  stages_after_cancel = []
+
+  def slow_skills(subject_context, cancel_event):
+    started.set()
+    release.wait(5)
+    # The next stage of a superseded precompute is not run
+    Precompute.raise_if_cancelled(cancel_event)
+    stages_after_cancel.append(subject_context.job_title)
+    return ["skill"]
+
+  first = manager.start(job("Engineer"), {"skills": slow_skills})
+  started.wait(5)
+  second = manager.start(job("Manager"), {"skills": lambda subject_context, cancel_event: ["other skill"]})
+  release.set()
+
+  assert manager.get(job("Engineer")) == None
+  assert manager.get(job("Manager")) is second
+  assert first.result("skills") == None
+  assert stages_after_cancel == []
+  assert second.result("skills") == ["other skill"]
+  assert manager.stats()["superseded"] == 1
+
+def test_a_failed_task_falls_back_to_the_caller():
+  manager = Precompute.PrecomputeManager(max_workers=1)
+  def failing(subject_context, cancel_event):
+    raise ValueError("upstream failed")
+  precompute = manager.start(job("Engineer"), {"skills": failing, "mission": lambda subject_context, cancel_event: "mission"})
+  assert precompute.result("skills") == None
+  assert precompute.result("mission") == "mission"
+  # A task that was not started is also left to the caller
+  assert precompute.result("resume") == None
+  assert precompute.status()["tasks"] == {"skills": "failed", "mission": "done"}
+
+def test_the_precompute_works_on_the_job_it_was_started_for():
+  manager = Precompute.PrecomputeManager(max_workers=1)
+  subject_context = job("Engineer")
+  precompute = manager.start(subject_context, {"title": lambda context, cancel_event: context.job_title})
+  subject_context.job_title = "Manager"
+  assert precompute.result("title") == "Engineer"
+  assert manager.get(subject_context) == None
@@ -0,0 +1,75 @@
+import time
+import threading
+
+from langchain.schema import Document
+
+import LexicalIndex
+import SharedRetrieval
+
+CHUNKS = [
+  "Led the migration of our platform to Kubernetes on AWS.",
+  "Hired and mentored a team of eight backend engineers.",
+  "Built the Salesforce integration for the sales team.",
+  "Managed the roadmap with product management.",
+  "Wrote the billing service in Java.",
+]
+
+# Returns the chunks in a fixed order whatever the query, and counts the searches
+class FixedVectorStore:
+  def __init__(self, order, search_seconds: float = 0.0):
+    self.order = order
+    self.search_seconds = search_seconds
+    self.queries = []
+
+  def similarity_search(self, query: str, k: int = 4):
+    self.queries.append(query)
+    time.sleep(self.search_seconds)
+    return [Document(page_content=CHUNKS[number], metadata={}) for number in self.order[:k]]
+
+def lexical_index():
+  return LexicalIndex.LexicalIndex.from_chunks([str(i) for i in range(len(CHUNKS))], CHUNKS, [{} for chunk in CHUNKS])
+
+def texts(documents):
+  return [document.page_content for document in documents]
+
+def test_a_templated_query_does_not_change_the_vector_top_k():
+  vectorstore = FixedVectorStore([3, 1, 4, 0, 2])
+  retrieval = SharedRetrieval.SubjectRetrieval(vectorstore, max_k=4, lexical_index=lexical_index(), mode="vector")
+  prompt = "You are an expert resume writer. Job Qualification: Salesforce and Java experience"
+  assert texts(retrieval.search(prompt, 4)) == texts(vectorstore.similarity_search(prompt, 4))
+
+def test_hybrid_fuses_the_vector_and_lexical_rankings():
+  vectorstore = FixedVectorStore([3, 1, 4, 0, 2])
+  retrieval = SharedRetrieval.SubjectRetrieval(vectorstore, max_k=2, lexical_index=lexical_index(), mode="hybrid")
+  # The vectorstore ranks the Salesforce chunk last, BM25 ranks it first, so fused it ties the vector's best
+  # and beats the vector's second
+  ranked = texts(retrieval.search("Salesforce", 2))
+  assert set(ranked) == {CHUNKS[3], CHUNKS[2]}
+  assert retrieval.stats()["hybrid_rankings"] == 1
+
+def test_auto_skips_the_vector_search_when_the_lexical_ranking_is_confident():
+  vectorstore = FixedVectorStore([3, 1, 4, 0, 2])
+  retrieval = SharedRetrieval.SubjectRetrieval(vectorstore, max_k=2, lexical_index=lexical_index(), mode="auto")
+  assert texts(retrieval.search("Kubernetes", 1)) == [CHUNKS[0]]
+  assert vectorstore.queries == []
+  assert retrieval.stats()["lexical_rankings"] == 1
+
+def test_consumers_with_different_k_share_one_search():
+  vectorstore = FixedVectorStore([3, 1, 4, 0, 2])
+  retrieval = SharedRetrieval.SubjectRetrieval(vectorstore, max_k=4)
+  assert texts(retrieval.search("roadmap", 2)) == [CHUNKS[3], CHUNKS[1]]
+  assert texts(retrieval.search("roadmap", 4)) == [CHUNKS[3], CHUNKS[1], CHUNKS[4], CHUNKS[0]]
+  assert vectorstore.queries == ["roadmap"]
+  assert (retrieval.stats()["searches"], retrieval.stats()["memo_hits"]) == (1, 1)
+
+def test_concurrent_searches_for_a_query_wait_for_the_first():
+  vectorstore = FixedVectorStore([3, 1, 4, 0, 2], search_seconds=0.05)
+  retrieval = SharedRetrieval.SubjectRetrieval(vectorstore, max_k=4)
+  results = []
+  threads = [threading.Thread(target=lambda: results.append(texts(retrieval.search("roadmap", 3)))) for i in range(5)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert vectorstore.queries == ["roadmap"]
+  assert results == [[CHUNKS[3], CHUNKS[1], CHUNKS[4]]] * 5
@@ -0,0 +1,64 @@
+import time
+import threading
+
+import pytest
+
+import TokenStreaming
+
+# Emits its tokens through the callbacks the way a streaming LLM does, and records whether it ran to the end
+class FakeChain:
+  def __init__(self, tokens, error: Exception = None, token_seconds: float = 0.0):
+    self.tokens = tokens
+    self.error = error
+    self.token_seconds = token_seconds
+    self.emitted = 0
+    self.finished = threading.Event()
+
+  def __call__(self, inputs, callbacks = ()):
+    try:
+      for token in self.tokens:
+        for callback in callbacks:
+          callback.on_llm_new_token(token)
+        self.emitted += 1
+        time.sleep(self.token_seconds)
+      if self.error != None:
+        raise self.error
+    finally:
+      self.finished.set()
+
+# The API servers build a service when they are imported, which keeps its files in the working directory
+@pytest.fixture
+def api_server(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  import APIServer
+  return APIServer
+
+def test_the_tokens_are_yielded_in_order():
+  assert list(TokenStreaming.stream_chain(FakeChain(["Hel", "lo", "!"]), {})) == ["Hel", "lo", "!"]
+
+def test_a_chain_error_is_raised_after_the_tokens_before_it():
+  tokens = []
+  with pytest.raises(ValueError):
+    for token in TokenStreaming.stream_chain(FakeChain(["a", "b"], error=ValueError("upstream failed")), {}):
+      tokens.append(token)
+  assert tokens == ["a", "b"]
+
+def test_the_chain_stops_when_the_consumer_goes_away():
+  chain = FakeChain(["token"] * 1000, token_seconds=0.001)
+  stream = TokenStreaming.stream_chain(chain, {})
+  next(stream)
+  # What the server does when the client disconnects
+  stream.close()
+  assert chain.finished.wait(1)
+  assert chain.emitted < 1000
+
+def test_the_events_are_the_tokens_then_done(api_server):
+  events = list(api_server.sse_events(iter(["Hel", "lo"])))
+  assert events == ['data: {"token": "Hel"}\n\n', 'data: {"token": "lo"}\n\n', "event: done\ndata: {}\n\n"]
+
+def test_a_failed_answer_ends_with_an_error_event(api_server):
+  def tokens():
+    yield "Hel"
+    raise ValueError("upstream failed")
+  events = list(api_server.sse_events(tokens()))
+  assert events == ['data: {"token": "Hel"}\n\n', 'event: error\ndata: {"error": "upstream failed"}\n\n']
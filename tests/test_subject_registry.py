@@ -0,0 +1,83 @@
+import threading
+
+import SubjectRegistry
+
+def resources(subject_id: str, size_bytes: int = 0, version: str = "v1"):
+  return SubjectRegistry.SubjectResources(subject_id, None, None, None, size_bytes=size_bytes, index_version=version)
+
+class Builds:
+  def __init__(self, size_bytes: int = 0):
+    self.size_bytes = size_bytes
+    self.calls = []
+
+  def __call__(self, subject_id: str):
+    self.calls.append(subject_id)
+    return resources(subject_id, self.size_bytes)
+
+def test_the_least_recently_used_subject_is_evicted():
+  evicted = []
+  registry = SubjectRegistry.SubjectRegistry(Builds(), max_subjects=2, on_evict=lambda subject_id, r: evicted.append(subject_id))
+  registry.get("a")
+  registry.get("b")
+  registry.get("a")
+  registry.get("c")
+  assert registry.resident_subject_ids() == ["a", "c"]
+  assert evicted == ["b"]
+  assert registry.stats()["evictions"] == 1
+
+def test_subjects_are_evicted_to_stay_within_the_memory_budget():
+  registry = SubjectRegistry.SubjectRegistry(Builds(size_bytes=400), max_subjects=None, max_memory_bytes=1000)
+  for subject_id in ["a", "b", "c"]:
+    registry.get(subject_id)
+  assert registry.resident_subject_ids() == ["b", "c"]
+  assert registry.resident_bytes() == 800
+
+def test_on_evict_is_called_outside_of_the_lock():
+  registry = None
+  def on_evict(subject_id, evicted_resources):
+    # Would deadlock if the registry still held its lock
+    assert not registry.is_resident(subject_id)
+  registry = SubjectRegistry.SubjectRegistry(Builds(), max_subjects=1, on_evict=on_evict)
+  registry.get("a")
+  registry.get("b")
+  registry.invalidate("b")
+  assert registry.stats()["evictions"] == 1
+
+def test_concurrent_first_requests_share_one_build():
+  release = threading.Event()
+  builds = Builds()
+  def slow_build(subject_id):
+    release.wait(5)
+    return builds(subject_id)
+  registry = SubjectRegistry.SubjectRegistry(slow_build)
+  results = []
+  threads = [threading.Thread(target=lambda: results.append(registry.get("a"))) for i in range(4)]
+  for thread in threads:
+    thread.start()
+  release.set()
+  for thread in threads:
+    thread.join(5)
+  assert builds.calls == ["a"]
+  assert len(results) == 4 and all(result is results[0] for result in results)
+
+def test_a_build_in_flight_does_not_replace_newer_resources_that_were_put():
+  started = threading.Event()
+  release = threading.Event()
+  def slow_build(subject_id):
+    started.set()
+    release.wait(5)
+    return resources(subject_id, version="old")
+  registry = SubjectRegistry.SubjectRegistry(slow_build)
+  results = []
+  thread = threading.Thread(target=lambda: results.append(registry.get("a")))
+  thread.start()
+  started.wait(5)
+  registry.put("a", resources("a", version="new"))
+  release.set()
+  thread.join(5)
+  assert results[0].index_version == "new"
+  assert registry.get("a").index_version == "new"
+
+def test_size_estimate_counts_vectors_text_and_postings():
+  texts = ["x" * 100, "y" * 100]
+  assert SubjectRegistry.estimate_size_bytes(texts, 4) == 2 * 4 * 4 + 2 * (100 + SubjectRegistry.STRING_OVERHEAD_BYTES)